@@ -0,0 +1,68 @@
+"""
+Бенчмарк подготовки запроса по фильтру данных о сне (без обращения к базе).
+
+Сравниваются построение запроса заново на каждый вызов, как до
+SleepDataFilter (значения встроены в условия, SQLAlchemy компилирует
+каждую новую структуру), и запрос, собранный один раз на форму фильтра,
+с параметрами. В обоих случаях замеряется построение и компиляция
+SQL диалектом PostgreSQL с кэшем компиляции SQLAlchemy.
+
+    python -m benchmarks.filter_statement_bench --repeat 5000
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+
+from models.sleep_data import SleepData
+from repositories.sleep_data_filter import Range, SleepDataFilter
+from repositories.sleep_data_repository import _list_statement
+
+
+def random_filter() -> SleepDataFilter:
+    return SleepDataFilter(person_id=random.randint(1, 1000),
+                           stress_level=Range(random.randint(0, 5), None),
+                           total_sleep_hours=Range(random.uniform(4, 6), random.uniform(8, 10)))
+
+
+def rebuilt(spec: SleepDataFilter):
+    """Прежний способ: новый запрос со значениями на каждый вызов"""
+    conditions = dict((attr, value) for attr, (_, value) in spec.conditions)
+    query = select(SleepData).where(SleepData.person_id == conditions["person_id"])
+    query = query.where(SleepData.stress_level >= conditions["stress_level"].low)
+    hours = conditions["total_sleep_hours"]
+    query = query.where(SleepData.total_sleep_hours.between(hours.low, hours.high))
+    return query.order_by(SleepData.id), {}
+
+
+def cached(spec: SleepDataFilter):
+    return _list_statement(spec.shape(), False), spec.params()
+
+
+def measure(prepare, specs, cache) -> float:
+    dialect = postgresql.psycopg2.dialect()
+    started = time.perf_counter()
+    for spec in specs:
+        query, params = prepare(spec)
+        # так же, как при выполнении: ключ кэша и компиляция при промахе
+        key = query._generate_cache_key().key
+        if key not in cache:
+            cache[key] = query.compile(dialect=dialect)
+    return (time.perf_counter() - started) / len(specs) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подготовка запроса по фильтру: пересборка и кэш по форме")
+    parser.add_argument("--repeat", type=int, default=5000, help="число фильтров одной формы")
+    args = parser.parse_args()
+
+    specs = [random_filter() for _ in range(args.repeat)]
+    print(f"{'variant':<10}{'us/query':>10}")
+    for name, prepare in (("rebuilt", rebuilt), ("cached", cached)):
+        print(f"{name:<10}{measure(prepare, specs, {}):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
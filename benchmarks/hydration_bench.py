@@ -0,0 +1,102 @@
+"""
+Бенчмарк стоимости материализации строк sleep_data.
+
+Одна и та же выборка читается разными способами: объекты SQLModel
+(как в get_sleep_data_with_parameters), SleepDataRow из выборки столбцов
+и кортежи курсора psycopg2 без SQLAlchemy. Для каждого способа
+замеряются время и память, удерживаемая результатом (tracemalloc),
+в пересчете на 100 тыс. строк.
+
+    python -m benchmarks.hydration_bench --rows 100000
+"""
+import argparse
+import gc
+import statistics
+import time
+import tracemalloc
+
+PER_ROWS = 100_000
+
+
+def load_entities(session_scope, limit):
+    from sqlmodel import select
+    from models.sleep_data import SleepData
+
+    with session_scope() as session:
+        return session.exec(select(SleepData).order_by(SleepData.id).limit(limit)).all()
+
+
+def load_rows(session_scope, limit):
+    from sqlmodel import select
+    from models.sleep_data import SleepData
+    from repositories.sleep_data_repository import ROW_COLUMNS, SleepDataRow
+
+    with session_scope() as session:
+        query = select(*ROW_COLUMNS).order_by(SleepData.id).limit(limit)
+        return [SleepDataRow._make(row) for row in session.execute(query)]
+
+
+def load_raw_tuples(session_scope, limit):
+    from repositories.sleep_data_repository import ROW_COLUMNS
+
+    columns = ", ".join(column.name for column in (c.property.columns[0] for c in ROW_COLUMNS))
+    with session_scope() as session:
+        cursor = session.connection().connection.cursor()
+        try:
+            cursor.execute(f"SELECT {columns} FROM sleep.sleep_data ORDER BY id LIMIT %s", (limit,))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+VARIANTS = {
+    "orm_entities": load_entities,
+    "sleep_data_row": load_rows,
+    "raw_tuples": load_raw_tuples,
+}
+
+
+def measure(loader, session_scope, limit, repeat):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = loader(session_scope, limit)
+        timings.append(time.perf_counter() - started)
+        count = len(result)
+        del result
+
+    # Память отдельным прогоном: tracemalloc замедляет выполнение
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = loader(session_scope, limit)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+
+    scale = PER_ROWS / count if count else 0
+    return {
+        "rows": count,
+        "ms_per_100k": statistics.median(timings) * 1000 * scale,
+        "mb_per_100k": retained / 1e6 * scale,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время и память материализации строк sleep_data")
+    parser.add_argument("--rows", type=int, default=PER_ROWS, help="размер выборки")
+    parser.add_argument("--repeat", type=int, default=3, help="число замеров времени")
+    args = parser.parse_args()
+
+    from config.database_config import session_scope
+
+    print(f"{'variant':<16}{'rows':>10}{'ms/100k':>12}{'MB/100k':>12}")
+    for name, loader in VARIANTS.items():
+        r = measure(loader, session_scope, args.rows, args.repeat)
+        print(f"{name:<16}{r['rows']:>10}{r['ms_per_100k']:>12.0f}{r['mb_per_100k']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
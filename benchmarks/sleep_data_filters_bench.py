@@ -0,0 +1,115 @@
+"""
+Бенчмарк фильтров sleep_data: план и время выполнения запросов.
+
+Запросы строятся тем же кодом, что и в SleepDataRepository, и выполняются
+через EXPLAIN (ANALYZE, BUFFERS). Типичный сценарий - замер до и после
+миграции с индексами:
+
+    python -m benchmarks.sleep_data_filters_bench --save before.json
+    alembic upgrade head
+    python -m benchmarks.sleep_data_filters_bench --save after.json
+    python -m benchmarks.sleep_data_filters_bench --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import statistics
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+
+from models.sleep_data import SleepData
+from repositories.sleep_data_filter import SleepDataFilter
+from repositories.sleep_data_repository import SleepDataRepository
+
+# Сценарий: имя -> параметры get_sleep_data_with_parameters
+SCENARIOS = {
+    "respondent": dict(respondent_id=42),
+    "total_sleep_range": dict(sl_total_time_start=9.5, sl_total_time_end=10),
+    "caffeine_min": dict(coffee_start=390),
+    "quality_and_stress": dict(sl_quality_start=9, stress_end=2),
+    "work_hours_max": dict(work_time_end=4.2),
+    "screen_and_exercise": dict(screen_time_end=5, exercise_start=115),
+}
+
+
+def build_sql(filters) -> str:
+    spec = SleepDataFilter.from_legacy(**filters)
+    query = SleepDataRepository.apply_filter(select(SleepData), spec).order_by(SleepData.id)
+    query = query.params(spec.params())
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def collect_index_names(plan, names):
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        collect_index_names(child, names)
+    return names
+
+
+def run(engine, repeat: int) -> dict:
+    results = {}
+    with engine.connect() as conn:
+        for name, filters in SCENARIOS.items():
+            sql = build_sql(filters)
+            timings = []
+            plan = None
+            for _ in range(repeat):
+                explain = conn.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)).scalar()
+                plan = explain[0]
+                timings.append(plan["Planning Time"] + plan["Execution Time"])
+            results[name] = {
+                "median_ms": round(statistics.median(timings), 3),
+                "rows": plan["Plan"]["Actual Rows"],
+                "node": plan["Plan"]["Node Type"],
+                "indexes": sorted(collect_index_names(plan["Plan"], set())),
+            }
+    return results
+
+
+def print_results(results: dict):
+    print(f"{'scenario':<22}{'ms':>10}{'rows':>10}  plan")
+    for name, r in results.items():
+        indexes = ", ".join(r["indexes"]) or "-"
+        print(f"{name:<22}{r['median_ms']:>10.2f}{r['rows']:>10}  {r['node']} [{indexes}]")
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"{'scenario':<22}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in before:
+        if name not in after:
+            continue
+        b, a = before[name]["median_ms"], after[name]["median_ms"]
+        speedup = b / a if a else float("inf")
+        print(f"{name:<22}{b:>12.2f}{a:>12.2f}{speedup:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN ANALYZE для фильтров sleep_data")
+    parser.add_argument("--repeat", type=int, default=5, help="число прогонов каждого запроса")
+    parser.add_argument("--save", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="сравнить два JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    load_dotenv()
+    engine = create_engine(os.environ["DATABASE_URL"])
+    results = run(engine, args.repeat)
+    print_results(results)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Бенчмарк холодного старта приложения.
+
+Замеряет время импорта модулей (python -X importtime) и время до показа
+главного окна, а также проверяет, какие тяжелые библиотеки импортируются
+до создания окна. Каждый замер - отдельный процесс интерпретатора.
+
+    python -m benchmarks.startup_bench --offscreen --save startup.json
+    python -m benchmarks.startup_bench --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Библиотеки, которые не должны импортироваться в основном потоке до показа окна
+HEAVY_MODULES = ["sqlalchemy", "sqlmodel", "psycopg2", "openpyxl", "pydantic"]
+
+FIRST_WINDOW_SNIPPET = """
+import json, os, sys, time
+t0 = time.perf_counter()
+from PySide6.QtWidgets import QApplication
+from gui.main_window import MainWindow
+# фоновое подключение стартует в конструкторе окна, поэтому проверяем до него
+loaded = [m for m in {heavy!r} if m in sys.modules]
+app = QApplication([])
+window = MainWindow()
+window.show()
+app.processEvents()
+elapsed = (time.perf_counter() - t0) * 1000
+print(json.dumps({{"first_window_ms": elapsed, "imported_before_window": loaded}}))
+sys.stdout.flush()
+# не ждем фонового подключения к базе
+os._exit(0)
+"""
+
+
+def run_python(args, env):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr: str):
+    """
+    Время импорта main и собственное время импорта по пакетам верхнего уровня, мс
+    """
+    total = 0.0
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # формат: "import time: self [us] | cumulative | imported package"
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if name == "main":
+            total = int(cumulative_us) / 1000
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1000
+    return total, packages
+
+
+def measure(repeat: int, offscreen: bool) -> dict:
+    env = dict(os.environ)
+    if offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+
+    import_totals, window_times = [], []
+    packages = {}
+    loaded = []
+    for _ in range(repeat):
+        result = run_python(["-X", "importtime", "-c", "import main"], env)
+        total, top_level = parse_importtime(result.stderr)
+        import_totals.append(total)
+        for name, ms in top_level.items():
+            packages.setdefault(name, []).append(ms)
+
+        result = run_python(["-c", FIRST_WINDOW_SNIPPET.format(heavy=HEAVY_MODULES)], env)
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        window_times.append(data["first_window_ms"])
+        loaded = data["imported_before_window"]
+
+    slowest = sorted(((statistics.median(v), k) for k, v in packages.items()), reverse=True)[:15]
+    return {
+        "import_main_ms": round(statistics.median(import_totals), 1),
+        "first_window_ms": round(statistics.median(window_times), 1),
+        "imported_before_window": loaded,
+        "slowest_packages": {name: round(ms, 1) for ms, name in slowest},
+    }
+
+
+def print_results(results: dict):
+    print(f"import main:        {results['import_main_ms']:.1f} ms")
+    print(f"first window shown: {results['first_window_ms']:.1f} ms")
+    loaded = ", ".join(results["imported_before_window"]) or "-"
+    print(f"heavy modules imported before window: {loaded}")
+    print("slowest packages (own import time):")
+    for name, ms in results["slowest_packages"].items():
+        print(f"  {ms:>8.1f} ms  {name}")
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    for key in ("import_main_ms", "first_window_ms"):
+        print(f"{key:<24}{old[key]:>10.1f}{new[key]:>10.1f}{new[key] - old[key]:>+10.1f}")
+    print(f"{'imported before window':<24} {old['imported_before_window']} -> {new['imported_before_window']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время холодного старта приложения")
+    parser.add_argument("--repeat", type=int, default=5, help="число запусков")
+    parser.add_argument("--offscreen", action="store_true", help="без дисплея (QT_QPA_PLATFORM=offscreen)")
+    parser.add_argument("--save", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="сравнить два JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = measure(args.repeat, args.offscreen)
+    print_results(results)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
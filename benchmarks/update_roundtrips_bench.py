@@ -0,0 +1,109 @@
+"""
+Бенчмарк обновления записи о сне: число обращений к базе и время на одно обновление.
+
+Сравниваются прежний путь (чтение записи, проверка респондента, повторное
+чтение и UPDATE в отдельных сессиях) и текущий SleepDataService.update_sleep_data
+(один UPDATE ... RETURNING). Обращения считаются по событиям SQLAlchemy:
+каждая команда, BEGIN, COMMIT и ROLLBACK. Проверка соединений пула
+(pool_pre_ping) отключается, чтобы не искажать счет.
+
+    python -m benchmarks.update_roundtrips_bench --repeat 200
+"""
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import event
+
+from config.settings import DbConfig
+
+
+class RoundTripCounter:
+    """Счетчик обращений к серверу через события движка"""
+
+    def __init__(self, engine):
+        self.count = 0
+        for name in ("before_cursor_execute", "begin", "commit", "rollback"):
+            event.listen(engine, name, self._increment)
+
+    def _increment(self, *args, **kwargs):
+        self.count += 1
+
+
+def legacy_update(session_scope, data_id, values):
+    """Прежняя последовательность запросов update_sleep_data"""
+    from models.respondent import Respondent
+    from models.sleep_data import SleepData
+
+    with session_scope() as session:
+        data = session.get(SleepData, data_id)
+    with session_scope() as session:
+        session.get(Respondent, values["person_id"])
+    for key, value in values.items():
+        setattr(data, key, value)
+    with session_scope() as session:
+        existing = session.get(SleepData, data.id)
+        for key, value in data.dict(exclude_unset=True).items():
+            setattr(existing, key, value)
+        session.commit()
+
+
+def measure(name, update, ids, counter):
+    timings = []
+    trips = []
+    for data_id in ids:
+        values = {"person_id": random.randint(1, 1000), "mood_score": random.randint(1, 10)}
+        before = counter.count
+        started = time.perf_counter()
+        update(data_id, values)
+        timings.append((time.perf_counter() - started) * 1000)
+        trips.append(counter.count - before)
+    return {
+        "name": name,
+        "round_trips": statistics.median(trips),
+        "median_ms": statistics.median(timings),
+        "p95_ms": sorted(timings)[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обращения к базе на одно обновление записи о сне")
+    parser.add_argument("--repeat", type=int, default=200, help="число обновлений в каждом варианте")
+    args = parser.parse_args()
+
+    DbConfig.pool_pre_ping = False
+    from config.database_config import get_engine, session_scope
+    from repositories.respondent_repository import RespondentRepository
+    from repositories.sleep_data_repository import SleepDataRepository
+    from services.respondent_service import RespondentService
+    from services.sleep_data_service import SleepDataService
+
+    counter = RoundTripCounter(get_engine())
+    service = SleepDataService(SleepDataRepository(session_scope), RespondentService(RespondentRepository(session_scope)))
+
+    with session_scope() as session:
+        max_id = session.connection().exec_driver_sql("SELECT max(id) FROM sleep.sleep_data").scalar()
+    ids = [random.randint(1, max_id) for _ in range(args.repeat)]
+
+    def current_update(data_id, values):
+        try:
+            service.update_sleep_data(data_id, values["person_id"], None, None, None, None, None, None,
+                                      None, None, None, values["mood_score"], None)
+        except Exception:
+            # удаленные id: обращения все равно учитываются
+            pass
+
+    def legacy(data_id, values):
+        try:
+            legacy_update(session_scope, data_id, values)
+        except Exception:
+            pass
+
+    print(f"{'variant':<10}{'round trips':>12}{'median ms':>12}{'p95 ms':>10}")
+    for result in (measure("legacy", legacy, ids, counter), measure("current", current_update, ids, counter)):
+        print(f"{result['name']:<10}{result['round_trips']:>12}{result['median_ms']:>12.2f}{result['p95_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
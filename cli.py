@@ -0,0 +1,139 @@
+"""
+Служебные команды без графического интерфейса.
+
+    python cli.py import-sleep-data wave3.csv
+    python cli.py dedupe-sleep-data --apply
+    python cli.py sleep-stats total_sleep_hours --group-by country
+    python cli.py sleep-rollups week --from 2024-01-01
+    python cli.py rebuild-rollups
+    python cli.py ensure-partitions --months-ahead 3
+"""
+import argparse
+import logging
+import sys
+from datetime import date
+
+from config.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def build_sleep_data_service():
+    from config.database_config import session_scope
+    from repositories.respondent_repository import RespondentRepository
+    from repositories.sleep_data_repository import SleepDataRepository
+    from services.respondent_service import RespondentService
+    from services.sleep_data_service import SleepDataService
+
+    respondent_service = RespondentService(RespondentRepository(session_scope))
+    return SleepDataService(SleepDataRepository(session_scope), respondent_service)
+
+
+def import_sleep_data(args):
+    service = build_sleep_data_service()
+    result = service.import_sleep_data(
+        args.file, progress_callback=lambda rows: logger.info(f"Передано строк: {rows}"))
+    print(f"Загружено {result.rows} строк за {result.seconds:.1f} с ({result.rows_per_second:.0f} строк/с)")
+
+
+def dedupe_sleep_data(args):
+    service = build_sleep_data_service()
+    duplicates = service.count_duplicate_nights()
+    if not args.apply:
+        print(f"Лишних записей с повторяющейся ночью: {duplicates}. Для удаления добавьте --apply")
+        return
+    print(f"Удалено записей: {service.remove_duplicate_nights()}")
+
+
+def ensure_partitions(args):
+    created = build_sleep_data_service().ensure_partitions(args.months_ahead)
+    print(f"Создано секций: {len(created)}" + (f" ({', '.join(created)})" if created else ""))
+
+
+def build_sleep_analytics_service():
+    from config.database_config import session_scope
+    from repositories.sleep_analytics_repository import SleepAnalyticsRepository
+    from services.sleep_analytics_service import SleepAnalyticsService
+
+    return SleepAnalyticsService(SleepAnalyticsRepository(session_scope))
+
+
+def sleep_stats(args):
+    service = build_sleep_analytics_service()
+    from repositories.sleep_data_filter import Range, SleepDataFilter
+
+    spec = SleepDataFilter(person_id=args.respondent_id or None, sleep_date=Range(args.date_from, args.date_to))
+    print(f"{'группа':<16}{'n':>10}{'среднее':>10}{'ст.откл':>10}{'мин':>8}{'макс':>8}  перцентили 25/50/75")
+    for s in service.summarize(args.metric, group_by=args.group_by, spec=spec):
+        mean = f"{s.mean:.2f}" if s.mean is not None else "-"
+        stddev = f"{s.stddev:.2f}" if s.stddev is not None else "-"
+        percentiles = " / ".join(f"{p:.2f}" for p in s.percentiles)
+        print(f"{service.group_label(args.group_by, s.group):<16}{s.count:>10}{mean:>10}{stddev:>10}"
+              f"{s.min!s:>8}{s.max!s:>8}  {percentiles}")
+
+
+def sleep_rollups(args):
+    service = build_sleep_analytics_service()
+    metrics = ["total_sleep_hours", "sleep_quality", "mood_score", "stress_level"]
+    rows = service.get_rollups(args.period, start=args.date_from, end=args.date_to,
+                               respondent_id=args.respondent_id,
+                               per_respondent=bool(args.respondent_id), metrics=metrics)
+    print(f"{'период':<12}{'ночей':>8}" + "".join(f"{metric:>20}" for metric in metrics))
+    for row in rows:
+        print(f"{row.period_start!s:<12}{row.nights:>8}"
+              + "".join(f"{row.averages[metric]:>20.2f}" for metric in metrics))
+
+
+def rebuild_rollups(args):
+    rows = build_sleep_analytics_service().rebuild_rollups()
+    print(f"Сводная таблица пересчитана: {rows} строк")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Служебные команды Sleepecho")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import-sleep-data", help="массовая загрузка данных о сне (CSV, JSONL, xlsx)")
+    import_parser.add_argument("file", help="путь к файлу")
+    import_parser.set_defaults(handler=import_sleep_data)
+
+    dedupe_parser = commands.add_parser("dedupe-sleep-data",
+                                        help="повторы ночи респондента: подсчет, с --apply удаление")
+    dedupe_parser.add_argument("--apply", action="store_true", help="удалить, оставив последнюю запись")
+    dedupe_parser.set_defaults(handler=dedupe_sleep_data)
+
+    stats_parser = commands.add_parser("sleep-stats", help="сводная статистика показателя сна")
+    stats_parser.add_argument("metric", help="столбец sleep_data, например total_sleep_hours")
+    stats_parser.add_argument("--group-by", help="respondent, country, gender, age_band, day, week, month, quarter, year")
+    stats_parser.add_argument("--respondent-id", type=int, default=0, help="только один респондент")
+    stats_parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="начало, ГГГГ-ММ-ДД")
+    stats_parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="конец, ГГГГ-ММ-ДД")
+    stats_parser.set_defaults(handler=sleep_stats)
+
+    rollups_parser = commands.add_parser("sleep-rollups", help="средние показатели по дням, неделям или месяцам")
+    rollups_parser.add_argument("period", choices=["day", "week", "month"])
+    rollups_parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="начало, ГГГГ-ММ-ДД")
+    rollups_parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="конец, ГГГГ-ММ-ДД")
+    rollups_parser.add_argument("--respondent-id", type=int, default=0, help="только один респондент")
+    rollups_parser.set_defaults(handler=sleep_rollups)
+
+    rebuild_parser = commands.add_parser("rebuild-rollups", help="пересчитать сводную таблицу sleep_data_rollup")
+    rebuild_parser.set_defaults(handler=rebuild_rollups)
+
+    partitions_parser = commands.add_parser("ensure-partitions",
+                                            help="создать месячные секции sleep_data на будущие месяцы")
+    partitions_parser.add_argument("--months-ahead", type=int, default=3, help="на сколько месяцев вперед")
+    partitions_parser.set_defaults(handler=ensure_partitions)
+
+    args = parser.parse_args(argv)
+    setup_logging()
+    try:
+        args.handler(args)
+    except Exception as e:
+        logger.error(f"Ошибка команды {args.command}: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,19 @@
 # Данные для подключения к PostgreSQL
 import os
+import threading
+from contextlib import contextmanager
 
+from sqlalchemy import event, text
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel, create_engine, Session
 from dotenv import load_dotenv
 import logging
+
+from config.query_cancel import current_cancel_handle
+from config.settings import DbConfig
+from config.sql_metrics import instrument_engine
+from exception.exceptions import QueryCancelledException
 logger = logging.getLogger(__name__)
 # Загружаем переменные окружения из файла .env
 load_dotenv()
@@ -16,7 +25,25 @@ def init_engine():
         raise ValueError("DATABASE_URL не загружен из переменных окружения")
 
     try:
-      engine=create_engine(database_url, echo=True)
+      connect_args = {}
+      if DbConfig.statement_timeout_ms > 0:
+          connect_args["options"] = f"-c statement_timeout={DbConfig.statement_timeout_ms}"
+      engine=create_engine(
+          database_url,
+          echo=DbConfig.echo,
+          connect_args=connect_args,
+          pool_size=DbConfig.pool_size,
+          max_overflow=DbConfig.max_overflow,
+          pool_timeout=DbConfig.pool_timeout,
+          pool_recycle=DbConfig.pool_recycle,
+          pool_pre_ping=DbConfig.pool_pre_ping,
+      )
+      # метрики подключаются первыми, чтобы учесть и отмененные запросы
+      instrument_engine(engine)
+      event.listen(engine, "before_cursor_execute", _attach_cancel_handle)
+      event.listen(engine, "after_cursor_execute", _detach_cancel_handle)
+      event.listen(engine, "handle_error", _detach_on_error)
+      event.listen(engine, "checkin", _detach_on_checkin)
       #Пробное подключение
       with engine.connect():
           logger.info("Успешное подключение к базе данных")
@@ -28,15 +55,81 @@ def init_engine():
         logger.error(f"Непредвиденная ошибка: {e}")
         raise
 
-engine = init_engine()
+# Объекты остаются доступными после commit и закрытия сессии
+SessionFactory = sessionmaker(class_=Session, expire_on_commit=False)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Движок создается при первом обращении, а не при импорте модуля,
+    чтобы окно приложения появлялось до подключения к базе.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = init_engine()
+                SessionFactory.configure(bind=_engine)
+    return _engine
+
+
+@contextmanager
+def session_scope():
+    """
+    Единица работы: короткая сессия на одну операцию.
+
+    Сессия берет соединение из пула, фиксирует транзакцию при успешном
+    выходе из блока, откатывает при ошибке и всегда закрывается, поэтому
+    карта идентичности не накапливает объекты между операциями. Каждый
+    поток получает собственную сессию.
+    """
+    get_engine()
+    session = SessionFactory()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
 def get_session():
   try:
-    with Session(engine) as session:
+    get_engine()
+    with SessionFactory() as session:
         yield session
   except SQLAlchemyError as e:
       logger.error(f"Ошибка создания сессии: {e}")
       raise
 
 
+def _attach_cancel_handle(conn, cursor, statement, parameters, context, executemany):
+    handle = current_cancel_handle()
+    if handle is not None:
+        if handle.cancelled:
+            raise QueryCancelledException("Запрос отменен")
+        handle.attach(cursor.connection)
+
+
+def _detach_cancel_handle(conn, cursor, statement, parameters, context, executemany):
+    handle = current_cancel_handle()
+    # Строки серверного курсора (stream_results) читаются уже после выполнения:
+    # соединение остается доступным для отмены до возврата в пул
+    if handle is not None and not (context is not None and context.execution_options.get("stream_results")):
+        handle.detach(cursor.connection)
+
+
+def _detach_on_error(context):
+    handle = current_cancel_handle()
+    if handle is not None:
+        handle.detach()
+
 
+def _detach_on_checkin(dbapi_connection, connection_record):
+    handle = current_cancel_handle()
+    if handle is not None:
+        handle.detach(dbapi_connection)
@@ -0,0 +1,68 @@
+# Отмена SQL-запросов, выполняемых в фоновых потоках
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCancelHandle:
+    """
+    Позволяет прервать SQL-запрос, выполняемый в другом потоке.
+
+    Хранит соединение psycopg2 только пока на нем выполняется запрос задачи:
+    после возврата в пул соединение может выполнять чужой запрос, и отмена
+    не должна его задеть
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def attach(self, connection):
+        """Запрос задачи выполняется на соединении connection (DBAPI)"""
+        with self._lock:
+            self._connection = connection
+
+    def detach(self, connection=None):
+        """Соединение больше не выполняет запрос задачи (None - любое)"""
+        with self._lock:
+            if connection is None or connection is self._connection:
+                self._connection = None
+
+    def cancel(self):
+        """
+        Отменить выполняемый запрос. Сигнал отмены psycopg2 уходит по
+        отдельному короткому подключению мимо пула, поэтому вызов не ждет
+        свободного соединения и не блокирует поток интерфейса.
+        Блокировка удерживается до отправки сигнала: detach ждет его, и
+        соединение не вернется в пул к чужому запросу раньше
+        """
+        self.cancelled = True
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._connection.cancel()
+                logger.info("Отправлен сигнал отмены запроса")
+            except Exception as e:
+                logger.error(f"Ошибка отмены запроса: {e}")
+
+
+_cancel_context = threading.local()
+
+
+@contextmanager
+def cancellable(handle: QueryCancelHandle):
+    """Запросы текущего потока внутри блока можно отменить через handle"""
+    _cancel_context.handle = handle
+    try:
+        yield handle
+    finally:
+        _cancel_context.handle = None
+
+
+def current_cancel_handle():
+    """Handle отмены для запросов текущего потока или None"""
+    return getattr(_cancel_context, "handle", None)
@@ -10,4 +10,37 @@ class DbConfig:
     database = os.getenv("DB_NAME")
     user = os.getenv("DB_USER")
     password = os.getenv("DB_PASSWORD")
-    db_type = "postgresql"
\ No newline at end of file
+    db_type = "postgresql"
+    # Ограничение времени выполнения одного запроса, мс (0 - без ограничения)
+    statement_timeout_ms = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+    # Пул соединений
+    pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+    max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    pool_timeout = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # ожидание свободного соединения, с
+    pool_recycle = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # пересоздание соединений старше N секунд
+    pool_pre_ping = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    # Вывод всех SQL-запросов в лог (только для отладки)
+    echo = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+    # Порог медленного запроса, мс (0 - не журналировать), и вывод его плана
+    # (EXPLAIN в фоновом потоке на отдельном подключении; по умолчанию выключен)
+    slow_query_ms = int(os.getenv("DB_SLOW_QUERY_MS", "500"))
+    slow_query_explain = os.getenv("DB_SLOW_QUERY_EXPLAIN", "false").lower() in ("1", "true", "yes")
+
+
+class CacheConfig:
+    # Кэш респондентов в RespondentService: число записей (0 - без кэша) и время жизни, с
+    respondent_cache_size = int(os.getenv("RESPONDENT_CACHE_SIZE", "1024"))
+    respondent_cache_ttl = float(os.getenv("RESPONDENT_CACHE_TTL", "300"))
+    # Сброс записей по уведомлениям PostgreSQL (LISTEN) об изменениях из других клиентов
+    respondent_cache_listen = os.getenv("RESPONDENT_CACHE_LISTEN", "false").lower() in ("1", "true", "yes")
+    # Кэш результатов поиска данных о сне: объем, МБ (0 - без кэша), и время, пока результат считается свежим, с
+    sleep_data_cache_mb = int(os.getenv("SLEEP_DATA_CACHE_MB", "64"))
+    sleep_data_cache_ttl = float(os.getenv("SLEEP_DATA_CACHE_TTL", "60"))
+    # Устаревший результат показывается сразу, а запрос к базе идет в фоне
+    sleep_data_cache_serve_stale = os.getenv("SLEEP_DATA_CACHE_SERVE_STALE", "true").lower() in ("1", "true", "yes")
+
+
+class SearchConfig:
+    # Поиск данных о сне: результат больше стольких записей загружается страницами
+    # по мере прокрутки, а не целиком (0 - всегда целиком, без оценки размера)
+    sleep_data_full_load_limit = int(os.getenv("SLEEP_DATA_FULL_LOAD_LIMIT", "50000"))
@@ -0,0 +1,206 @@
+# Метрики SQL-запросов: задержки, число строк, журнал медленных запросов
+import bisect
+import contextvars
+import functools
+import logging
+import queue
+import threading
+import time
+
+from config.settings import DbConfig
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("sql.slow")
+
+# Верхние границы корзин гистограммы задержек, мс (последняя - бесконечность)
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+UNLABELED = "<без метки>"
+
+# Медленные запросы, ждущие построения плана; при переполнении план не строится
+EXPLAIN_QUEUE_SIZE = 100
+# Ожидание подключения для EXPLAIN, с
+EXPLAIN_CONNECT_TIMEOUT = 5
+
+_current_operation = contextvars.ContextVar("sql_operation", default=UNLABELED)
+
+
+class OperationStats:
+    """Накопленная статистика запросов одной операции (метода репозитория)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms: float, rows: int, slow: bool):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if rows > 0:
+            self.rows += rows
+        if slow:
+            self.slow += 1
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, q: float) -> float:
+        """Оценка перцентиля по гистограмме (верхняя граница корзины)"""
+        if not self.count:
+            return 0.0
+        threshold = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= threshold:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "slow": self.slow,
+            "histogram": dict(zip([f"<={b}" for b in LATENCY_BUCKETS_MS] + ["inf"], self.buckets)),
+        }
+
+
+class SqlMetrics:
+    """Потокобезопасный реестр статистики по операциям"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, operation: str, elapsed_ms: float, rows: int, slow: bool):
+        with self._lock:
+            stats = self._stats.get(operation)
+            if stats is None:
+                stats = self._stats[operation] = OperationStats()
+            stats.add(elapsed_ms, rows, slow)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {operation: stats.as_dict() for operation, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def log_summary(self):
+        for operation, s in sorted(self.snapshot().items(), key=lambda item: -item[1]["total_ms"]):
+            logger.info(f"{operation}: запросов {s['count']}, всего {s['total_ms']:.1f} мс, "
+                        f"p50 {s['p50_ms']} мс, p95 {s['p95_ms']} мс, макс {s['max_ms']:.1f} мс, "
+                        f"строк {s['rows']}, медленных {s['slow']}")
+
+
+sql_metrics = SqlMetrics()
+
+
+def instrumented(func):
+    """
+    Декоратор метода репозитория: запросы внутри метода учитываются
+    под меткой Класс.метод
+    """
+    label = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_operation.set(label)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_operation.reset(token)
+
+    return wrapper
+
+
+def instrument_engine(engine):
+    """Подключить замеры к движку через события before/after_cursor_execute"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+        slow = DbConfig.slow_query_ms > 0 and elapsed_ms >= DbConfig.slow_query_ms
+        sql_metrics.record(_current_operation.get(), elapsed_ms, cursor.rowcount, slow)
+        if slow:
+            _log_slow_query(engine, statement, parameters, elapsed_ms)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        # после ошибки after_cursor_execute не вызывается
+        start_times = context.connection.info.get("query_start_time") if context.connection else None
+        if start_times:
+            start_times.pop()
+
+
+def _log_slow_query(engine, statement, parameters, elapsed_ms):
+    message = (f"Медленный запрос ({elapsed_ms:.1f} мс) в {_current_operation.get()}:\n"
+               f"{statement}\nПараметры: {parameters}")
+    if DbConfig.slow_query_explain and statement.lstrip().upper().startswith("SELECT"):
+        if _explain_worker.submit(engine, message, statement, parameters):
+            return  # запись с планом сделает фоновый поток
+        message += "\nПлан: не построен, очередь EXPLAIN переполнена"
+    slow_query_logger.warning(message)
+
+
+class _ExplainWorker:
+    """
+    Фоновый поток, который строит планы медленных запросов и пишет их в журнал.
+    Поток запроса не ждет ни плана, ни соединения: EXPLAIN выполняется
+    на отдельном подключении вне пула
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, engine, message, statement, parameters) -> bool:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="slow-query-explain", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((engine, message, statement, parameters))
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        while True:
+            engine, message, statement, parameters = self._queue.get()
+            slow_query_logger.warning(f"{message}\nПлан:\n{_explain(engine, statement, parameters)}")
+
+
+_explain_worker = _ExplainWorker()
+
+
+def _explain(engine, statement, parameters) -> str:
+    # Соединение DBAPI мимо пула: не занимает соединение рабочих потоков,
+    # не вызывает события пула и SQLAlchemy и не учитывается в метриках
+    try:
+        dialect = engine.dialect
+        cargs, cparams = dialect.create_connect_args(engine.url)
+        raw = dialect.connect(*cargs, **{**cparams, "connect_timeout": EXPLAIN_CONNECT_TIMEOUT})
+        try:
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute("EXPLAIN " + statement, parameters)
+                return "\n".join(row[0] for row in cursor.fetchall())
+        finally:
+            raw.close()
+    except Exception as e:
+        return f"не удалось получить план: {e}"
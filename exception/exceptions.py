@@ -1,3 +1,19 @@
 class RespondentNotFoundException(Exception):
     """Респондент не найден"""
-    pass
\ No newline at end of file
+    pass
+
+class QueryCancelledException(Exception):
+    """Запрос к базе данных отменен"""
+    pass
+
+class ImportFormatException(Exception):
+    """Некорректный формат файла для импорта"""
+    pass
+
+class StaleDataException(Exception):
+    """Запись изменена другим пользователем после чтения"""
+    pass
+
+class DuplicateSleepDataException(Exception):
+    """Данные респондента за эту ночь уже есть"""
+    pass
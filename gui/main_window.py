@@ -1,13 +1,13 @@
-from PySide6.QtWidgets import QMainWindow
+from PySide6.QtWidgets import QMainWindow, QProgressBar, QLabel, QMessageBox
+from config.sql_metrics import sql_metrics
 from gui.ui_sleepecho_gui import Ui_MainWindow
-from gui.widgets.data_tab import SleepDataTab
-from repositories.respondent_repository import RespondentRepository
-from repositories.sleep_data_repository import SleepDataRepository
-from services.respondent_service import RespondentService
+from gui.workers import QueryRunner
 
-from gui.widgets.respondent_tab import RespondentsTab
-from config.database_config import get_session
-from services.sleep_data_service import SleepDataService
+
+def connect_database():
+    """Выполняется в фоновом потоке: импорт SQLAlchemy и пробное подключение"""
+    from config.database_config import get_engine
+    return get_engine()
 
 
 class MainWindow(QMainWindow):
@@ -17,12 +17,84 @@ class MainWindow(QMainWindow):
         self.ui.setupUi(self)
         self.setWindowTitle("Sleepecho")
 
-        session = next(get_session())
+        # запросы выполняются в фоне, каждая операция открывает свою сессию из пула
+        self.query_runner = QueryRunner(parent=self)
+        self.setup_status_bar()
+
+        self.respondents_tab = None
+        self.data_tab = None
+        self.respondent_service = None
+        self.respondent_listener = None
+        self.data_service = None
+        self.ui.tabWidget.setCurrentIndex(0)
+
+        # окно показывается сразу, подключение к базе идет в фоне
+        self.ui.tabWidget.setEnabled(False)
+        self.start_connection()
+
+    def start_connection(self):
+        self.set_connection_status("Подключение к базе...", "orange")
+        self.query_runner.submit(connect_database,
+                                 on_result=self.on_database_connected,
+                                 on_error=self.on_database_error)
+
+    def setup_status_bar(self):
+        self.connection_status = QLabel()
+        self.statusBar().addPermanentWidget(self.connection_status)
+        self.busy_indicator = QProgressBar()
+        self.busy_indicator.setRange(0, 0)  # бесконечная анимация
+        self.busy_indicator.setMaximumWidth(150)
+        self.busy_indicator.setVisible(False)
+        self.statusBar().addPermanentWidget(self.busy_indicator)
+        self.query_runner.busy_changed.connect(self.busy_indicator.setVisible)
+        self.query_runner.status_message.connect(self.statusBar().showMessage)
 
-        respondent_service = RespondentService(RespondentRepository(session))
-        data_service = SleepDataService(SleepDataRepository(session), respondent_service)
+    def set_connection_status(self, text, color):
+        self.connection_status.setText(f"● {text}")
+        self.connection_status.setStyleSheet(f"color: {color};")
+
+    def on_database_connected(self, engine):
+        # сервисы и вкладки импортируются после подключения, SQLAlchemy к этому моменту уже загружен
+        from config.database_config import session_scope
+        from config.settings import CacheConfig
+        from gui.widgets.data_tab import SleepDataTab
+        from gui.widgets.respondent_tab import RespondentsTab
+        from repositories.respondent_repository import RespondentRepository
+        from repositories.sleep_data_repository import SleepDataRepository
+        from services.respondent_cache import RespondentChangeListener
+        from services.respondent_service import RespondentService
+        from services.sleep_data_service import SleepDataService
+
+        respondent_service = RespondentService(RespondentRepository(session_scope))
+        self.respondent_service = respondent_service
+        if CacheConfig.respondent_cache_listen:
+            # изменения респондентов из других клиентов сбрасывают кэш
+            self.respondent_listener = RespondentChangeListener(engine, respondent_service.cache)
+            self.respondent_listener.start()
+        data_service = SleepDataService(SleepDataRepository(session_scope), respondent_service)
+        self.data_service = data_service
         # подключаем таб вкладки
-        self.respondents_tab = RespondentsTab(self.ui, respondent_service)
-        self.data_tab=SleepDataTab(self.ui,data_service)
+        self.respondents_tab = RespondentsTab(self.ui, respondent_service, self.query_runner)
+        self.data_tab=SleepDataTab(self.ui,data_service, self.query_runner)
+
+        self.ui.tabWidget.setEnabled(True)
+        self.set_connection_status("База данных подключена", "green")
+
+    def on_database_error(self, ex):
+        self.set_connection_status("Нет подключения к базе", "red")
+        reply = QMessageBox.critical(self, "Ошибка", f"Не удалось подключиться к базе данных:\n{str(ex)}",
+                                     QMessageBox.Retry | QMessageBox.Close, QMessageBox.Retry)
+        if reply == QMessageBox.Retry:
+            # движок не сохраняется после неудачи, get_engine подключается заново
+            self.start_connection()
 
-        self.ui.tabWidget.setCurrentIndex(0)
\ No newline at end of file
+    def closeEvent(self, event):
+        self.query_runner.shutdown()
+        if self.respondent_listener is not None:
+            self.respondent_listener.stop()
+        sql_metrics.log_summary()
+        if self.respondent_service is not None:
+            self.respondent_service.cache.log_summary()
+        if self.data_service is not None:
+            self.data_service.result_cache.log_summary()
+        super().closeEvent(event)
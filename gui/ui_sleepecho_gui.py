@@ -18,7 +18,7 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
 from PySide6.QtWidgets import (QApplication, QComboBox, QFrame, QGridLayout,
     QHBoxLayout, QHeaderView, QLabel, QLayout,
     QLineEdit, QMainWindow, QPushButton, QSizePolicy,
-    QTabWidget, QTableWidget, QTableWidgetItem, QWidget)
+    QTabWidget, QTableView, QWidget)
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
@@ -118,7 +118,7 @@ class Ui_MainWindow(object):
 "    padding: 4px;\n"
 "    border-radius: 3px;\n"
 "}\n"
-"QTableWidget {\n"
+"QTableView {\n"
 "    color: white;  /* \u0446\u0432\u0435\u0442 \u0442\u0435\u043a\u0441\u0442\u0430 \u0432\u043e \u0432\u0441\u0435\u0445 \u044f\u0447\u0435\u0439\u043a\u0430\u0445 */\n"
 "    background-color:rgb(62, 62, 62);  /* \u0444\u043e\u043d \u0442\u0430\u0431\u043b\u0438\u0446\u044b (\u043e\u043f"
                         "\u0446\u0438\u043e\u043d\u0430\u043b\u044c\u043d\u043e) */\n"
@@ -179,7 +179,7 @@ class Ui_MainWindow(object):
 
         self.gridLayout_5 = QGridLayout()
         self.gridLayout_5.setObjectName(u"gridLayout_5")
-        self.resp_tablewidget = QTableWidget(self.Resp_widget)
+        self.resp_tablewidget = QTableView(self.Resp_widget)
         self.resp_tablewidget.setObjectName(u"resp_tablewidget")
 
         self.gridLayout_5.addWidget(self.resp_tablewidget, 0, 0, 1, 1)
@@ -566,7 +566,7 @@ class Ui_MainWindow(object):
 "    padding: 4px;\n"
 "    border-radius: 3px;\n"
 "}\n"
-"QTableWidget {\n"
+"QTableView {\n"
 "    color: white;  /* \u0446\u0432\u0435\u0442 \u0442\u0435\u043a\u0441\u0442\u0430 \u0432\u043e \u0432\u0441\u0435\u0445 \u044f\u0447\u0435\u0439\u043a\u0430\u0445 */\n"
 "    background-color:rgb(62, 62, 62);  /* \u0444\u043e\u043d \u0442\u0430\u0431\u043b\u0438\u0446\u044b (\u043e\u043f"
                         "\u0446\u0438\u043e\u043d\u0430\u043b\u044c\u043d\u043e) */\n"
@@ -1152,7 +1152,7 @@ class Ui_MainWindow(object):
 
         self.horizontalLayout = QHBoxLayout()
         self.horizontalLayout.setObjectName(u"horizontalLayout")
-        self.data_table_widget = QTableWidget(self.Data_widget)
+        self.data_table_widget = QTableView(self.Data_widget)
         self.data_table_widget.setObjectName(u"data_table_widget")
 
         self.horizontalLayout.addWidget(self.data_table_widget)
@@ -1,43 +1,226 @@
 import logging
+from datetime import date
 
-from PySide6.QtCore import Qt, QTimer
-from PySide6.QtWidgets import QWidget, QHeaderView, QTableWidget, QTableWidgetItem, QMessageBox, QFileDialog
+from PySide6.QtCore import Qt, QTimer, QDate
+from PySide6.QtWidgets import (QWidget, QHeaderView, QAbstractItemView, QMessageBox, QFileDialog, QProgressDialog,
+                               QMenu, QInputDialog, QDateEdit, QHBoxLayout, QLabel, QToolButton, QPushButton,
+                               QGridLayout)
 from sqlalchemy.exc import NoResultFound
 
-from openpyxl import Workbook
+from config.settings import SearchConfig
+from exception.exceptions import DuplicateSleepDataException, RespondentNotFoundException, StaleDataException
 
-logger = logging.getLogger(__name__)
-
-def create_int_item(value):
-    item = QTableWidgetItem()
-    item.setData(Qt.DisplayRole, value)
-    return item
+from gui.widgets.table_model import ColumnTableModel, TableColumn, INT, FLOAT, DATE
+from repositories.sleep_data_filter import LEGACY_RANGE_PARAMS, Range, SleepDataFilter
+from repositories.sleep_data_repository import SleepDataRow, count_in_range
 
-def parse_int_or_null(text):
-        return 0 if not text.strip() else int(text)
+logger = logging.getLogger(__name__)
 
-def parse_float_or_null(text):
-    return 0.0 if not text.strip() else float(text)
+# Пауза после изменения фильтров перед пересчетом гистограмм полей, мс
+FACET_DELAY_MS = 400
+
+# Размер страницы при сортировке на сервере (щелчок по заголовку столбца)
+SORT_PAGE_SIZE = 500
+
+# Сколько записей после массовой операции правится в таблице по одной;
+# при большем числе результат поиска загружается заново. Вставка или
+# перенос строки сдвигает остальные строки таблицы, поэтому заново
+# загружается и результат, у которого число записей, умноженное на число
+# строк в таблице, больше PATCH_WORK_LIMIT
+PATCH_LIMIT = 1000
+PATCH_WORK_LIMIT = 5_000_000
+
+SLEEP_DATA_COLUMNS = [
+    TableColumn("ID", "id", INT),
+    TableColumn("Date", "sleep_date", DATE),
+    TableColumn("RespId", "person_id", INT),
+    TableColumn("sleepStartTime", "sleep_start_time", FLOAT),
+    TableColumn("SleepEndTime", "sleep_end_time", FLOAT),
+    TableColumn("TotalSleepHours", "total_sleep_hours", FLOAT),
+    TableColumn("SleepQuality", "sleep_quality", INT),
+    TableColumn("ExerciseMinutes", "exercise_minutes", INT),
+    TableColumn("CaffeineIntakeMg", "caffeine_intake_mg", INT),
+    TableColumn("ScreenTime", "screen_time_before_bed", INT),
+    TableColumn("WorkHours", "work_hours", FLOAT),
+    TableColumn("ProductivityScore", "productivity_score", INT),
+    TableColumn("MoodScore", "mood_score", INT),
+    TableColumn("StressLevel", "stress_level", INT),
+]
+
+# Минимальная дата поля периода; означает, что граница не задана
+NO_DATE = QDate(1900, 1, 1)
+
+# Парсеры значения для массового изменения по типу столбца
+VALUE_PARSERS = {
+    INT: int,
+    FLOAT: float,
+    DATE: date.fromisoformat,
+}
+
+def parse_optional(text, parse):
+    """Значение поля ввода или None, если поле пустое"""
+    return parse(text) if text.strip() else None
+
+def parse_range(low_text, high_text, parse):
+    return Range(parse_optional(low_text, parse), parse_optional(high_text, parse))
+
+def format_bucket(bucket, integer):
+    """Границы корзины гистограммы для подсказки: 3, 0-12 или 4.0-4.8"""
+    if integer:
+        last = int(bucket.high) - 1
+        return f"{int(bucket.low)}" if last == bucket.low else f"{int(bucket.low)}-{last}"
+    return f"{bucket.low:.1f}-{bucket.high:.1f}"
 
 class SleepDataTab(QWidget):
-    def __init__(self, ui, sleep_data_service):
+    def __init__(self, ui, sleep_data_service, query_runner):
         super().__init__()
         self.ui = ui
         self.sleep_data_service = sleep_data_service
+        self.query_runner = query_runner
+        # фильтры последнего поиска; по ним выполняется экспорт
+        self.last_filters = None
+        self.export_progress = None
+        # (id, version) записи, загруженной в поля редактирования
+        self.edited_version = None
+        # Номер текущей загрузки: порции прежней, уже отмененной, не показываются
+        self.load_id = 0
+        # (атрибут, по убыванию) после щелчка по заголовку; None - порядок по id
+        self.sort_key = None
+        # токен следующей страницы отсортированного результата
+        self.page_token = None
+        # страницы включены из-за размера результата, а не щелчком по заголовку
+        self.auto_paged = False
+        # оценка размера результата при загрузке страницами
+        self.estimated_rows = None
         self.setup_table()
+        self.setup_date_filter()
+        self.setup_load_controls()
+        self.setup_facets()
         self.connect_signals()
 
     def setup_table(self):
-        self.ui.data_table_widget.setColumnCount(14)
-        self.ui.data_table_widget.setHorizontalHeaderLabels([
-            "ID", "Date", "RespId", "sleepStartTime", "SleepEndTime", "TotalSleepHours", "SleepQuality", "ExerciseMinutes", "CaffeineIntakeMg", "ScreenTime",
-            "WorkHours", "ProductivityScore", "MoodScore", "StressLevel"
-        ])
-
-        self.ui.data_table_widget.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table_model = ColumnTableModel(SLEEP_DATA_COLUMNS, parent=self)
+        self.ui.data_table_widget.setModel(self.table_model)
+        # Сортирует сервер: щелчок по заголовку запрашивает первую страницу в новом порядке
+        self.ui.data_table_widget.setSortingEnabled(False)
+        self.table_model.more_requested.connect(self.request_next_page)
+        self.ui.data_table_widget.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.ui.data_table_widget.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.ui.data_table_widget.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.ui.data_table_widget.customContextMenuRequested.connect(self.show_table_menu)
+        self.ui.data_table_widget.setEditTriggers(QAbstractItemView.NoEditTriggers)
         header = self.ui.data_table_widget.horizontalHeader()
         header.setSectionResizeMode(QHeaderView.Interactive)  # Позволяет изменять ширину
         header.setSectionsMovable(True)  # Разрешает перетаскивание столбцов
+        header.setSectionsClickable(True)
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(-1, Qt.AscendingOrder)
+        header.sortIndicatorChanged.connect(self.on_sort_changed)
+
+    def setup_date_filter(self):
+        """Поля периода дат в пустой рамке рядом с кнопкой поиска"""
+        layout = QHBoxLayout(self.ui.frame)
+        layout.setContentsMargins(4, 2, 4, 2)
+        self.date_from = self.create_date_edit()
+        self.date_to = self.create_date_edit()
+        clear_btn = QToolButton(self.ui.frame)
+        clear_btn.setText("✕")
+        clear_btn.setToolTip("Сбросить период")
+        clear_btn.clicked.connect(self.clear_date_filter)
+        layout.addWidget(QLabel("Дата с", self.ui.frame))
+        layout.addWidget(self.date_from)
+        layout.addWidget(QLabel("по", self.ui.frame))
+        layout.addWidget(self.date_to)
+        layout.addWidget(clear_btn)
+
+    def setup_load_controls(self):
+        """Счетчик загруженных записей и кнопка остановки загрузки"""
+        layout = self.ui.frame.layout()
+        layout.addStretch()
+        self.load_counter = QLabel(self.ui.frame)
+        self.stop_load_btn = QPushButton("Остановить", self.ui.frame)
+        self.stop_load_btn.setToolTip("Прервать загрузку, оставив уже полученные записи")
+        self.stop_load_btn.clicked.connect(self.stop_loading)
+        self.stop_load_btn.hide()
+        layout.addWidget(self.load_counter)
+        layout.addWidget(self.stop_load_btn)
+
+    def setup_facets(self):
+        """
+        Счетчики строк справа от полей числовых фильтров: сколько записей
+        даст диапазон поля при остальных фильтрах; во всплывающей подсказке -
+        гистограмма значений. Считаются после первого поиска и затем после
+        паузы в изменении фильтров: до поиска полная таблица не агрегируется
+        """
+        self.facet_labels = {}
+        self.facet_filters = None
+        self.facet_timer = QTimer(self)
+        self.facet_timer.setSingleShot(True)
+        self.facet_timer.setInterval(FACET_DELAY_MS)
+        self.facet_timer.timeout.connect(self.request_facets)
+        for attr, start_name, end_name in LEGACY_RANGE_PARAMS:
+            start, end = getattr(self.ui, start_name), getattr(self.ui, end_name)
+            grid = next(layout for layout in start.parentWidget().findChildren(QGridLayout)
+                        if layout.indexOf(end) >= 0)
+            row, column, _, _ = grid.getItemPosition(grid.indexOf(end))
+            label = QLabel(start.parentWidget())
+            grid.addWidget(label, row, column + 1)
+            self.facet_labels[attr] = label
+            start.textChanged.connect(self.schedule_facets)
+            end.textChanged.connect(self.schedule_facets)
+        self.ui.search_id_resp.textChanged.connect(self.schedule_facets)
+        self.date_from.dateChanged.connect(self.schedule_facets)
+        self.date_to.dateChanged.connect(self.schedule_facets)
+
+    def schedule_facets(self, *_):
+        """Пересчитать гистограммы после паузы, если поиск уже выполнялся"""
+        if self.last_filters is not None:
+            self.facet_timer.start()
+
+    def request_facets(self):
+        try:
+            filters = self.read_filters()
+        except ValueError:
+            return  # поле еще не дописано; счетчики обновятся после исправления
+        self.facet_filters = filters
+        self.query_runner.submit(self.sleep_data_service.sleep_data_facets, filters,
+                                 on_result=lambda facets: self.show_facets(filters, facets),
+                                 on_error=lambda ex: logger.warning(f"Не удалось посчитать гистограммы фильтров: {ex}"),
+                                 key="sleep_data_facets")
+
+    def show_facets(self, filters, facets):
+        if filters != self.facet_filters:
+            return  # фильтры уже изменились, придет новый результат
+        conditions = dict(filters.conditions)
+        kinds = {c.attr: c.kind for c in SLEEP_DATA_COLUMNS}
+        for attr, label in self.facet_labels.items():
+            buckets = facets.get(attr, [])
+            integer = kinds[attr] == INT
+            _, bounds = conditions.get(attr, (None, Range()))
+            count, exact = count_in_range(buckets, bounds.low, bounds.high, integer)
+            label.setText(f"{count}" if exact else f"≈{count}")
+            lines = [f"{format_bucket(bucket, integer)}: {bucket.count}" for bucket in buckets]
+            label.setToolTip("Записей при остальных фильтрах:\n" + "\n".join(lines))
+
+    def create_date_edit(self):
+        date_edit = QDateEdit(self.ui.frame)
+        date_edit.setDisplayFormat("yyyy-MM-dd")
+        date_edit.setCalendarPopup(True)
+        date_edit.setMinimumDate(NO_DATE)
+        # минимальная дата показывается как пустое поле
+        date_edit.setSpecialValueText(" ")
+        date_edit.setDate(NO_DATE)
+        return date_edit
+
+    def clear_date_filter(self):
+        self.date_from.setDate(NO_DATE)
+        self.date_to.setDate(NO_DATE)
+
+    @staticmethod
+    def date_value(date_edit):
+        """Дата поля или None, если граница не задана"""
+        value = date_edit.date()
+        return None if value == NO_DATE else value.toPython()
 
     def connect_signals(self):
         self.ui.all_data_btn.clicked.connect(self.load_all)
@@ -48,137 +231,349 @@ class SleepDataTab(QWidget):
         self.ui.create_data.clicked.connect(self.create_data)
 
     def load_all(self):
-
         try:
-            # Парсинг параметров из полей ввода
-            respondent_id = parse_int_or_null(self.ui.search_id_resp.text())
-            sl_start_time_start = parse_float_or_null(self.ui.sl_start_time_start.text())
-            sl_start_time_end = parse_float_or_null(self.ui.sl_start_time_end.text())
-            sl_end_time_start = parse_float_or_null(self.ui.sl_end_time_start.text())
-            sl_end_time_end = parse_float_or_null(self.ui.sl_end_time_end.text())
-            sl_total_time_start = parse_float_or_null(self.ui.sl_total_time_start.text())
-            sl_total_time_end = parse_float_or_null(self.ui.sl_total_time_end.text())
-            sl_quality_start = parse_int_or_null(self.ui.sl_quality_start.text())
-            sl_quality_end = parse_int_or_null(self.ui.sl_quality_end.text())
-            exercise_start = parse_int_or_null(self.ui.exercise_start.text())
-            exercise_end = parse_int_or_null(self.ui.exercise_end.text())
-            coffee_start = parse_int_or_null(self.ui.coffee_start.text())
-            coffee_end = parse_int_or_null(self.ui.coffee_end.text())
-            screen_time_start = parse_int_or_null(self.ui.screen_time_start.text())
-            screen_time_end = parse_int_or_null(self.ui.screen_time_end.text())
-            work_time_start = parse_float_or_null(self.ui.work_time_start.text())
-            work_time_end = parse_float_or_null(self.ui.work_time_end.text())
-            productivity_start = parse_int_or_null(self.ui.productivity_start.text())
-            productivity_end = parse_int_or_null(self.ui.productivity_end.text())
-            mood_start = parse_int_or_null(self.ui.mood_start.text())
-            mood_end = parse_int_or_null(self.ui.mood_end.text())
-            stress_start = parse_int_or_null(self.ui.stress_start.text())
-            stress_end = parse_int_or_null(self.ui.stress_end.text())
-
-
-
-            # Получение данных через сервис
-            sleep_data = self.sleep_data_service.get_sleep_data_with_parameters(
-                respondent_id,
-                sl_start_time_start,
-                sl_start_time_end,
-                sl_end_time_start,
-                sl_end_time_end,
-                sl_total_time_start,
-                sl_total_time_end,
-                sl_quality_start,
-                sl_quality_end,
-                exercise_start,
-                exercise_end,
-                coffee_start,
-                coffee_end,
-                screen_time_start,
-                screen_time_end,
-                work_time_start,
-                work_time_end,
-                productivity_start,
-                productivity_end,
-                mood_start,
-                mood_end,
-                stress_start,
-                stress_end
-            )
-
-            if not sleep_data:
-                QMessageBox.information(self, "Информация", "Данные с такими параметрами не найдены")
-                self.ui.data_table_widget.setRowCount(0)
-            else:
-                QMessageBox.information(self, "Успех", f"Загружено {len(sleep_data)} записей.")
-                logger.info(f"Успешная загрузка данных. Загружено {len(sleep_data)} записей")
-                self.load_table(sleep_data)
-
+            filters = self.read_filters()
         except Exception as ex:
             error_msg = f"Непредвиденная ошибка: {str(ex)}"
             QMessageBox.critical(self, "Ошибка", error_msg)
             logger.error(error_msg)
+            return
 
+        if filters != self.facet_filters:
+            self.facet_timer.start()
+        if self.sort_key is not None and not self.auto_paged:
+            self.start_paged(filters)
+            return
+        self.set_sort_key(None)
+        self.last_filters = filters
+        cached = self.sleep_data_service.cached_sleep_data(filters)
+        if cached is not None:
+            self.load_table(cached.rows)
+            if cached.fresh:
+                # загрузка предыдущего поиска больше не нужна
+                self.query_runner.cancel("sleep_data_search")
+                return
+            # устаревший результат уже показан, свежий подменит его без сообщений
+            self.query_runner.show_status("Показан сохраненный результат, идет обновление...")
+            self.load_id += 1
+            load_id = self.load_id
+            self.query_runner.submit(self.sleep_data_service.load_sleep_data_rows, filters,
+                                     on_result=lambda rows: self.on_sleep_data_revalidated(load_id, cached.rows, rows),
+                                     on_error=lambda ex: self.on_load_error(ex, load_id),
+                                     key="sleep_data_search")
+            return
+        limit = SearchConfig.sleep_data_full_load_limit
+        if limit > 0:
+            self.check_result_size(filters, limit)
+        else:
+            self.start_loading(filters)
+
+    def check_result_size(self, filters, limit):
+        """
+        Оценка размера результата до поиска: больше limit записей
+        загружается страницами по мере прокрутки, а не целиком
+        """
+        self.load_id += 1
+        load_id = self.load_id
+        self.load_counter.setText("Оценка числа записей...")
+        self.query_runner.submit(self.sleep_data_service.estimate_sleep_data_count, filters, limit,
+                                 on_result=lambda estimate: self.on_size_estimated(load_id, filters, limit, estimate),
+                                 on_error=lambda ex: self.on_load_error(ex, load_id),
+                                 key="sleep_data_search")
+
+    def on_size_estimated(self, load_id, filters, limit, estimate):
+        if load_id != self.load_id:
+            return
+        if estimate.rows <= limit:
+            self.start_loading(filters)
+            return
+        logger.info(f"Результат поиска около {estimate.rows} записей (порог {limit}): загрузка страницами")
+        self.set_sort_key(("id", False), auto=True)
+        self.estimated_rows = estimate.rows
+        self.start_paged(filters)
+
+    def set_sort_key(self, sort_key, auto=False):
+        """Порядок загрузки и значок сортировки в заголовке, без нового поиска"""
+        self.sort_key, self.auto_paged = sort_key, auto
+        self.estimated_rows = None
+        header = self.ui.data_table_widget.horizontalHeader()
+        header.blockSignals(True)
+        if sort_key is None:
+            header.setSortIndicator(-1, Qt.AscendingOrder)
+        else:
+            attr, descending = sort_key
+            column = next(i for i, c in enumerate(SLEEP_DATA_COLUMNS) if c.attr == attr)
+            header.setSortIndicator(column, Qt.DescendingOrder if descending else Qt.AscendingOrder)
+        header.blockSignals(False)
+
+    def start_loading(self, filters):
+        """
+        Постепенная загрузка: первая порция строк появляется сразу, остальные
+        дочитываются в фоне. Новый поиск отменяет предыдущий
+        """
+        self.load_id += 1
+        load_id = self.load_id
+        self.table_model.start_stream()
+        self.load_counter.setText("Загрузка...")
+        self.stop_load_btn.show()
+        self.query_runner.submit(self.sleep_data_service.stream_sleep_data_rows, filters,
+                                 on_result=lambda count: self.on_sleep_data_loaded(load_id, count),
+                                 on_error=lambda ex: self.on_load_error(ex, load_id),
+                                 on_progress=lambda rows: self.on_rows_received(load_id, rows),
+                                 key="sleep_data_search")
+
+    def on_sort_changed(self, section, order):
+        self.sort_key = (SLEEP_DATA_COLUMNS[section].attr, order == Qt.DescendingOrder)
+        self.auto_paged = False
+        if self.last_filters is not None:
+            self.start_paged(self.last_filters.with_order())
+
+    def start_paged(self, filters):
+        """
+        Загрузка в порядке sort_key: ORDER BY и keyset-пагинация на сервере,
+        следующая страница запрашивается при прокрутке до конца таблицы
+        """
+        attr, descending = self.sort_key
+        self.last_filters = filters.with_order(f"-{attr}" if descending else attr)
+        self.load_id += 1
+        self.page_token = None
+        self.table_model.start_stream()
+        column = next(i for i, c in enumerate(SLEEP_DATA_COLUMNS) if c.attr == attr)
+        self.table_model.set_server_order(column, Qt.DescendingOrder if descending else Qt.AscendingOrder)
+        self.load_counter.setText("Загрузка...")
+        self.stop_load_btn.hide()
+        self.request_next_page()
+
+    def request_next_page(self):
+        if self.sort_key is None or not self.table_model.streaming:
+            return
+        load_id = self.load_id
+        attr, descending = self.sort_key
+        self.query_runner.submit(self.sleep_data_service.get_sleep_data_page,
+                                 page_size=SORT_PAGE_SIZE, order_by=attr, descending=descending,
+                                 after=self.page_token, as_rows=True, spec=self.last_filters,
+                                 on_result=lambda page: self.on_page_loaded(load_id, page),
+                                 on_error=lambda ex: self.on_load_error(ex, load_id),
+                                 key="sleep_data_search")
+
+    def on_page_loaded(self, load_id, page):
+        if load_id != self.load_id:
+            return
+        self.page_token = page.next_token
+        self.table_model.set_has_more(page.next_token is not None)
+        self.table_model.append_stream(page.items)
+        count = self.table_model.rowCount()
+        if page.next_token is None:
+            self.finish_loading(f"Найдено записей: {count}" if count else "Данные с такими параметрами не найдены")
+        else:
+            total = f" из ≈{self.estimated_rows}" if self.estimated_rows else ""
+            self.load_counter.setText(f"Показано {count}{total}, следующие - при прокрутке")
+
+    def on_rows_received(self, load_id, rows):
+        if load_id != self.load_id or not self.table_model.streaming:
+            return
+        self.table_model.append_stream(rows)
+        self.load_counter.setText(f"Загружено {self.table_model.rowCount()}...")
+
+    def stop_loading(self):
+        """Прервать загрузку; полученные строки остаются в таблице"""
+        self.query_runner.cancel("sleep_data_search")
+        self.finish_loading(f"Загрузка остановлена: {self.table_model.rowCount()} записей")
+        logger.info(f"Загрузка данных остановлена на {self.table_model.rowCount()} записях")
+
+    def finish_loading(self, text):
+        self.load_id += 1
+        if self.table_model.streaming:
+            self.table_model.finish_stream()
+        self.stop_load_btn.hide()
+        self.load_counter.setText(text)
+
+    def read_filters(self):
+        """
+        Фильтр из полей ввода: пустое поле - граница не задана, поэтому
+        можно искать и нулевые значения
+        """
+        ui = self.ui
+        return SleepDataFilter(
+            person_id=parse_optional(ui.search_id_resp.text(), int),
+            sleep_date=Range(self.date_value(self.date_from), self.date_value(self.date_to)),
+            sleep_start_time=parse_range(ui.sl_start_time_start.text(), ui.sl_start_time_end.text(), float),
+            sleep_end_time=parse_range(ui.sl_end_time_start.text(), ui.sl_end_time_end.text(), float),
+            total_sleep_hours=parse_range(ui.sl_total_time_start.text(), ui.sl_total_time_end.text(), float),
+            sleep_quality=parse_range(ui.sl_quality_start.text(), ui.sl_quality_end.text(), int),
+            exercise_minutes=parse_range(ui.exercise_start.text(), ui.exercise_end.text(), int),
+            caffeine_intake_mg=parse_range(ui.coffee_start.text(), ui.coffee_end.text(), int),
+            screen_time_before_bed=parse_range(ui.screen_time_start.text(), ui.screen_time_end.text(), int),
+            work_hours=parse_range(ui.work_time_start.text(), ui.work_time_end.text(), float),
+            productivity_score=parse_range(ui.productivity_start.text(), ui.productivity_end.text(), int),
+            mood_score=parse_range(ui.mood_start.text(), ui.mood_end.text(), int),
+            stress_level=parse_range(ui.stress_start.text(), ui.stress_end.text(), int),
+        )
 
+    def on_sleep_data_loaded(self, load_id, count):
+        if load_id != self.load_id:
+            return
+        self.finish_loading(f"Найдено записей: {count}" if count else "Данные с такими параметрами не найдены")
+        logger.info(f"Успешная загрузка данных. Загружено {count} записей")
 
-    def load_table(self, sleep_data):
-        self.ui.data_table_widget.setRowCount(0)
-        self.ui.data_table_widget.setRowCount(len(sleep_data))
-        for row, data in enumerate(sleep_data):
-            # ID
-            self.ui.data_table_widget.setItem(row, 0, create_int_item(data.id))
-
-            date_str = data.sleep_date.strftime("%Y-%m-%d") if data.sleep_date else ""
-            self.ui.data_table_widget.setItem(row, 1, QTableWidgetItem(date_str))
-
-            self.ui.data_table_widget.setItem(row, 2, create_int_item(data.person_id))
-
-            # Время начала сна (форматируем float)
-            self.ui.data_table_widget.setItem(row, 3, QTableWidgetItem(f"{data.sleep_start_time:.2f}"))
-
-            self.ui.data_table_widget.setItem(row, 4, QTableWidgetItem(f"{data.sleep_end_time:.2f}"))
-
-            self.ui.data_table_widget.setItem(row, 5, QTableWidgetItem(f"{data.total_sleep_hours:.2f}"))
-
-            self.ui.data_table_widget.setItem(row, 6, create_int_item(data.sleep_quality))
-
-            self.ui.data_table_widget.setItem(row, 7, create_int_item(data.exercise_minutes))
-
-            self.ui.data_table_widget.setItem(row, 8, create_int_item(data.caffeine_intake_mg))
-
-            self.ui.data_table_widget.setItem(row, 9, create_int_item(data.screen_time_before_bed))
-
-            self.ui.data_table_widget.setItem(row, 10, QTableWidgetItem(f"{data.work_hours:.2f}"))
-
-            self.ui.data_table_widget.setItem(row, 11, create_int_item(data.productivity_score))
-
-            self.ui.data_table_widget.setItem(row, 12, create_int_item(data.mood_score))
+    def on_sleep_data_revalidated(self, load_id, shown, sleep_data):
+        if load_id != self.load_id:
+            return
+        self.query_runner.show_status("")
+        if sleep_data != shown:
+            self.load_table(sleep_data)
 
-            self.ui.data_table_widget.setItem(row, 13, create_int_item(data.stress_level))
+    def on_load_error(self, ex, load_id=None):
+        if load_id is not None:
+            if load_id != self.load_id:
+                return
+            self.finish_loading("Ошибка загрузки")
+        self.query_runner.show_status("")
+        error_msg = f"Непредвиденная ошибка: {str(ex)}"
+        QMessageBox.critical(self, "Ошибка", error_msg)
+        logger.error(error_msg)
 
-            # Настройки таблицы
-        self.ui.data_table_widget.setSortingEnabled(True)
-        self.ui.data_table_widget.setSelectionBehavior(QTableWidget.SelectRows)
-        self.ui.data_table_widget.setEditTriggers(QTableWidget.NoEditTriggers)
+    def load_table(self, sleep_data):
+        """Показать готовый результат (из кэша) целиком"""
+        self.finish_loading(f"Найдено записей: {len(sleep_data)}" if sleep_data
+                            else "Данные с такими параметрами не найдены")
+        self.table_model.set_source(sleep_data)
+
+    def reload(self):
+        """Повторить последний поиск"""
+        if self.last_filters is None:
+            return
+        if self.sort_key is not None:
+            self.start_paged(self.last_filters.with_order())
+        else:
+            self.start_loading(self.last_filters)
+
+    def selected_ids(self):
+        """ID записей, выделенных в таблице"""
+        rows = self.ui.data_table_widget.selectionModel().selectedRows()
+        return [self.table_model.value(index.row(), 0) for index in rows]
+
+    def show_table_menu(self, pos):
+        ids = self.selected_ids()
+        menu = QMenu(self)
+        if ids:
+            menu.addAction(f"Удалить выбранные ({len(ids)})", lambda: self.bulk_delete(ids=ids))
+            menu.addAction(f"Изменить выбранные ({len(ids)})...", lambda: self.bulk_patch(ids=ids))
+        if self.last_filters is not None and not self.last_filters.is_empty():
+            menu.addSeparator()
+            menu.addAction("Удалить все найденные", lambda: self.bulk_delete(filters=self.last_filters))
+            menu.addAction("Изменить все найденные...", lambda: self.bulk_patch(filters=self.last_filters))
+        if not menu.isEmpty():
+            menu.exec(self.ui.data_table_widget.viewport().mapToGlobal(pos))
+
+    def bulk_delete(self, ids=None, filters=None):
+        self.run_bulk(self.sleep_data_service.remove_sleep_data_bulk, "Удаление", "удалено",
+                      self.remove_rows, ids=ids, filters=filters)
+
+    def bulk_patch(self, ids=None, filters=None):
+        """Запрос поля и нового значения для массового изменения"""
+        columns = [column for column in SLEEP_DATA_COLUMNS if column.attr != "id"]
+        title, ok = QInputDialog.getItem(self, "Массовое изменение", "Поле:",
+                                         [column.title for column in columns], 0, False)
+        if not ok:
+            return
+        column = next(column for column in columns if column.title == title)
+        text, ok = QInputDialog.getText(self, "Массовое изменение", f"Новое значение {title}:")
+        if not ok:
+            return
+        try:
+            value = VALUE_PARSERS.get(column.kind, str)(text.strip())
+        except ValueError:
+            QMessageBox.warning(self, "Внимание", f"Некорректное значение: {text}")
+            return
+        values = {column.attr: value}
+        self.run_bulk(lambda **kwargs: self.sleep_data_service.patch_sleep_data_bulk(values, **kwargs),
+                      "Изменение", "изменено", self.patch_rows, ids=ids, filters=filters)
+
+    def run_bulk(self, operation, title, verb, apply, ids=None, filters=None):
+        """
+        Массовая операция в два шага: пробный подсчет затрагиваемых
+        записей, подтверждение, затем одна команда в базе. apply переносит
+        ее результат в таблицу
+        """
+        kwargs = {"spec": filters} if filters is not None else {}
+        if ids is not None:
+            kwargs["ids"] = ids
+        self.query_runner.submit(self.sleep_data_service.count_sleep_data, **kwargs,
+                                 on_result=lambda count: self.confirm_bulk(operation, title, verb, apply, kwargs, count),
+                                 on_error=self.on_write_error)
+
+    def confirm_bulk(self, operation, title, verb, apply, kwargs, count):
+        if count == 0:
+            QMessageBox.information(self, title, "Нет записей для этой операции")
+            return
+        reply = QMessageBox.question(self, title, f"Будет {verb} записей: {count}. Продолжить?",
+                                     QMessageBox.Ok | QMessageBox.Cancel, QMessageBox.Cancel)
+        if reply == QMessageBox.Ok:
+            self.query_runner.submit(operation, **kwargs,
+                                     on_result=lambda affected: self.on_bulk_done(title, verb, apply, affected),
+                                     on_error=self.on_write_error)
+
+    def on_bulk_done(self, title, verb, apply, affected):
+        if len(affected) > PATCH_LIMIT or len(affected) * self.table_model.rowCount() > PATCH_WORK_LIMIT:
+            self.reload()
+        else:
+            apply(affected)
+        QMessageBox.information(self, title, f"Записей {verb}: {len(affected)}")
+        logger.info(f"{title}: {len(affected)} записей")
+
+    def patch_rows(self, records):
+        """
+        Перенести в таблицу добавленные или измененные записи без повторного
+        поиска: запись, подходящая под фильтры поиска, добавляется или
+        обновляется на месте, неподходящая убирается
+        """
+        if self.last_filters is None:
+            return  # поиска еще не было, таблица пуста
+        for record in records:
+            values = {name: getattr(record, name) for name in SleepDataRow._fields}
+            if not self.last_filters.matches(values):
+                self.table_model.remove_row(record.id)
+            elif not self.table_model.update_row(record):
+                self.table_model.insert_row(record)
+
+    def remove_rows(self, ids):
+        for data_id in ids:
+            self.table_model.remove_row(data_id)
 
     def search_sleep_data_by_id_for_update(self):
         try:
             data_id = int(self.ui.update_data_id.text())
-            sleep_data = self.sleep_data_service.get_sleep_data_by_id(data_id)
-            self.ui.update_id_resp.setText(str(sleep_data.respondent.id))
-            self.ui.sleep_start_time.setText(str(sleep_data.sleep_start_time))
-            self.ui.sleep_end_time.setText(str(sleep_data.sleep_end_time))
-            self.ui.total_sleep_hours.setText(str(sleep_data.total_sleep_hours))
-            self.ui.sleep_quality.setText(str(sleep_data.sleep_quality))
-            self.ui.exercise_minutes.setText(str(sleep_data.exercise_minutes))
-            self.ui.caffeine_intake_mg.setText(str(sleep_data.caffeine_intake_mg))
-            self.ui.screen_time.setText(str(sleep_data.screen_time_before_bed))
-            self.ui.work_hours.setText(str(sleep_data.work_hours))
-            self.ui.productivity_score.setText(str(sleep_data.productivity_score))
-            self.ui.mood_score.setText(str(sleep_data.mood_score))
-            self.ui.stress_level.setText(str(sleep_data.stress_level))
-        except NoResultFound as ex:
+        except ValueError:
+            self.highlight_textbox(self.ui.update_data_id)
+            return
+        self.query_runner.submit(self.sleep_data_service.get_sleep_data_by_id, data_id,
+                                 on_result=self.fill_update_fields,
+                                 on_error=self.on_search_error)
+
+    def fill_update_fields(self, sleep_data):
+        self.edited_version = (sleep_data.id, sleep_data.version)
+        self.ui.update_id_resp.setText(str(sleep_data.person_id))
+        self.ui.sleep_start_time.setText(str(sleep_data.sleep_start_time))
+        self.ui.sleep_end_time.setText(str(sleep_data.sleep_end_time))
+        self.ui.total_sleep_hours.setText(str(sleep_data.total_sleep_hours))
+        self.ui.sleep_quality.setText(str(sleep_data.sleep_quality))
+        self.ui.exercise_minutes.setText(str(sleep_data.exercise_minutes))
+        self.ui.caffeine_intake_mg.setText(str(sleep_data.caffeine_intake_mg))
+        self.ui.screen_time.setText(str(sleep_data.screen_time_before_bed))
+        self.ui.work_hours.setText(str(sleep_data.work_hours))
+        self.ui.productivity_score.setText(str(sleep_data.productivity_score))
+        self.ui.mood_score.setText(str(sleep_data.mood_score))
+        self.ui.stress_level.setText(str(sleep_data.stress_level))
+
+    def on_search_error(self, ex):
+        if isinstance(ex, NoResultFound):
             error_msg = f"Данные не найдены: {str(ex)}"
             QMessageBox.warning(self, "Ошибка", error_msg)
-            logger.error(error_msg)
+        else:
+            error_msg = f"Непредвиденная ошибка: {str(ex)}"
+            QMessageBox.critical(self, "Ошибка", error_msg)
+        logger.error(error_msg)
 
     def highlight_textbox(self, textbox):
         textbox.setStyleSheet("border: 2px solid red;")
@@ -219,28 +614,28 @@ class SleepDataTab(QWidget):
                                          QMessageBox.Cancel)
 
             if reply == QMessageBox.Ok:
-
-                success = self.sleep_data_service.update_sleep_data(data_id,
-                                                                    respondent_id,
-                                                                    sl_start_time,
-                                                                    sl_end_time,
-                                                                    sl_total_time,
-                                                                    sl_quality,
-                                                                    exercise,
-                                                                    coffee,
-                                                                    screen_time,
-                                                                    work_time,
-                                                                    productivity,
-                                                                    mood,
-                                                                    stress)
-
-                if success:
-                    QMessageBox.information(self, "Успех",
-                                            f"Данные для записи id={data_id} успешно обновлены")
-                    logger.info(f"Успешное обновление записи {data_id}")
-                else:
-                    QMessageBox.warning(self, "Ошибка", "Данные не обновлены")
-                    logger.info(f"Данные не обновлены {data_id}")
+                # Версия известна, если запись была найдена перед правкой
+                version = None
+                if self.edited_version is not None and self.edited_version[0] == data_id:
+                    version = self.edited_version[1]
+
+                self.query_runner.submit(self.sleep_data_service.update_sleep_data,
+                                         data_id,
+                                         respondent_id,
+                                         sl_start_time,
+                                         sl_end_time,
+                                         sl_total_time,
+                                         sl_quality,
+                                         exercise,
+                                         coffee,
+                                         screen_time,
+                                         work_time,
+                                         productivity,
+                                         mood,
+                                         stress,
+                                         version=version,
+                                         on_result=lambda updated: self.on_data_updated(data_id, updated),
+                                         on_error=self.on_write_error)
 
         except ValueError as ex:
             QMessageBox.critical(self, "Ошибка", f"Некорректные данные: {str(ex)}")
@@ -249,6 +644,28 @@ class SleepDataTab(QWidget):
             QMessageBox.critical(self, "Ошибка", f"Непредвиденная ошибка: {str(ex)}")
             logger.error(f"Непредвиденная ошибка: {str(ex)}")
 
+    def on_data_updated(self, data_id, updated):
+        if updated:
+            self.edited_version = (updated.id, updated.version)
+            self.patch_rows([updated])
+            QMessageBox.information(self, "Успех",
+                                    f"Данные для записи id={data_id} успешно обновлены")
+            logger.info(f"Успешное обновление записи {data_id}")
+        else:
+            QMessageBox.warning(self, "Ошибка", "Данные не обновлены")
+            logger.info(f"Данные не обновлены {data_id}")
+
+    def on_write_error(self, ex):
+        if isinstance(ex, StaleDataException):
+            QMessageBox.warning(self, "Конфликт изменений", str(ex))
+            logger.warning(f"Конфликт версий: {str(ex)}")
+        elif isinstance(ex, (NoResultFound, RespondentNotFoundException, DuplicateSleepDataException)):
+            QMessageBox.critical(self, "Ошибка", str(ex))
+            logger.error(f"Данные не найдены: {str(ex)}")
+        else:
+            QMessageBox.critical(self, "Ошибка", f"Непредвиденная ошибка: {str(ex)}")
+            logger.error(f"Непредвиденная ошибка: {str(ex)}")
+
     def parse_input_data_fields(self):
         """Парсит и валидирует все входные поля, выделяет невалидные"""
 
@@ -388,42 +805,35 @@ class SleepDataTab(QWidget):
         )
 
     def delete_data(self):
+        if not self.ui.delete_data_id.text().strip():
+            self.highlight_textbox(self.ui.delete_data_id)
+            return
         try:
-            if not self.ui.delete_data_id.text().strip():
-                self.highlight_textbox(self.ui.delete_data_id)
-                return
-
             data_id = int(self.ui.delete_data_id.text())
-
-            if self.sleep_data_service.remove_sleep_data_by_id(data_id):
-                QMessageBox.information(self, "Успех",
-                                        f"Данные с id={data_id} удалены")
-                logger.info(f"Успешное удаление записи {data_id}")
-            else:
-                QMessageBox.warning(self, "Ошибка", "Данные не удалены")
-                logger.warning(f"Не удалось удалить запись {data_id}")
-
         except ValueError:
-            self.highlight_textbox(self.ui.deleted_data_id_textbox)
+            self.highlight_textbox(self.ui.delete_data_id)
             QMessageBox.critical(self, "Ошибка",
                                  "Некорректный ID. Введите целое число.")
             logger.error("Некорректный формат ID для удаления")
+            return
 
-        except NoResultFound as ex:
-            QMessageBox.critical(self, "Ошибка", str(ex))
-            logger.error(f"Данные не найдены: {str(ex)}")
-
-
+        self.query_runner.submit(self.sleep_data_service.remove_sleep_data_by_id, data_id,
+                                 on_result=lambda success: self.on_data_deleted(data_id, success),
+                                 on_error=self.on_write_error)
 
-        except Exception as ex:
-            QMessageBox.critical(self, "Ошибка",
-                                 f"Непредвиденная ошибка: {str(ex)}")
-            logger.error(f"Непредвиденная ошибка при удалении: {str(ex)}")
+    def on_data_deleted(self, data_id, success):
+        if success:
+            self.table_model.remove_row(data_id)
+            QMessageBox.information(self, "Успех",
+                                    f"Данные с id={data_id} удалены")
+            logger.info(f"Успешное удаление записи {data_id}")
+        else:
+            QMessageBox.warning(self, "Ошибка", "Данные не удалены")
+            logger.warning(f"Не удалось удалить запись {data_id}")
 
     def export_data(self):
-        """Экспорт данных из таблицы в Excel файл"""
-        table_widget = self.ui.data_table_widget
-        if table_widget.rowCount() == 0:
+        """Экспорт результатов последнего поиска в Excel файл"""
+        if self.last_filters is None or self.table_model.rowCount() == 0:
             QMessageBox.warning(self, "Предупреждение",
                                 "Нет данных для экспорта.")
             return
@@ -438,53 +848,65 @@ class SleepDataTab(QWidget):
 
         if file_dialog.exec() == QFileDialog.Accepted:
             file_path = file_dialog.selectedFiles()[0]
-            self.export_to_excel(table_widget, file_path)
-
-    def export_to_excel(self, table_widget: QTableWidget, file_path: str):
-        """Создание Excel файла с данными из таблицы"""
-        try:
-            # Создаем новую книгу Excel
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Exported Data"
-
-            # Добавляем заголовки столбцов
-            headers = []
-            for col in range(table_widget.columnCount()):
-                header = table_widget.horizontalHeaderItem(col)
-                headers.append(header.text() if header else f"Column {col + 1}")
-            ws.append(headers)
-
-            # Добавляем данные из таблицы
-            for row in range(table_widget.rowCount()):
-                row_data = []
-                for col in range(table_widget.columnCount()):
-                    item = table_widget.item(row, col)
-                    row_data.append(item.text() if item else "")
-                ws.append(row_data)
-
-            # Сохраняем файл
-            wb.save(file_path)
-
-            # Показываем сообщение об успехе
-            QMessageBox.information(
-                self,
-                "Экспорт завершен",
-                f"Данные успешно экспортированы в:\n{file_path}"
-            )
+            self.export_to_excel(file_path)
+
+    def export_to_excel(self, file_path: str):
+        """
+        Выгрузка в фоне: запрос выполняется заново по фильтрам последнего
+        поиска, строки пишутся в файл по мере чтения из базы
+        """
+        columns = [(column.title, column.attr) for column in SLEEP_DATA_COLUMNS]
+        self.export_progress = QProgressDialog("Экспорт данных...", "Отмена", 0, 0, self)
+        self.export_progress.setWindowTitle("Экспорт в Excel")
+        self.export_progress.setMinimumDuration(0)
+        self.export_progress.canceled.connect(self.cancel_export)
+        self.export_progress.show()
+
+        self.query_runner.submit(self.sleep_data_service.export_sleep_data,
+                                 file_path, columns, spec=self.last_filters,
+                                 on_result=lambda count: self.on_export_finished(file_path, count),
+                                 on_error=self.on_export_error,
+                                 on_progress=self.on_export_progress,
+                                 key="sleep_data_export")
+
+    def on_export_progress(self, count):
+        if self.export_progress is not None:
+            self.export_progress.setLabelText(f"Экспортировано {count} записей...")
+
+    def cancel_export(self):
+        self.query_runner.cancel("sleep_data_export")
+        self.close_export_progress()
+        logger.info("Экспорт отменен")
+
+    def close_export_progress(self):
+        if self.export_progress is not None:
+            self.export_progress.canceled.disconnect(self.cancel_export)
+            self.export_progress.close()
+            self.export_progress = None
+
+    def on_export_finished(self, file_path, count):
+        self.close_export_progress()
+        QMessageBox.information(
+            self,
+            "Экспорт завершен",
+            f"{count} записей успешно экспортированы в:\n{file_path}"
+        )
 
-        except PermissionError:
+    def on_export_error(self, ex):
+        self.close_export_progress()
+        if isinstance(ex, PermissionError):
             QMessageBox.critical(
                 self,
                 "Ошибка",
                 "Нет прав для записи файла. Закройте файл если он открыт."
             )
-        except Exception as e:
+        else:
             QMessageBox.critical(
                 self,
                 "Ошибка экспорта",
-                f"Произошла ошибка при экспорте:\n{str(e)}"
+                f"Произошла ошибка при экспорте:\n{str(ex)}"
             )
+        logger.error(f"Ошибка экспорта: {str(ex)}")
 
     def create_data(self):
         try:
@@ -497,7 +919,8 @@ class SleepDataTab(QWidget):
              productivity, mood, stress) = parsed_data
 
 
-            new_sleep_data = self.sleep_data_service.add_sleep_data(
+            self.query_runner.submit(
+                self.sleep_data_service.add_sleep_data,
                 respondent_id,
                 sl_start_time,
                 sl_end_time,
@@ -509,32 +932,27 @@ class SleepDataTab(QWidget):
                 work_time,
                 productivity,
                 mood,
-                stress
+                stress,
+                on_result=self.on_data_created,
+                on_error=self.on_write_error
             )
 
-            if new_sleep_data is not None:
-                QMessageBox.information(
-                    self,
-                    "Успех",
-                    f"Добавлена запись {new_sleep_data}",
-                    QMessageBox.Ok
-                )
-                logger.info(f"Успешное добавление новой записи {new_sleep_data.id}")
-
-        except NoResultFound as ex:
+        except Exception as ex:
             QMessageBox.critical(
                 self,
                 "Ошибка",
-                str(ex),
+                f"Непредвиденная ошибка: {str(ex)}",
                 QMessageBox.Ok
             )
-            logger.error(f"Данные не найдены: {str(ex)}")
+            logger.error(f"Непредвиденная ошибка: {str(ex)}")
 
-        except Exception as ex:
-            QMessageBox.critical(
+    def on_data_created(self, new_sleep_data):
+        if new_sleep_data is not None:
+            self.patch_rows([new_sleep_data])
+            QMessageBox.information(
                 self,
-                "Ошибка",
-                f"Непредвиденная ошибка: {str(ex)}",
+                "Успех",
+                f"Добавлена запись {new_sleep_data}",
                 QMessageBox.Ok
             )
-            logger.error(f"Непредвиденная ошибка: {str(ex)}")
\ No newline at end of file
+            logger.info(f"Успешное добавление новой записи {new_sleep_data.id}")
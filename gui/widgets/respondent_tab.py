@@ -1,30 +1,58 @@
-from PySide6.QtWidgets import QWidget, QMessageBox, QTableWidgetItem, QHeaderView, QTableWidget
-from PySide6.QtCore import Qt
-from exception.exceptions import RespondentNotFoundException
+from PySide6.QtCore import QModelIndex, Qt, QTimer
+from PySide6.QtGui import QStandardItem, QStandardItemModel
+from PySide6.QtWidgets import QWidget, QMessageBox, QHeaderView, QAbstractItemView, QCompleter
+from gui.widgets.table_model import ColumnTableModel, TableColumn, INT, STR
 
+# Пауза после последнего нажатия клавиши перед запросом подсказок, мс
+SUGGEST_DELAY_MS = 250
+# Роли элементов подсказки: текст для поля ввода и id респондента
+SUGGEST_TEXT_ROLE = Qt.UserRole + 1
+SUGGEST_ID_ROLE = Qt.UserRole + 2
 
-def create_int_item(value):
-    item = QTableWidgetItem()
-    item.setData(Qt.DisplayRole, value)
-    return item
+RESPONDENT_COLUMNS = [
+    TableColumn("ID", "id", INT),
+    TableColumn("First Name", "first_name", STR),
+    TableColumn("Last Name", "last_name", STR),
+    TableColumn("Email", "email", STR),
+    TableColumn("Gender", "gender", STR),
+    TableColumn("Country", "country", STR),
+    TableColumn("Age", "age", INT),
+]
 
 
 class RespondentsTab(QWidget):
-    def __init__(self, ui, respondent_service):
+    def __init__(self, ui, respondent_service, query_runner):
         super().__init__()
         self.ui = ui
         self.respondent_service = respondent_service
+        self.query_runner = query_runner
+        # Что показано в таблице: None - ничего, "" - все респонденты,
+        # иначе начало фамилии из последнего поиска
+        self.listing = None
         self.setup_table()
+        self.setup_completer()
         self.connect_signals()
 
     def setup_table(self):
-        self.ui.resp_tablewidget.setColumnCount(7)
-        self.ui.resp_tablewidget.setHorizontalHeaderLabels([
-            "ID", "First Name", "Last Name", "Email", "Gender", "Country", "Age"
-        ])
+        self.table_model = ColumnTableModel(RESPONDENT_COLUMNS, parent=self)
+        self.ui.resp_tablewidget.setModel(self.table_model)
         self.ui.resp_tablewidget.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.ui.resp_tablewidget.setSelectionBehavior(QTableWidget.SelectRows)
-        
+        self.ui.resp_tablewidget.setSortingEnabled(True)
+        self.ui.resp_tablewidget.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.ui.resp_tablewidget.setEditTriggers(QAbstractItemView.NoEditTriggers) #запрет редактирования
+
+
+    def setup_completer(self):
+        """Подсказки при вводе фамилии: запрос к базе после паузы в наборе"""
+        self.suggest_model = QStandardItemModel(self)
+        self.completer = QCompleter(self.suggest_model, self)
+        # отбор и порядок задает база (нечеткие совпадения не начинаются с введенного текста)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.setCompletionRole(SUGGEST_TEXT_ROLE)
+        self.ui.last_name_field_search.setCompleter(self.completer)
+        self.suggest_timer = QTimer(self)
+        self.suggest_timer.setSingleShot(True)
+        self.suggest_timer.setInterval(SUGGEST_DELAY_MS)
 
     def connect_signals(self):
         self.ui.all_respondents_btn.clicked.connect(self.load_all)
@@ -33,76 +61,133 @@ class RespondentsTab(QWidget):
         self.ui.delete_resp_btn.clicked.connect(self.delete_respondent)
         self.ui.search_resp_btn.clicked.connect(self.search_by_last_name)
         self.ui.search_resp_by_id_btn.clicked.connect(self.search_by_id)
+        self.ui.last_name_field_search.textEdited.connect(lambda _: self.suggest_timer.start())
+        self.suggest_timer.timeout.connect(self.request_suggestions)
+        self.completer.activated[QModelIndex].connect(self.on_suggestion_chosen)
 
     def load_all(self):
-        respondents = self.respondent_service.get_respondents()
-        self.load_table(respondents)
+        self.listing = ""
+        # для таблицы достаточно значений столбцов, объекты модели не нужны
+        self.query_runner.submit(self.respondent_service.get_respondents, as_rows=True,
+                                 on_result=self.load_table,
+                                 on_error=self.show_error,
+                                 key="respondents_search")
 
     def load_table(self, respondents):
-        self.ui.resp_tablewidget.setRowCount(0)
-        self.ui.resp_tablewidget.setRowCount(len(respondents))
-        for row, r in enumerate(respondents):
-            self.ui.resp_tablewidget.setItem(row, 0, create_int_item(r.id))
-            self.ui.resp_tablewidget.setItem(row, 1, QTableWidgetItem(r.first_name))
-            self.ui.resp_tablewidget.setItem(row, 2, QTableWidgetItem(r.last_name))
-            self.ui.resp_tablewidget.setItem(row, 3, QTableWidgetItem(r.email))
-            self.ui.resp_tablewidget.setItem(row, 4, QTableWidgetItem(r.gender))
-            self.ui.resp_tablewidget.setItem(row, 5, QTableWidgetItem(r.country))
-            self.ui.resp_tablewidget.setItem(row, 6, create_int_item(r.age))
-        self.ui.resp_tablewidget.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.ui.resp_tablewidget.setSortingEnabled(True)
-        self.ui.resp_tablewidget.setSelectionBehavior(QTableWidget.SelectRows)
-        self.ui.resp_tablewidget.setEditTriggers(QTableWidget.NoEditTriggers) #запрет редактирования
+        self.table_model.set_source(respondents)
     def add_respondent(self):
         data = self.get_form_data()
         if not data: return
-        self.respondent_service.add_respondent(**data)
-        self.load_all()
-        QMessageBox.information(self, "Успех", "Респондент добавлен")
+        self.query_runner.submit(self.respondent_service.add_respondent, **data,
+                                 on_result=lambda r: self.on_respondent_saved(r, "Респондент добавлен"),
+                                 on_error=self.show_error)
 
     def update_respondent(self):
         try:
             data = self.get_form_data()
             if not data: return
             resp_id = int(self.ui.id_resp_search.text())
-            self.respondent_service.update_respondent(resp_id, **data)
-            self.load_all()
-            QMessageBox.information(self, "Успех", "Респондент обновлён")
+            self.query_runner.submit(self.respondent_service.update_respondent, resp_id, **data,
+                                     on_result=lambda r: self.on_respondent_saved(r, "Респондент обновлён"),
+                                     on_error=self.show_error)
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))
 
     def delete_respondent(self):
         try:
             resp_id = int(self.ui.id_resp_delete.text())
-            if self.respondent_service.delete_resp_by_id(resp_id):
-                QMessageBox.information(self, "Успех", "Респондент удалён")
-                self.load_all()
+            self.query_runner.submit(self.respondent_service.delete_resp_by_id, resp_id,
+                                     on_result=lambda _: self.on_respondent_deleted(resp_id),
+                                     on_error=self.show_error)
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))
 
+    def on_respondent_saved(self, respondent, message):
+        """Правка одной строки таблицы вместо повторной загрузки всех респондентов"""
+        if self.is_listed(respondent):
+            if not self.table_model.update_row(respondent):
+                self.table_model.insert_row(respondent)
+        else:
+            self.table_model.remove_row(respondent.id)
+        QMessageBox.information(self, "Успех", message)
+
+    def on_respondent_deleted(self, resp_id):
+        self.table_model.remove_row(resp_id)
+        QMessageBox.information(self, "Успех", "Респондент удалён")
+
+    def is_listed(self, respondent):
+        """Попадает ли респондент в показанный список (условие как в search_resp_by_last_name)"""
+        if self.listing is None:
+            return False
+        return respondent.last_name.lower().startswith(self.listing.lower())
+
     def search_by_last_name(self):
         last_name = self.ui.last_name_field_search.text()
         if not last_name:
             QMessageBox.warning(self, "Ошибка", "Введите фамилию")
             return
-        respondents = self.respondent_service.search_resp_by_last_name(last_name)
-        self.load_table(respondents)
+        self.listing = last_name
+        self.query_runner.submit(self.respondent_service.search_resp_by_last_name, last_name, as_rows=True,
+                                 on_result=self.load_table,
+                                 on_error=self.show_error,
+                                 key="respondents_search")
+
+    def request_suggestions(self):
+        term = self.ui.last_name_field_search.text().strip()
+        if not term:
+            self.query_runner.cancel("respondents_suggest")
+            self.suggest_model.clear()
+            return
+        # новый запрос отменяет еще не завершенный предыдущий
+        self.query_runner.submit(self.respondent_service.suggest_respondents, term,
+                                 on_result=lambda rows: self.show_suggestions(term, rows),
+                                 on_error=self.on_suggest_error,
+                                 key="respondents_suggest")
+
+    def show_suggestions(self, term, respondents):
+        if term != self.ui.last_name_field_search.text().strip():
+            return  # пока шел запрос, текст изменился
+        self.suggest_model.clear()
+        for r in respondents:
+            item = QStandardItem(f"{r.last_name} {r.first_name} ({r.email}, {r.country}) #{r.id}")
+            item.setData(r.last_name, SUGGEST_TEXT_ROLE)
+            item.setData(r.id, SUGGEST_ID_ROLE)
+            self.suggest_model.appendRow(item)
+        if respondents:
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
+
+    def on_suggest_error(self, e):
+        # подсказки не мешают вводу окнами ошибок
+        self.query_runner.show_status(f"Подсказки недоступны: {e}")
+
+    def on_suggestion_chosen(self, index):
+        self.suggest_timer.stop()
+        resp_id = index.data(SUGGEST_ID_ROLE)
+        self.ui.id_resp_search.setText(str(resp_id))
+        self.search_by_id()
 
     def search_by_id(self):
         try:
             resp_id = int(self.ui.id_resp_search.text())
-            r = self.respondent_service.search_resp_by_id(resp_id)
-            self.ui.name_resp.setText(r.first_name)
-            self.ui.last_name_resp.setText(r.last_name)
-            self.ui.email_resp.setText(r.email)
-            self.ui.gender_box.setCurrentText(r.gender)
-            self.ui.country_resp.setText(r.country)
-            self.ui.age_resp.setText(str(r.age))
-        except RespondentNotFoundException as e:
-            QMessageBox.critical(self, "Ошибка", str(e))
+            self.query_runner.submit(self.respondent_service.search_resp_by_id, resp_id,
+                                     on_result=self.fill_form,
+                                     on_error=self.show_error)
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))
 
+    def fill_form(self, r):
+        self.ui.name_resp.setText(r.first_name)
+        self.ui.last_name_resp.setText(r.last_name)
+        self.ui.email_resp.setText(r.email)
+        self.ui.gender_box.setCurrentText(r.gender)
+        self.ui.country_resp.setText(r.country)
+        self.ui.age_resp.setText(str(r.age))
+
+    def show_error(self, e):
+        QMessageBox.critical(self, "Ошибка", str(e))
+
     def get_form_data(self):
         first_name = self.ui.name_resp.text()
         last_name = self.ui.last_name_resp.text()
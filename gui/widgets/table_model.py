@@ -0,0 +1,388 @@
+"""Модель таблицы с колоночным хранением и ленивой подгрузкой строк."""
+from array import array
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt, Signal
+
+INT = "int"
+FLOAT = "float"
+DATE = "date"
+STR = "str"
+
+DEFAULT_FETCH_SIZE = 500
+
+
+class TableColumn(NamedTuple):
+    """Описание столбца: заголовок, атрибут записи и тип значения"""
+    title: str
+    attr: str
+    kind: str = STR
+    decimals: int = 2
+
+
+def _new_store(kind):
+    """Компактное хранилище значений столбца"""
+    if kind == INT:
+        return array("q")
+    if kind == FLOAT:
+        return array("d")
+    return []
+
+
+class ColumnTableModel(QAbstractTableModel):
+    """
+    Модель только для чтения для QTableView.
+
+    Значения хранятся по столбцам (array для чисел), строки подтягиваются
+    из источника порциями через canFetchMore/fetchMore, а текст
+    форматируется только для ячеек, которые запрашивает представление.
+
+    Отдельные записи можно добавить, изменить и удалить по ключу (key_attr)
+    без перезагрузки: строка встает на место по текущей сортировке.
+
+    Записи могут поступать порциями (start_stream/append_stream), в том
+    числе постранично с сервера: когда представление прокручено до конца,
+    модель запрашивает следующую страницу сигналом more_requested.
+    """
+    more_requested = Signal()
+
+    def __init__(self, columns: List[TableColumn], fetch_size: int = DEFAULT_FETCH_SIZE, parent=None,
+                 key_attr: str = "id"):
+        super().__init__(parent)
+        self._columns = columns
+        self._fetch_size = fetch_size
+        self._stores = [_new_store(c.kind) for c in columns]
+        self._source: Optional[Iterator[Any]] = None
+        # Записи поступают порциями через append_stream
+        self._streaming = False
+        # На сервере есть следующие страницы; запрос уже отправлен
+        self._has_more = False
+        self._more_requested = False
+        # Строки приходят с сервера уже упорядоченными по _sort
+        self._server_sorted = False
+        self._key_column = next(i for i, c in enumerate(columns) if c.attr == key_attr)
+        # (столбец, порядок) последней сортировки; None - порядок источника
+        self._sort = None
+        # Ключи записей, уже показанных или удаленных по отдельности: при
+        # подгрузке из источника их прежние значения пропускаются
+        self._skip_keys: Set[Any] = set()
+        # Новые записи без сортировки, пока источник не прочитан: встают
+        # после его последней строки
+        self._tail: Dict[Any, Any] = {}
+        # Номер строки по ключу; строится при первом поиске и сбрасывается,
+        # когда строки сдвигаются (вставка или удаление в середине, сортировка)
+        self._row_of: Optional[Dict[Any, int]] = None
+
+    @property
+    def columns(self) -> List[TableColumn]:
+        return self._columns
+
+    def set_source(self, records: Iterable[Any]):
+        """Заменить данные модели; записи читаются из records по мере прокрутки"""
+        self.beginResetModel()
+        self._stores = [_new_store(c.kind) for c in self._columns]
+        self._source = iter(records)
+        self._sort = None
+        self._skip_keys = set()
+        self._tail = {}
+        self._streaming = False
+        self._has_more = self._more_requested = self._server_sorted = False
+        self._row_of = None
+        self.endResetModel()
+        if self.canFetchMore():
+            self.fetchMore()
+
+    def clear(self):
+        self.beginResetModel()
+        self._stores = [_new_store(c.kind) for c in self._columns]
+        self._source = None
+        self._sort = None
+        self._skip_keys = set()
+        self._tail = {}
+        self._streaming = False
+        self._has_more = self._more_requested = self._server_sorted = False
+        self._row_of = None
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._stores[0]) if self._stores else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._columns)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._source is not None or (self._has_more and not self._more_requested)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        if self._source is None:
+            if self._has_more and not self._more_requested:
+                self._more_requested = True
+                self.more_requested.emit()
+            return
+        batch = list(islice(self._source, self._fetch_size))
+        exhausted = len(batch) < self._fetch_size
+        if self._skip_keys:
+            key_attr = self._columns[self._key_column].attr
+            batch = [r for r in batch if getattr(r, key_attr) not in self._skip_keys]
+        if exhausted:
+            self._source = None
+            self._skip_keys = set()
+            batch.extend(self._tail.values())
+            self._tail = {}
+        self.append_records(batch)
+
+    def start_stream(self):
+        """Очистить модель перед приемом записей порциями (append_stream)"""
+        self.clear()
+        self._streaming = True
+
+    def set_server_order(self, column: int, order=Qt.AscendingOrder):
+        """Записи потока приходят упорядоченными по столбцу column (ORDER BY на сервере)"""
+        self._sort = (column, order)
+        self._server_sorted = True
+
+    def set_has_more(self, has_more: bool):
+        """Есть ли на сервере следующие страницы потока"""
+        self._has_more = has_more
+
+    def append_stream(self, records: List[Any]):
+        """Добавить очередную порцию записей из потока"""
+        self._more_requested = False
+        if self._skip_keys:
+            key_attr = self._columns[self._key_column].attr
+            records = [r for r in records if getattr(r, key_attr) not in self._skip_keys]
+        self.append_records(records)
+
+    def finish_stream(self):
+        """
+        Поток завершен или остановлен: добавить отложенные новые записи;
+        если таблицу сортировали во время загрузки, порции, пришедшие
+        после этого, встают на свои места
+        """
+        self._streaming = False
+        self._has_more = self._more_requested = False
+        self._skip_keys = set()
+        tail, self._tail = list(self._tail.values()), {}
+        self.append_records(tail)
+        if self._sort is not None and not self._server_sorted:
+            self.sort(*self._sort)
+
+    @property
+    def streaming(self) -> bool:
+        return self._streaming
+
+    def append_records(self, records: List[Any]):
+        """Добавить записи в конец модели"""
+        if not records:
+            return
+        first = self.rowCount()
+        self.beginInsertRows(QModelIndex(), first, first + len(records) - 1)
+        for column, store in zip(self._columns, self._stores):
+            store.extend(getattr(r, column.attr) for r in records)
+        if self._row_of is not None:
+            keys = self._stores[self._key_column]
+            self._row_of.update((keys[row], row) for row in range(first, len(keys)))
+        self.endInsertRows()
+
+    def find_row(self, key) -> int:
+        """Номер загруженной строки с ключом key или -1"""
+        if self._row_of is None:
+            self._row_of = {k: row for row, k in enumerate(self._stores[self._key_column])}
+        return self._row_of.get(key, -1)
+
+    def insert_row(self, record) -> int:
+        """
+        Добавить запись на место по текущей сортировке (без сортировки -
+        в конец). Возвращает номер строки или -1, если запись покажется
+        после подгрузки остальных строк источника
+        """
+        values = self._values(record)
+        if self._sort is None and self._pending():
+            self._tail[values[self._key_column]] = record
+            self._skip_keys.add(values[self._key_column])
+            return -1
+        row = self._position(values) if self._sort is not None else self.rowCount()
+        if self._beyond_loaded(row):
+            return -1
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._put(row, values)
+        self.endInsertRows()
+        self._skip_if_pending(values[self._key_column])
+        return row
+
+    def update_row(self, record) -> bool:
+        """
+        Заменить значения загруженной записи с тем же ключом; если изменился
+        столбец сортировки, строка переносится на новое место. False - записи
+        среди загруженных строк нет
+        """
+        values = self._values(record)
+        key = values[self._key_column]
+        if key in self._tail:
+            self._tail[key] = record
+            return True
+        row = self.find_row(key)
+        if row < 0:
+            return False
+        row_of = self._row_of
+        old_values = self._take(row)
+        target = self._position(values) if self._sort is not None else row
+        if target == row and not self._beyond_loaded(target):
+            self._put(row, values)
+            self._row_of = row_of  # строка осталась на месте, номера прочих не изменились
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self._columns) - 1))
+            return True
+        if self._beyond_loaded(target):
+            # строка переместилась за последнюю загруженную и придет со следующими страницами
+            self._put(row, old_values)
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self._take(row)
+            self.endRemoveRows()
+            return True
+        # при переносе вниз номер назначения считается до удаления строки
+        self._put(row, old_values)
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), target if target < row else target + 1)
+        self._take(row)
+        self._put(target, values)
+        self.endMoveRows()
+        return True
+
+    def remove_row(self, key) -> bool:
+        """Удалить запись с ключом key; False - среди загруженных строк ее нет"""
+        if self._tail.pop(key, None) is not None:
+            return True
+        self._skip_if_pending(key)
+        row = self.find_row(key)
+        if row < 0:
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self._take(row)
+        self.endRemoveRows()
+        return True
+
+    def _values(self, record) -> list:
+        return [getattr(record, c.attr) for c in self._columns]
+
+    def _put(self, row: int, values: list):
+        if self._row_of is not None and row == self.rowCount():
+            self._row_of[values[self._key_column]] = row
+        else:
+            self._row_of = None
+        for store, value in zip(self._stores, values):
+            store.insert(row, value)
+
+    def _take(self, row: int) -> list:
+        values = [store[row] for store in self._stores]
+        if self._row_of is not None and row == self.rowCount() - 1:
+            del self._row_of[values[self._key_column]]
+        else:
+            self._row_of = None
+        for store in self._stores:
+            del store[row]
+        return values
+
+    def _position(self, values: list) -> int:
+        """
+        Место новой строки в отсортированных данных (двоичный поиск, после
+        равных). При сортировке на сервере равные упорядочены по ключу, как в запросе
+        """
+        column, order = self._sort
+        store, value = self._stores[column], values[column]
+        at = store.__getitem__
+        if self._server_sorted:
+            keys = self._stores[self._key_column]
+            at = lambda i: (store[i], keys[i])
+            value = (value, values[self._key_column])
+        descending = order == Qt.DescendingOrder
+        low, high = 0, len(store)
+        while low < high:
+            middle = (low + high) // 2
+            if (value > at(middle)) if descending else (value < at(middle)):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _beyond_loaded(self, row: int) -> bool:
+        """Место строки после последней загруженной, а сервер отдаст ее со следующими страницами"""
+        return self._server_sorted and self._has_more and row >= self.rowCount()
+
+    def _pending(self) -> bool:
+        """Часть записей еще не получена (ленивый источник или поток)"""
+        return self._source is not None or self._streaming
+
+    def _skip_if_pending(self, key):
+        if self._pending():
+            self._skip_keys.add(key)
+
+    def value(self, row: int, column: int):
+        """Исходное (неформатированное) значение ячейки"""
+        return self._stores[column][row]
+
+    def row_values(self, row: int) -> list:
+        return [store[row] for store in self._stores]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        column = self._columns[index.column()]
+        value = self._stores[index.column()][index.row()]
+        if role == Qt.DisplayRole:
+            return self._format(column, value)
+        if role == Qt.TextAlignmentRole and column.kind in (INT, FLOAT):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    @staticmethod
+    def _format(column: TableColumn, value):
+        if value is None:
+            return ""
+        if column.kind == FLOAT:
+            return f"{value:.{column.decimals}f}"
+        if column.kind == DATE:
+            return value.strftime("%Y-%m-%d")
+        return str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section].title
+        return str(section + 1)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """
+        Сортировка перестановкой колоночных хранилищ. Ленивый источник
+        сначала дочитывается: иначе следующие порции встали бы в конец
+        без сортировки
+        """
+        if not 0 <= column < len(self._columns):
+            return
+        while self._source is not None:
+            self.fetchMore()
+        key_store = self._stores[column]
+        permutation = sorted(range(len(key_store)), key=key_store.__getitem__,
+                             reverse=order == Qt.DescendingOrder)
+        self.layoutAboutToBeChanged.emit()
+        old_persistent = self.persistentIndexList()
+        new_position = [0] * len(permutation)
+        for new_row, old_row in enumerate(permutation):
+            new_position[old_row] = new_row
+        for i, store in enumerate(self._stores):
+            reordered = [store[old_row] for old_row in permutation]
+            self._stores[i] = array(store.typecode, reordered) if isinstance(store, array) else reordered
+        self.changePersistentIndexList(
+            old_persistent,
+            [self.index(new_position[i.row()], i.column()) for i in old_persistent])
+        self._sort = (column, order)
+        self._row_of = None
+        self.layoutChanged.emit()
@@ -0,0 +1,135 @@
+"""Выполнение запросов к сервисам вне потока GUI."""
+import logging
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+from config.query_cancel import QueryCancelHandle, cancellable
+from config.settings import DbConfig
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerSignals(QObject):
+    """Сигналы задачи; доставляются в поток GUI"""
+    result = Signal(object)
+    error = Signal(object)
+    progress = Signal(object)
+    finished = Signal()
+
+
+class ServiceTask(QRunnable):
+    """
+    Задача для QThreadPool: вызывает fn(*args, **kwargs) в рабочем потоке.
+
+    Если задача создана с with_progress=True, в fn передается
+    progress_callback для промежуточных результатов. После отмены
+    результат и ошибки задачи не доставляются.
+    """
+
+    def __init__(self, fn, *args, with_progress=False, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel_handle = QueryCancelHandle()
+        self.signals = WorkerSignals()
+        if with_progress:
+            self.kwargs["progress_callback"] = self._emit_progress
+
+    @property
+    def cancelled(self):
+        return self.cancel_handle.cancelled
+
+    def cancel(self):
+        self.cancel_handle.cancel()
+
+    def _emit_progress(self, value):
+        if not self.cancelled:
+            self.signals.progress.emit(value)
+
+    def run(self):
+        try:
+            if self.cancelled:
+                return
+            with cancellable(self.cancel_handle):
+                result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            if self.cancelled:
+                logger.info(f"Задача {getattr(self.fn, '__name__', self.fn)} отменена")
+            else:
+                logger.error(f"Ошибка фоновой задачи: {e}")
+                self.signals.error.emit(e)
+        else:
+            if not self.cancelled:
+                self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
+
+
+class QueryRunner(QObject):
+    """
+    Очередь фоновых запросов к сервисам.
+
+    Задачи с одинаковым key вытесняют друг друга: новая отменяет
+    выполняющуюся, в том числе запрос на стороне PostgreSQL.
+    """
+    busy_changed = Signal(bool)
+    status_message = Signal(str)
+
+    def __init__(self, max_threads=DbConfig.pool_size, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        # Больше потоков, чем соединений в пуле, только ждали бы свободного соединения
+        self.pool.setMaxThreadCount(max_threads)
+        self._active = set()
+        self._by_key = {}
+
+    def submit(self, fn, *args, on_result=None, on_error=None, on_progress=None, key=None, **kwargs):
+        """Поставить вызов fn в очередь и вернуть задачу"""
+        if key is not None and key in self._by_key:
+            self._by_key.pop(key).cancel()
+
+        task = ServiceTask(fn, *args, with_progress=on_progress is not None, **kwargs)
+        if on_result is not None:
+            task.signals.result.connect(on_result)
+        if on_error is not None:
+            task.signals.error.connect(on_error)
+        if on_progress is not None:
+            task.signals.progress.connect(on_progress)
+        task.signals.finished.connect(lambda: self._task_finished(task, key))
+        # QThreadPool не должен удалять задачу, пока на нее есть ссылки
+        task.setAutoDelete(False)
+
+        self._active.add(task)
+        if key is not None:
+            self._by_key[key] = task
+        if len(self._active) == 1:
+            self.busy_changed.emit(True)
+        self.pool.start(task)
+        return task
+
+    def show_status(self, text):
+        """Сообщение о ходе выполнения для строки состояния"""
+        self.status_message.emit(text)
+
+    def cancel(self, key):
+        """Отменить задачу с указанным ключом"""
+        task = self._by_key.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    def cancel_all(self):
+        for task in list(self._active):
+            task.cancel()
+        self._by_key.clear()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.waitForDone()
+
+    def _task_finished(self, task, key):
+        self._active.discard(task)
+        if key is not None and self._by_key.get(key) is task:
+            del self._by_key[key]
+        if not self._active:
+            self.busy_changed.emit(False)
@@ -3,7 +3,6 @@ import sys
 from PySide6.QtWidgets import QApplication
 
 
-from config.database_config import get_session, engine
 from config.logging_config import setup_logging
 
 
@@ -14,6 +13,7 @@ import logging
 logger=logging.getLogger(__name__)
 
 def main():
+  from config.database_config import get_session
   logger.info("Запуск программы")
   try:
       with next(get_session()) as session:
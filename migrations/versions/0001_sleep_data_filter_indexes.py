@@ -0,0 +1,64 @@
+"""Индексы для фильтруемых столбцов sleep.sleep_data
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "sleep"
+TABLE = "sleep_data"
+
+# Столбцы диапазонных фильтров get_sleep_data_with_parameters
+RANGE_FILTER_COLUMNS = [
+    "sleep_start_time",
+    "sleep_end_time",
+    "total_sleep_hours",
+    "sleep_quality",
+    "exercise_minutes",
+    "caffeine_intake_mg",
+    "screen_time_before_bed",
+    "work_hours",
+    "productivity_score",
+    "mood_score",
+    "stress_level",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        # Фильтр по респонденту и выборка его ночей по дате
+        op.create_index("ix_sleep_data_person_id_date", TABLE, ["person_id", "date"],
+                        schema=SCHEMA, postgresql_concurrently=True, if_not_exists=True)
+        # Записи добавляются по дням, BRIN по date почти ничего не весит
+        op.create_index("ix_sleep_data_date_brin", TABLE, ["date"],
+                        schema=SCHEMA, postgresql_using="brin",
+                        postgresql_concurrently=True, if_not_exists=True)
+        # B-tree по каждому столбцу фильтра; при нескольких фильтрах
+        # PostgreSQL объединяет их через BitmapAnd
+        for column in RANGE_FILTER_COLUMNS:
+            op.create_index(f"ix_sleep_data_{column}", TABLE, [column],
+                            schema=SCHEMA, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for column in reversed(RANGE_FILTER_COLUMNS):
+            op.drop_index(f"ix_sleep_data_{column}", table_name=TABLE, schema=SCHEMA,
+                          postgresql_concurrently=True, if_exists=True)
+        op.drop_index("ix_sleep_data_date_brin", table_name=TABLE, schema=SCHEMA,
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index("ix_sleep_data_person_id_date", table_name=TABLE, schema=SCHEMA,
+                      postgresql_concurrently=True, if_exists=True)
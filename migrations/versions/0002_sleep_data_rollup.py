@@ -0,0 +1,131 @@
+"""Сводная таблица sleep.sleep_data_rollup с инкрементальным обновлением триггерами
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "sleep"
+TABLE = "sleep_data_rollup"
+
+PERIODS = ["day", "week", "month"]
+
+# Показатели, суммы которых хранятся в сводной таблице
+ROLLUP_METRICS = [
+    "total_sleep_hours",
+    "sleep_quality",
+    "exercise_minutes",
+    "caffeine_intake_mg",
+    "screen_time_before_bed",
+    "work_hours",
+    "productivity_score",
+    "mood_score",
+    "stress_level",
+]
+
+SUM_COLUMNS = ", ".join(f"sum_{metric}" for metric in ROLLUP_METRICS)
+PERIOD_VALUES = ", ".join(f"('{period}')" for period in PERIODS)
+
+
+def aggregate_sql(source: str) -> str:
+    """
+    INSERT сумм по (респондент, период, начало периода) из source -
+    выборки со столбцами sign, person_id, date и показателями.
+    Существующие строки увеличиваются на дельту
+    """
+    sums = ", ".join(f"sum(s.sign * s.{metric})" for metric in ROLLUP_METRICS)
+    updates = ", ".join(f"sum_{metric} = r.sum_{metric} + excluded.sum_{metric}" for metric in ROLLUP_METRICS)
+    return f"""
+        INSERT INTO {SCHEMA}.{TABLE} AS r (person_id, period, period_start, nights, {SUM_COLUMNS})
+        SELECT s.person_id, p.period, date_trunc(p.period, s.date)::date, sum(s.sign), {sums}
+        FROM ({source}) s CROSS JOIN (VALUES {PERIOD_VALUES}) AS p(period)
+        GROUP BY 1, 2, 3
+        ON CONFLICT (person_id, period, period_start) DO UPDATE
+        SET nights = r.nights + excluded.nights, {updates}
+    """
+
+
+def rows_sql(sign: int, table: str) -> str:
+    metrics = ", ".join(ROLLUP_METRICS)
+    return f"SELECT {sign} AS sign, person_id, date, {metrics} FROM {table}"
+
+
+def cleanup_sql(tables: Sequence[str]) -> str:
+    """Удаление опустевших периодов затронутых респондентов"""
+    persons = " UNION ".join(f"SELECT person_id FROM {table}" for table in tables)
+    return f"DELETE FROM {SCHEMA}.{TABLE} WHERE nights = 0 AND person_id IN ({persons})"
+
+
+def trigger_function_sql(name: str, source: str, tables: Sequence[str]) -> str:
+    return f"""
+        CREATE OR REPLACE FUNCTION {SCHEMA}.{name}() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            {aggregate_sql(source)};
+            {cleanup_sql(tables)};
+            RETURN NULL;
+        END
+        $$
+    """
+
+
+# (событие, функция, выборка изменений, таблицы переходов)
+TRIGGERS = [
+    ("INSERT", "sleep_data_rollup_insert",
+     rows_sql(1, "new_rows"), ["new_rows"]),
+    ("UPDATE", "sleep_data_rollup_update",
+     f"{rows_sql(-1, 'old_rows')} UNION ALL {rows_sql(1, 'new_rows')}", ["old_rows", "new_rows"]),
+    ("DELETE", "sleep_data_rollup_delete",
+     rows_sql(-1, "old_rows"), ["old_rows"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        TABLE,
+        sa.Column("person_id", sa.Integer(), nullable=False),
+        sa.Column("period", sa.String(), nullable=False),
+        sa.Column("period_start", sa.Date(), nullable=False),
+        sa.Column("nights", sa.Integer(), nullable=False),
+        *[sa.Column(f"sum_{metric}", sa.Float(), nullable=False) for metric in ROLLUP_METRICS],
+        sa.PrimaryKeyConstraint("person_id", "period", "period_start"),
+        schema=SCHEMA,
+    )
+    # Запросы по периоду за интервал дат по всем респондентам
+    op.create_index("ix_sleep_data_rollup_period_start", TABLE, ["period", "period_start"], schema=SCHEMA)
+
+    # Триггеры уровня оператора с таблицами переходов: одна операция
+    # (в том числе массовая загрузка) обновляет сводку одним запросом
+    for event, function, source, tables in TRIGGERS:
+        op.execute(trigger_function_sql(function, source, tables))
+        referencing = " ".join(
+            f"{'OLD' if table == 'old_rows' else 'NEW'} TABLE AS {table}" for table in tables)
+        op.execute(f"""
+            CREATE TRIGGER {function} AFTER {event} ON {SCHEMA}.sleep_data
+            REFERENCING {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.{function}()
+        """)
+
+    # Начальное заполнение; триггеры уже держат блокировку sleep_data до конца транзакции
+    op.execute(aggregate_sql(rows_sql(1, f"{SCHEMA}.sleep_data")))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for _, function, _, _ in reversed(TRIGGERS):
+        op.execute(f"DROP TRIGGER IF EXISTS {function} ON {SCHEMA}.sleep_data")
+        op.execute(f"DROP FUNCTION IF EXISTS {SCHEMA}.{function}()")
+    op.drop_index("ix_sleep_data_rollup_period_start", table_name=TABLE, schema=SCHEMA)
+    op.drop_table(TABLE, schema=SCHEMA)
@@ -0,0 +1,32 @@
+"""Столбец version в sleep.sleep_data для оптимистичной блокировки
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "sleep"
+TABLE = "sleep_data"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Значение по умолчанию - константа, поэтому PostgreSQL не переписывает таблицу
+    op.add_column(TABLE, sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+                  schema=SCHEMA)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column(TABLE, "version", schema=SCHEMA)
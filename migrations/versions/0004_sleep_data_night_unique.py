@@ -0,0 +1,49 @@
+"""Уникальный индекс ночи респондента sleep_data (person_id, date)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "sleep"
+TABLE = "sleep_data"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    duplicates = op.get_bind().execute(sa.text(
+        f"SELECT count(*) FROM (SELECT 1 FROM {SCHEMA}.{TABLE} "
+        f"GROUP BY person_id, date HAVING count(*) > 1) d"
+    )).scalar()
+    if duplicates:
+        # Какие записи оставить, решает пользователь, а не миграция
+        raise RuntimeError(
+            f"В {SCHEMA}.{TABLE} есть повторяющиеся ночи респондентов ({duplicates} шт.). "
+            f"Просмотрите их и удалите командой: python cli.py dedupe-sleep-data --apply")
+
+    with op.get_context().autocommit_block():
+        op.create_index("ux_sleep_data_person_id_date", TABLE, ["person_id", "date"], unique=True,
+                        schema=SCHEMA, postgresql_concurrently=True, if_not_exists=True)
+        # Уникальный индекс покрывает те же запросы, что и обычный из 0001
+        op.drop_index("ix_sleep_data_person_id_date", table_name=TABLE, schema=SCHEMA,
+                      postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index("ix_sleep_data_person_id_date", TABLE, ["person_id", "date"],
+                        schema=SCHEMA, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index("ux_sleep_data_person_id_date", table_name=TABLE, schema=SCHEMA,
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,56 @@
+"""Уведомления об изменении sleep.respondents для сброса кэша респондентов
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "sleep"
+TABLE = "respondents"
+# Должен совпадать с services.respondent_cache.RESPONDENT_CHANNEL
+CHANNEL = "respondent_changed"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Полезная нагрузка - id измененного респондента; пустая строка (TRUNCATE) - сбросить все
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION {SCHEMA}.notify_respondent_changed() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                PERFORM pg_notify('{CHANNEL}', '');
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('{CHANNEL}', OLD.id::text);
+            ELSE
+                PERFORM pg_notify('{CHANNEL}', NEW.id::text);
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    """)
+    op.execute(f"""
+        CREATE TRIGGER respondent_changed_notify AFTER UPDATE OR DELETE ON {SCHEMA}.{TABLE}
+        FOR EACH ROW EXECUTE FUNCTION {SCHEMA}.notify_respondent_changed()
+    """)
+    op.execute(f"""
+        CREATE TRIGGER respondent_truncated_notify AFTER TRUNCATE ON {SCHEMA}.{TABLE}
+        FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.notify_respondent_changed()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(f"DROP TRIGGER IF EXISTS respondent_truncated_notify ON {SCHEMA}.{TABLE}")
+    op.execute(f"DROP TRIGGER IF EXISTS respondent_changed_notify ON {SCHEMA}.{TABLE}")
+    op.execute(f"DROP FUNCTION IF EXISTS {SCHEMA}.notify_respondent_changed()")
@@ -0,0 +1,58 @@
+"""Индексы поиска респондентов: префикс фамилии и нечеткий поиск pg_trgm
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger(f"alembic.{__name__}")
+
+SCHEMA = "sleep"
+TABLE = "respondents"
+
+# Должно совпадать с repositories.respondent_repository.SEARCH_TEXT,
+# иначе планировщик не узнает выражение индекса
+SEARCH_TEXT = "lower(first_name || ' ' || last_name || ' ' || email || ' ' || country)"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    trgm_available = connection.execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar() is not None
+
+    with op.get_context().autocommit_block():
+        # lower(last_name) LIKE 'x%' при любой сортировке базы (collation)
+        op.execute(f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_respondents_last_name_lower_pattern
+            ON {SCHEMA}.{TABLE} (lower(last_name) text_pattern_ops)
+        """)
+        if not trgm_available:
+            # Поиск работает и без расширения, но без учета опечаток
+            logger.warning("Расширение pg_trgm недоступно на сервере: индекс нечеткого поиска не создан")
+            return
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_respondents_search_trgm
+            ON {SCHEMA}.{TABLE} USING gin ({SEARCH_TEXT} gin_trgm_ops)
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.ix_respondents_search_trgm")
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.ix_respondents_last_name_lower_pattern")
+    # Расширение не удаляется: им могут пользоваться другие объекты базы
@@ -0,0 +1,163 @@
+"""Секционирование sleep.sleep_data по месяцам (PARTITION BY RANGE (date))
+
+Таблица пересоздается секционированной и данные копируются в нее, поэтому
+миграция держит монопольную блокировку sleep_data до конца и на большой
+таблице требует окна обслуживания. Первичный ключ становится (id, date):
+уникальный ключ секционированной таблицы обязан включать ключ секционирования,
+уникальность id по-прежнему обеспечивает последовательность.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "sleep"
+TABLE = "sleep_data"
+OLD_TABLE = "sleep_data_unpartitioned"
+# Строки с датами вне созданных секций; их разносит ensure_sleep_data_partitions
+DEFAULT_PARTITION = "sleep_data_default"
+# Должна совпадать с repositories.sleep_data_repository.ENSURE_PARTITIONS_FUNCTION
+ENSURE_FUNCTION = "ensure_sleep_data_partitions"
+# Секции создаются заранее на столько месяцев вперед от текущего
+MONTHS_AHEAD = 3
+
+# Столбцы фильтров с B-tree индексами (как в 0001)
+RANGE_FILTER_COLUMNS = [
+    "sleep_start_time",
+    "sleep_end_time",
+    "total_sleep_hours",
+    "sleep_quality",
+    "exercise_minutes",
+    "caffeine_intake_mg",
+    "screen_time_before_bed",
+    "work_hours",
+    "productivity_score",
+    "mood_score",
+    "stress_level",
+]
+
+# Триггеры сводной таблицы из 0002: (событие, функция, таблицы переходов)
+ROLLUP_TRIGGERS = [
+    ("INSERT", "sleep_data_rollup_insert", ["new_rows"]),
+    ("UPDATE", "sleep_data_rollup_update", ["old_rows", "new_rows"]),
+    ("DELETE", "sleep_data_rollup_delete", ["old_rows"]),
+]
+
+
+def ensure_function_sql() -> str:
+    """
+    Функция создания месячных секций за интервал [from_date, to_date].
+    Строки нужного месяца из секции по умолчанию переносятся в новую
+    секцию до ее подключения. Перенос идет мимо родительской таблицы,
+    поэтому триггеры сводной таблицы не срабатывают, и сводка остается
+    верной. Возвращает имена созданных секций
+    """
+    return f"""
+        CREATE OR REPLACE FUNCTION {SCHEMA}.{ENSURE_FUNCTION}(from_date date, to_date date)
+        RETURNS SETOF text
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            month_start date;
+            month_end date;
+            partition text;
+        BEGIN
+            FOR month_start IN
+                SELECT generate_series(date_trunc('month', from_date), date_trunc('month', to_date),
+                                       interval '1 month')::date
+            LOOP
+                partition := '{TABLE}_' || to_char(month_start, 'YYYY_MM');
+                CONTINUE WHEN to_regclass('{SCHEMA}.' || partition) IS NOT NULL;
+                month_end := (month_start + interval '1 month')::date;
+                EXECUTE format('CREATE TABLE {SCHEMA}.%I (LIKE {SCHEMA}.{TABLE} INCLUDING DEFAULTS)', partition);
+                EXECUTE format('WITH moved AS (DELETE FROM {SCHEMA}.{DEFAULT_PARTITION} '
+                               'WHERE date >= %L AND date < %L RETURNING *) '
+                               'INSERT INTO {SCHEMA}.%I SELECT * FROM moved',
+                               month_start, month_end, partition);
+                -- ATTACH блокирует родителя слабее, чем CREATE TABLE ... PARTITION OF
+                EXECUTE format('ALTER TABLE {SCHEMA}.{TABLE} ATTACH PARTITION {SCHEMA}.%I '
+                               'FOR VALUES FROM (%L) TO (%L)', partition, month_start, month_end);
+                RETURN NEXT partition;
+            END LOOP;
+        END
+        $$
+    """
+
+
+def create_keys_and_indexes(partitioned: bool):
+    """Ключи, индексы и триггеры sleep_data; у секционированной таблицы они наследуются секциями"""
+    primary_key = "id, date" if partitioned else "id"
+    op.execute(f"ALTER TABLE {SCHEMA}.{TABLE} ADD CONSTRAINT sleep_data_pkey PRIMARY KEY ({primary_key})")
+    op.execute(f"""
+        ALTER TABLE {SCHEMA}.{TABLE} ADD CONSTRAINT sleep_data_person_id_fkey
+        FOREIGN KEY (person_id) REFERENCES {SCHEMA}.respondents (id)
+    """)
+    op.create_index("ux_sleep_data_person_id_date", TABLE, ["person_id", "date"], unique=True, schema=SCHEMA)
+    if not partitioned:
+        # В секционированной таблице отбор по дате делает отсечение секций
+        op.create_index("ix_sleep_data_date_brin", TABLE, ["date"], schema=SCHEMA, postgresql_using="brin")
+    for column in RANGE_FILTER_COLUMNS:
+        op.create_index(f"ix_sleep_data_{column}", TABLE, [column], schema=SCHEMA)
+    for event, function, tables in ROLLUP_TRIGGERS:
+        referencing = " ".join(
+            f"{'OLD' if table == 'old_rows' else 'NEW'} TABLE AS {table}" for table in tables)
+        op.execute(f"""
+            CREATE TRIGGER {function} AFTER {event} ON {SCHEMA}.{TABLE}
+            REFERENCING {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.{function}()
+        """)
+
+
+def replace_table(partition_clause: str):
+    """
+    Переименовать sleep_data и создать на ее месте пустую таблицу с теми же
+    столбцами; индексы и триггеры старой таблицы удаляются вместе с ней
+    """
+    op.execute(f"LOCK TABLE {SCHEMA}.{TABLE} IN ACCESS EXCLUSIVE MODE")
+    op.execute(f"ALTER TABLE {SCHEMA}.{TABLE} RENAME TO {OLD_TABLE}")
+    op.execute(f"""
+        CREATE TABLE {SCHEMA}.{TABLE} (LIKE {SCHEMA}.{OLD_TABLE} INCLUDING DEFAULTS)
+        {partition_clause}
+    """)
+
+
+def copy_and_drop_old_table():
+    # Триггеров у новой таблицы еще нет: сводная таблица не пересчитывается
+    op.execute(f"INSERT INTO {SCHEMA}.{TABLE} SELECT * FROM {SCHEMA}.{OLD_TABLE}")
+    op.execute(f"ALTER SEQUENCE {SCHEMA}.sleep_data_id_seq OWNED BY {SCHEMA}.{TABLE}.id")
+    op.execute(f"DROP TABLE {SCHEMA}.{OLD_TABLE}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    replace_table("PARTITION BY RANGE (date)")
+    op.execute(f"CREATE TABLE {SCHEMA}.{DEFAULT_PARTITION} PARTITION OF {SCHEMA}.{TABLE} DEFAULT")
+    op.execute(ensure_function_sql())
+    # Секции от первого месяца с данными до последнего, но не меньше MONTHS_AHEAD месяцев вперед
+    op.execute(f"""
+        SELECT {SCHEMA}.{ENSURE_FUNCTION}(
+            coalesce(min(date), current_date),
+            greatest(max(date), (current_date + interval '{MONTHS_AHEAD} months')::date))
+        FROM {SCHEMA}.{OLD_TABLE}
+    """)
+    copy_and_drop_old_table()
+    create_keys_and_indexes(partitioned=True)
+    op.execute(f"ANALYZE {SCHEMA}.{TABLE}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    replace_table("")
+    copy_and_drop_old_table()
+    op.execute(f"DROP FUNCTION IF EXISTS {SCHEMA}.{ENSURE_FUNCTION}(date, date)")
+    create_keys_and_indexes(partitioned=False)
+    op.execute(f"ANALYZE {SCHEMA}.{TABLE}")
@@ -0,0 +1,90 @@
+"""Индексы (столбец, id) для сортировки sleep_data по заголовку таблицы
+
+Страница в порядке (столбец, id) с keyset-условием читается из такого
+индекса без сортировки всей выборки. Индексы заменяют одностолбцовые
+ix_sleep_data_* из 0007: условия диапазона по столбцу они тоже обслуживают.
+Индексы секций строятся CONCURRENTLY и подключаются к индексу родителя,
+запись в таблицу на это время не блокируется.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from typing import List, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "sleep"
+TABLE = "sleep_data"
+
+# Столбцы таблицы на вкладке данных о сне, кроме id (его порядок дает первичный ключ)
+SORT_COLUMNS = [
+    "date",
+    "person_id",
+    "sleep_start_time",
+    "sleep_end_time",
+    "total_sleep_hours",
+    "sleep_quality",
+    "exercise_minutes",
+    "caffeine_intake_mg",
+    "screen_time_before_bed",
+    "work_hours",
+    "productivity_score",
+    "mood_score",
+    "stress_level",
+]
+# Одностолбцовые индексы из 0007 (у date его не было: отбор по дате отсекает секции)
+SINGLE_COLUMNS = SORT_COLUMNS[2:]
+
+
+def partitions() -> List[str]:
+    """Секции sleep_data, включая секцию по умолчанию"""
+    return list(op.get_bind().execute(sa.text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_namespace ns ON ns.oid = parent.relnamespace
+        WHERE ns.nspname = :schema AND parent.relname = :table
+        ORDER BY child.relname
+    """), {"schema": SCHEMA, "table": TABLE}).scalars())
+
+
+def create_partitioned_index(name: str, columns: str):
+    """
+    Индекс секционированной таблицы без долгой блокировки: пустой индекс
+    родителя (ON ONLY), затем CONCURRENTLY индекс каждой секции и ATTACH.
+    Индекс родителя становится действительным, когда подключены все секции
+    """
+    op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {SCHEMA}.{TABLE} ({columns})")
+    for partition in partitions():
+        child = f"{partition}_{name.removeprefix('ix_sleep_data_')}"
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {SCHEMA}.{partition} ({columns})")
+        op.execute(f"ALTER INDEX {SCHEMA}.{name} ATTACH PARTITION {SCHEMA}.{child}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for column in SORT_COLUMNS:
+            create_partitioned_index(f"ix_sleep_data_{column}_id", f"{column}, id")
+        # DROP INDEX CONCURRENTLY для секционированных индексов не поддерживается
+        for column in SINGLE_COLUMNS:
+            op.execute(f"DROP INDEX IF EXISTS {SCHEMA}.ix_sleep_data_{column}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for column in SINGLE_COLUMNS:
+            create_partitioned_index(f"ix_sleep_data_{column}", column)
+        for column in SORT_COLUMNS:
+            op.execute(f"DROP INDEX IF EXISTS {SCHEMA}.ix_sleep_data_{column}_id")
@@ -0,0 +1,72 @@
+"""Блокировка в ensure_sleep_data_partitions от одновременного создания секций
+
+Две загрузки с одним новым месяцем могли обе не найти секцию (to_regclass)
+и создавать ее одновременно; вторая падала на CREATE TABLE. Функция теперь
+берет транзакционную рекомендательную блокировку (pg_advisory_xact_lock):
+вызовы выполняются по очереди, и второй видит уже созданную секцию.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "sleep"
+TABLE = "sleep_data"
+DEFAULT_PARTITION = "sleep_data_default"
+# Должна совпадать с repositories.sleep_data_repository.ENSURE_PARTITIONS_FUNCTION
+ENSURE_FUNCTION = "ensure_sleep_data_partitions"
+
+
+def ensure_function_sql(locked: bool) -> str:
+    """Функция из 0007; при locked вызовы в разных транзакциях идут по очереди"""
+    lock = f"PERFORM pg_advisory_xact_lock(hashtext('{SCHEMA}.{ENSURE_FUNCTION}'));" if locked else ""
+    return f"""
+        CREATE OR REPLACE FUNCTION {SCHEMA}.{ENSURE_FUNCTION}(from_date date, to_date date)
+        RETURNS SETOF text
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            month_start date;
+            month_end date;
+            partition text;
+        BEGIN
+            {lock}
+            FOR month_start IN
+                SELECT generate_series(date_trunc('month', from_date), date_trunc('month', to_date),
+                                       interval '1 month')::date
+            LOOP
+                partition := '{TABLE}_' || to_char(month_start, 'YYYY_MM');
+                CONTINUE WHEN to_regclass('{SCHEMA}.' || partition) IS NOT NULL;
+                month_end := (month_start + interval '1 month')::date;
+                EXECUTE format('CREATE TABLE {SCHEMA}.%I (LIKE {SCHEMA}.{TABLE} INCLUDING DEFAULTS)', partition);
+                EXECUTE format('WITH moved AS (DELETE FROM {SCHEMA}.{DEFAULT_PARTITION} '
+                               'WHERE date >= %L AND date < %L RETURNING *) '
+                               'INSERT INTO {SCHEMA}.%I SELECT * FROM moved',
+                               month_start, month_end, partition);
+                -- ATTACH блокирует родителя слабее, чем CREATE TABLE ... PARTITION OF
+                EXECUTE format('ALTER TABLE {SCHEMA}.{TABLE} ATTACH PARTITION {SCHEMA}.%I '
+                               'FOR VALUES FROM (%L) TO (%L)', partition, month_start, month_end);
+                RETURN NEXT partition;
+            END LOOP;
+        END
+        $$
+    """
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(ensure_function_sql(locked=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(ensure_function_sql(locked=False))
@@ -9,6 +9,7 @@ class SleepData(SQLModel, table=True):
     __tablename__ = "sleep_data"
     __table_args__ = {"schema": "sleep"}
 
+    # В базе первичный ключ (id, date) из-за секционирования по date; id уникален по последовательности
     id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"name": "id"})
     sleep_date: date = Field(sa_column_kwargs={"name": "date"})
     person_id: int = Field(foreign_key="sleep.respondents.id", sa_column_kwargs={"name": "person_id"})
@@ -26,4 +27,6 @@ class SleepData(SQLModel, table=True):
     work_hours: float
     productivity_score: int
     mood_score: int
-    stress_level: int
\ No newline at end of file
+    stress_level: int
+    # Номер версии строки: увеличивается при каждом обновлении (оптимистичная блокировка)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
\ No newline at end of file
@@ -0,0 +1,26 @@
+from sqlmodel import SQLModel, Field
+from datetime import date
+
+
+class SleepDataRollup(SQLModel, table=True):
+    """
+    Суммы показателей сна респондента за день, неделю или месяц.
+    Таблица поддерживается триггерами на sleep_data, средние - сумма / nights
+    """
+    __tablename__ = "sleep_data_rollup"
+    __table_args__ = {"schema": "sleep"}
+
+    person_id: int = Field(primary_key=True)
+    period: str = Field(primary_key=True)
+    period_start: date = Field(primary_key=True)
+    nights: int
+
+    sum_total_sleep_hours: float
+    sum_sleep_quality: float
+    sum_exercise_minutes: float
+    sum_caffeine_intake_mg: float
+    sum_screen_time_before_bed: float
+    sum_work_hours: float
+    sum_productivity_score: float
+    sum_mood_score: float
+    sum_stress_level: float
@@ -1,59 +1,135 @@
 """Модуль с репозиторием для работы с респондентами."""
-from sqlalchemy import func, false
-from sqlmodel import Session, select
+from typing import List, NamedTuple
+from sqlalchemy import func, false, literal_column, or_, text
+from sqlmodel import select
+from config.sql_metrics import instrumented
 from models.respondent import Respondent
 
 
+class RespondentRow(NamedTuple):
+    """Респондент только для чтения (списки и таблицы); поля как у Respondent"""
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    gender: str
+    country: str
+    age: int
+
+
+# Столбцы Respondent в порядке полей RespondentRow
+ROW_COLUMNS = [getattr(Respondent, name) for name in RespondentRow._fields]
+
+# Текст для нечеткого поиска; совпадает с выражением индекса
+# ix_respondents_search_trgm (миграция 0006)
+SEARCH_TEXT = "lower(first_name || ' ' || last_name || ' ' || email || ' ' || country)"
+# Минимальное сходство слова запроса с текстом респондента (pg_trgm word_similarity)
+FUZZY_THRESHOLD = 0.4
+# Короче трех символов триграммы бесполезны: ищем только по началу фамилии
+MIN_FUZZY_LENGTH = 3
+
+
 class RespondentRepository:
     """Репозиторий для операций с моделью Respondent."""
-    def __init__(self,session:Session):
-        """Инициализация сессии базы данных."""
-        self.session=session
+    def __init__(self, session_scope):
+        """Инициализация фабрики сессий: каждая операция работает в своей сессии."""
+        self.session_scope = session_scope
+        self._has_trgm = None
 
-    def get_all(self):
-        """Получить всех респондентов."""
-        return self.session.exec(select(Respondent)).all()
+    @instrumented
+    def get_all(self, as_rows=False):
+        """Получить всех респондентов (as_rows=True - RespondentRow вместо объектов модели)."""
+        return self._fetch(select(Respondent), as_rows)
 
 
+    @instrumented
     def create(self, **kwargs):
         """Создать нового респондента."""
         respondent = Respondent(**kwargs)
-        self.session.add(respondent)
-        self.session.commit()
-        self.session.refresh(respondent)
-        return respondent
+        with self.session_scope() as session:
+            session.add(respondent)
+            session.commit()
+            session.refresh(respondent)
+            return respondent
 
+    @instrumented
     def update(self,respondent_id, **kwargs):
         """Обновить данные респондента по ID."""
-        respondent = self.session.get(Respondent, respondent_id)
-        if not respondent:
-            return None
-        for key, value in kwargs.items():
-            setattr(respondent, key, value)
-        self.session.commit()
-        self.session.refresh(respondent)
-        return respondent
+        with self.session_scope() as session:
+            respondent = session.get(Respondent, respondent_id)
+            if not respondent:
+                return None
+            for key, value in kwargs.items():
+                setattr(respondent, key, value)
+            session.commit()
+            session.refresh(respondent)
+            return respondent
 
+    @instrumented
     def delete(self, respondent_id: int):
         """Удалить респондента по ID."""
-        respondent=self.search_resp_by_id(respondent_id)
-        if respondent:
-            self.session.delete(respondent)
-            self.session.commit()
+        self.delete_resp_by_id(respondent_id)
 
-    def search_resp_by_last_name(self, last_name):
+    @instrumented
+    def search_resp_by_last_name(self, last_name, as_rows=False):
         """Поиск респондента по фамилии"""
+        # LIKE 'x%' по индексу ix_respondents_last_name_lower_pattern; % и _ в вводе - обычные символы
         query = select(Respondent).where(
-            func.lower(Respondent.last_name).startswith(last_name.lower()))
-        return self.session.exec(query).all()
+            func.lower(Respondent.last_name).startswith(last_name.lower(), autoescape=True))
+        return self._fetch(query, as_rows)
+
+    @instrumented
+    def search_respondents(self, term: str, limit: int) -> List[RespondentRow]:
+        """
+        Поиск по мере ввода: совпадения по началу фамилии, затем нечеткие
+        (с опечатками) по имени, фамилии, email и стране в порядке убывания
+        сходства. Без расширения pg_trgm вместо нечеткого поиска - подстрока.
+        """
+        term = term.strip().lower()
+        prefix = func.lower(Respondent.last_name).startswith(term, autoescape=True)
+        search_text = literal_column(SEARCH_TEXT)
+        query = select(*ROW_COLUMNS)
+        with self.session_scope() as session:
+            if len(term) < MIN_FUZZY_LENGTH:
+                query = query.where(prefix)
+            elif self._trgm_enabled(session):
+                # порог действует до конца транзакции
+                session.execute(select(func.set_config(
+                    "pg_trgm.word_similarity_threshold", str(FUZZY_THRESHOLD), True)))
+                query = query.where(or_(prefix, search_text.op("%>")(term)))
+                query = query.order_by(prefix.desc(), func.word_similarity(term, search_text).desc())
+            else:
+                query = query.where(or_(prefix, search_text.contains(term, autoescape=True)))
+                query = query.order_by(prefix.desc())
+            query = query.order_by(Respondent.last_name, Respondent.id).limit(limit)
+            return [RespondentRow._make(row) for row in session.execute(query)]
 
+    @instrumented
     def search_resp_by_id(self, resp_id):
-        return self.session.get(Respondent, resp_id)
+        with self.session_scope() as session:
+            return session.get(Respondent, resp_id)
 
+    @instrumented
     def delete_resp_by_id(self, resp_id):
-        respondent = self.search_resp_by_id(resp_id)
-        if not respondent:
-            return False
-        self.session.delete(respondent)
-        self.session.commit()
-        return True
+        with self.session_scope() as session:
+            respondent = session.get(Respondent, resp_id)
+            if not respondent:
+                return False
+            session.delete(respondent)
+            session.commit()
+            return True
+
+    def _trgm_enabled(self, session) -> bool:
+        """Установлено ли расширение pg_trgm (проверяется один раз)"""
+        if self._has_trgm is None:
+            self._has_trgm = session.execute(
+                text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")).scalar()
+        return self._has_trgm
+
+    def _fetch(self, query, as_rows):
+        """Выполнить выборку респондентов; при as_rows читаются только значения столбцов"""
+        with self.session_scope() as session:
+            if not as_rows:
+                return session.exec(query).all()
+            query = query.with_only_columns(*ROW_COLUMNS)
+            return [RespondentRow._make(row) for row in session.execute(query)]
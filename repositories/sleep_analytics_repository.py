@@ -0,0 +1,237 @@
+"""Модуль с репозиторием агрегатов по данным о сне."""
+from datetime import date
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Date, Integer, cast, func
+from sqlalchemy.dialects.postgresql import array
+from sqlmodel import select
+
+from config.sql_metrics import instrumented
+from models.respondent import Respondent
+from models.sleep_data import SleepData
+from models.sleep_data_rollup import SleepDataRollup
+from repositories.sleep_data_filter import SleepDataFilter, resolve_filter
+from repositories.sleep_data_repository import SleepDataRepository
+
+# Числовые столбцы SleepData, по которым считаются агрегаты
+METRIC_COLUMNS = [
+    "sleep_start_time",
+    "sleep_end_time",
+    "total_sleep_hours",
+    "sleep_quality",
+    "exercise_minutes",
+    "caffeine_intake_mg",
+    "screen_time_before_bed",
+    "work_hours",
+    "productivity_score",
+    "mood_score",
+    "stress_level",
+]
+
+# Группировки по атрибутам респондента (требуют соединения с respondents)
+RESPONDENT_GROUPS = ("country", "gender", "age_band")
+# Группировки по дате: поле для date_trunc
+DATE_GROUPS = ("day", "week", "month", "quarter", "year")
+GROUP_BY_OPTIONS = ("respondent",) + RESPONDENT_GROUPS + DATE_GROUPS
+
+# Ширина возрастной группы, лет
+AGE_BAND_WIDTH = 10
+
+DEFAULT_PERCENTILES = (0.25, 0.5, 0.75)
+
+# Периоды сводной таблицы sleep_data_rollup и показатели, средние которых она хранит
+ROLLUP_PERIODS = ("day", "week", "month")
+ROLLUP_METRICS = [
+    "total_sleep_hours",
+    "sleep_quality",
+    "exercise_minutes",
+    "caffeine_intake_mg",
+    "screen_time_before_bed",
+    "work_hours",
+    "productivity_score",
+    "mood_score",
+    "stress_level",
+]
+
+
+class MetricSummary(NamedTuple):
+    """Агрегаты одного столбца в одной группе (group - None без группировки)"""
+    group: Any
+    count: int
+    mean: Optional[float]
+    stddev: Optional[float]
+    min: Optional[float]
+    max: Optional[float]
+    percentiles: Tuple[float, ...]
+
+
+class RollupRow(NamedTuple):
+    """Средние показатели за период (person_id - None для всех респондентов)"""
+    person_id: Optional[int]
+    period_start: date
+    nights: int
+    averages: Dict[str, float]
+
+
+class SleepAnalyticsRepository:
+    """Агрегирующие запросы к sleep_data; вычисления выполняются в PostgreSQL"""
+
+    def __init__(self, session_scope):
+        self.session_scope = session_scope
+
+    @instrumented
+    def summarize(
+            self,
+            metric: str,
+            group_by: Optional[str] = None,
+            percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+            spec: Optional[SleepDataFilter] = None,
+            **filters
+    ) -> List[MetricSummary]:
+        """
+        Количество, среднее, стандартное отклонение, минимум, максимум и
+        перцентили столбца metric по записям, подходящим под фильтр (spec
+        или параметры get_sleep_data_with_parameters).
+
+        group_by - одна из GROUP_BY_OPTIONS или None для итога по всей выборке.
+        Для age_band группа - нижняя граница возрастного интервала, для
+        дат - начало периода.
+        """
+        column = self._metric_column(metric)
+        group = self._group_expression(group_by)
+
+        aggregates = [
+            func.count(column),
+            func.avg(column),
+            func.stddev_samp(column),
+            func.min(column),
+            func.max(column),
+        ]
+        if percentiles:
+            aggregates.append(func.percentile_cont(array(list(percentiles))).within_group(column))
+
+        if group is None:
+            query = select(*aggregates)
+        else:
+            query = select(group, *aggregates).group_by(group).order_by(group)
+        query = query.select_from(SleepData)
+        if group_by in RESPONDENT_GROUPS:
+            query = query.join(Respondent, Respondent.id == SleepData.person_id)
+        spec = resolve_filter(spec, filters)
+        query = SleepDataRepository.apply_filter(query, spec)
+
+        with self.session_scope() as session:
+            rows = session.execute(query, spec.params()).all()
+
+        summaries = []
+        for row in rows:
+            if group is None:
+                row = (None, *row)
+            group_value, count, mean, stddev, minimum, maximum = row[:6]
+            summaries.append(MetricSummary(
+                group=group_value,
+                count=count,
+                mean=float(mean) if mean is not None else None,
+                stddev=float(stddev) if stddev is not None else None,
+                min=minimum,
+                max=maximum,
+                percentiles=tuple(row[6] or ()) if percentiles else (),
+            ))
+        return summaries
+
+    @instrumented
+    def get_rollups(
+            self,
+            period: str,
+            start: Optional[date] = None,
+            end: Optional[date] = None,
+            respondent_id: int = 0,
+            per_respondent: bool = True,
+            metrics: Sequence[str] = ROLLUP_METRICS
+    ) -> List[RollupRow]:
+        """
+        Средние показатели по периодам из сводной таблицы, без чтения sleep_data.
+
+        start/end ограничивают начало периода включительно. При
+        per_respondent=False суммы всех респондентов объединяются, и
+        средние считаются по всем ночам периода.
+        """
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f"Неизвестный период: {period}")
+        for metric in metrics:
+            if metric not in ROLLUP_METRICS:
+                raise ValueError(f"Показатель отсутствует в сводной таблице: {metric}")
+
+        nights = SleepDataRollup.nights
+        sums = [getattr(SleepDataRollup, f"sum_{metric}") for metric in metrics]
+        if per_respondent:
+            query = select(SleepDataRollup.person_id, SleepDataRollup.period_start, nights, *sums)
+            query = query.order_by(SleepDataRollup.person_id, SleepDataRollup.period_start)
+        else:
+            nights = func.sum(nights)
+            query = select(SleepDataRollup.period_start, nights, *[func.sum(column) for column in sums])
+            query = query.group_by(SleepDataRollup.period_start).order_by(SleepDataRollup.period_start)
+
+        query = query.where(SleepDataRollup.period == period)
+        if respondent_id > 0:
+            query = query.where(SleepDataRollup.person_id == respondent_id)
+        if start is not None:
+            query = query.where(SleepDataRollup.period_start >= start)
+        if end is not None:
+            query = query.where(SleepDataRollup.period_start <= end)
+
+        with self.session_scope() as session:
+            rows = session.execute(query).all()
+
+        result = []
+        for row in rows:
+            if not per_respondent:
+                row = (None, *row)
+            person_id, period_start, count = row[:3]
+            averages = {metric: value / count for metric, value in zip(metrics, row[3:])}
+            result.append(RollupRow(person_id, period_start, count, averages))
+        return result
+
+    @instrumented
+    def rebuild_rollups(self) -> int:
+        """
+        Полный пересчет сводной таблицы из sleep_data одной транзакцией.
+        Возвращает число строк сводной таблицы
+        """
+        sum_columns = ", ".join(f"sum_{metric}" for metric in ROLLUP_METRICS)
+        sums = ", ".join(f"sum(s.{metric})" for metric in ROLLUP_METRICS)
+        periods = ", ".join(f"('{period}')" for period in ROLLUP_PERIODS)
+        with self.session_scope() as session:
+            connection = session.connection()
+            # TRUNCATE ждет завершения транзакций, уже изменивших сводку триггером
+            connection.exec_driver_sql("TRUNCATE sleep.sleep_data_rollup")
+            result = connection.exec_driver_sql(f"""
+                INSERT INTO sleep.sleep_data_rollup (person_id, period, period_start, nights, {sum_columns})
+                SELECT s.person_id, p.period, date_trunc(p.period, s.date)::date, count(*), {sums}
+                FROM sleep.sleep_data s CROSS JOIN (VALUES {periods}) AS p(period)
+                GROUP BY 1, 2, 3
+            """)
+            return result.rowcount
+
+    @staticmethod
+    def _metric_column(metric: str):
+        if metric not in METRIC_COLUMNS:
+            raise ValueError(f"Неизвестный показатель: {metric}")
+        return getattr(SleepData, metric)
+
+    @staticmethod
+    def _group_expression(group_by: Optional[str]):
+        """Выражение группировки по имени из GROUP_BY_OPTIONS"""
+        if group_by is None:
+            return None
+        if group_by == "respondent":
+            return SleepData.person_id
+        if group_by == "country":
+            return Respondent.country
+        if group_by == "gender":
+            return Respondent.gender
+        if group_by == "age_band":
+            return cast(Respondent.age / AGE_BAND_WIDTH, Integer) * AGE_BAND_WIDTH
+        if group_by in DATE_GROUPS:
+            return cast(func.date_trunc(group_by, SleepData.sleep_date), Date)
+        raise ValueError(f"Неизвестная группировка: {group_by}")
@@ -0,0 +1,236 @@
+"""Спецификация фильтра данных о сне и ее перевод в условия SQL."""
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, any_, bindparam, or_
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from models.sleep_data import SleepData
+
+# Диапазонные параметры прежнего API: (атрибут SleepData, нижняя граница, верхняя граница)
+LEGACY_RANGE_PARAMS = [
+    ("sleep_start_time", "sl_start_time_start", "sl_start_time_end"),  # время начала сна
+    ("sleep_end_time", "sl_end_time_start", "sl_end_time_end"),  # время окончания сна
+    ("total_sleep_hours", "sl_total_time_start", "sl_total_time_end"),  # общее время сна
+    ("sleep_quality", "sl_quality_start", "sl_quality_end"),  # качество сна
+    ("exercise_minutes", "exercise_start", "exercise_end"),  # время упражнений
+    ("caffeine_intake_mg", "coffee_start", "coffee_end"),  # потребление кофеина
+    ("screen_time_before_bed", "screen_time_start", "screen_time_end"),  # время у экрана
+    ("work_hours", "work_time_start", "work_time_end"),  # рабочее время
+    ("productivity_score", "productivity_start", "productivity_end"),  # продуктивность
+    ("mood_score", "mood_start", "mood_end"),  # настроение
+    ("stress_level", "stress_start", "stress_end"),  # уровень стресса
+]
+
+# Виды условий
+EQ = "eq"
+RANGE = "range"
+IN = "in"
+
+
+class Range(NamedTuple):
+    """Диапазон значений включительно; None - граница не задана"""
+    low: Any = None
+    high: Any = None
+
+
+class SleepDataFilter:
+    """
+    Условия выборки sleep_data.
+
+    Условия по атрибутам SleepData передаются именованными аргументами:
+    значение - равенство, Range - диапазон, список/кортеж/множество - IN.
+    None означает, что условие не задано, поэтому 0 - обычное значение.
+    any_of - группы-фильтры, из которых должна выполниться хотя бы одна
+    (условия внутри группы объединяются через AND). order_by - атрибуты
+    сортировки, "-атрибут" - по убыванию.
+
+        SleepDataFilter(person_id=[1, 2], sleep_date=Range(date(2024, 1, 1), None),
+                        any_of=[SleepDataFilter(stress_level=0), SleepDataFilter(mood_score=Range(8))],
+                        order_by=["-sleep_date"])
+
+    Фильтры с одинаковыми условиями равны и годятся как ключ кэша.
+    """
+    __slots__ = ("conditions", "any_of", "order_by")
+
+    def __init__(self, any_of: Iterable["SleepDataFilter"] = (), order_by: Iterable[str] = (), **conditions):
+        normalized = []
+        for attr, value in conditions.items():
+            _check_attr(attr)
+            condition = _normalize(value)
+            if condition is not None:
+                normalized.append((attr, condition))
+        self.conditions: Tuple[Tuple[str, Tuple[str, Any]], ...] = tuple(sorted(normalized, key=lambda c: c[0]))
+        self.any_of: Tuple["SleepDataFilter", ...] = tuple(group for group in any_of if not group.is_empty())
+        for name in order_by:
+            _check_attr(name.lstrip("-"))
+        self.order_by: Tuple[str, ...] = tuple(order_by)
+
+    @classmethod
+    def from_legacy(cls, respondent_id: int = 0, **bounds) -> "SleepDataFilter":
+        """
+        Фильтр из параметров get_sleep_data_with_parameters, где 0 - параметр не задан
+        """
+        known = {param for _, start, end in LEGACY_RANGE_PARAMS for param in (start, end)}
+        unknown = set(bounds) - known
+        if unknown:
+            raise TypeError(f"Неизвестные параметры фильтра: {', '.join(sorted(unknown))}")
+        conditions = {}
+        if respondent_id and respondent_id > 0:
+            conditions["person_id"] = respondent_id
+        for attr, start_param, end_param in LEGACY_RANGE_PARAMS:
+            start, end = bounds.get(start_param) or 0, bounds.get(end_param) or 0
+            if start > 0 or end > 0:
+                conditions[attr] = Range(start if start > 0 else None, end if end > 0 else None)
+        return cls(**conditions)
+
+    def is_empty(self) -> bool:
+        """Нет ни одного условия (выборка всей таблицы)"""
+        return not self.conditions and not self.any_of
+
+    def with_order(self, *order_by: str) -> "SleepDataFilter":
+        """Тот же фильтр с другой сортировкой"""
+        copy = object.__new__(SleepDataFilter)
+        copy.conditions, copy.any_of = self.conditions, self.any_of
+        for name in order_by:
+            _check_attr(name.lstrip("-"))
+        copy.order_by = tuple(order_by)
+        return copy
+
+    def shape(self) -> Tuple:
+        """
+        Форма фильтра: атрибуты и виды условий без значений. Фильтры одной
+        формы компилируются в один и тот же запрос с разными параметрами
+        """
+        return (
+            tuple((attr, kind, _range_sides(value) if kind == RANGE else None)
+                  for attr, (kind, value) in self.conditions),
+            tuple(group.shape()[:2] for group in self.any_of),
+            self.order_by,
+        )
+
+    def params(self, prefix: str = "f_") -> Dict[str, Any]:
+        """Значения параметров для запроса из where_clauses(shape)"""
+        params = {}
+        for attr, (kind, value) in self.conditions:
+            name = f"{prefix}{attr}"
+            if kind == RANGE:
+                if value.low is not None:
+                    params[f"{name}_low"] = value.low
+                if value.high is not None:
+                    params[f"{name}_high"] = value.high
+            elif kind == IN:
+                params[name] = list(value)
+            else:
+                params[name] = value
+        for i, group in enumerate(self.any_of):
+            params.update(group.params(f"{prefix}g{i}_"))
+        return params
+
+    def matches(self, values: Mapping[str, Any]) -> bool:
+        """
+        Может ли запись со значениями values (атрибуты SleepData) попасть
+        в выборку. Атрибуты, которых нет в values, считаются неизвестными
+        и запись не исключают
+        """
+        for attr, (kind, expected) in self.conditions:
+            value = values.get(attr)
+            if value is None:
+                continue
+            if kind == EQ and value != expected:
+                return False
+            if kind == IN and value not in expected:
+                return False
+            if kind == RANGE and ((expected.low is not None and value < expected.low)
+                                  or (expected.high is not None and value > expected.high)):
+                return False
+        if self.any_of and not any(group.matches(values) for group in self.any_of):
+            return False
+        return True
+
+    def _key(self):
+        return self.conditions, self.any_of, self.order_by
+
+    def __eq__(self, other):
+        return isinstance(other, SleepDataFilter) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        parts = [f"{attr}={value!r}" for attr, (_, value) in self.conditions]
+        if self.any_of:
+            parts.append(f"any_of={list(self.any_of)!r}")
+        if self.order_by:
+            parts.append(f"order_by={list(self.order_by)!r}")
+        return f"SleepDataFilter({', '.join(parts)})"
+
+
+def resolve_filter(spec: Optional[SleepDataFilter], legacy: Dict[str, Any]) -> SleepDataFilter:
+    """Фильтр из спецификации или из параметров прежнего API (не одновременно)"""
+    if spec is None:
+        return SleepDataFilter.from_legacy(**legacy)
+    if legacy:
+        raise TypeError("Фильтр задается либо SleepDataFilter, либо параметрами, но не вместе")
+    return spec
+
+
+@lru_cache(maxsize=256)
+def where_clauses(shape: Tuple, prefix: str = "f_") -> tuple:
+    """
+    Условия WHERE для формы фильтра с именованными параметрами (значения -
+    SleepDataFilter.params). Строятся один раз на форму
+    """
+    conditions, groups, _ = shape
+    clauses = []
+    for attr, kind, sides in conditions:
+        column = getattr(SleepData, attr)
+        name = f"{prefix}{attr}"
+        if kind == RANGE:
+            has_low, has_high = sides
+            if has_low:
+                clauses.append(column >= bindparam(f"{name}_low", type_=column.type))
+            if has_high:
+                clauses.append(column <= bindparam(f"{name}_high", type_=column.type))
+        elif kind == IN:
+            # = ANY(массив): текст запроса не зависит от длины списка
+            clauses.append(column == any_(bindparam(name, type_=ARRAY(column.type))))
+        else:
+            clauses.append(column == bindparam(name, type_=column.type))
+    if groups:
+        clauses.append(or_(*[
+            and_(*where_clauses((group_conditions, group_groups, ()), f"{prefix}g{i}_"))
+            for i, (group_conditions, group_groups) in enumerate(groups)
+        ]))
+    return tuple(clauses)
+
+
+def order_clauses(shape: Tuple) -> List:
+    """Сортировка формы фильтра; по умолчанию и при равенстве - по id"""
+    clauses = []
+    for name in shape[2]:
+        column = getattr(SleepData, name.lstrip("-"))
+        clauses.append(column.desc() if name.startswith("-") else column)
+    clauses.append(SleepData.id)
+    return clauses
+
+
+def _check_attr(attr: str):
+    if attr not in SleepData.__fields__:
+        raise ValueError(f"Неизвестный столбец: {attr}")
+
+
+def _normalize(value) -> Optional[Tuple[str, Any]]:
+    if value is None:
+        return None
+    if isinstance(value, Range):
+        if value.low is None and value.high is None:
+            return None
+        return RANGE, value
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return IN, tuple(sorted(set(value)))
+    return EQ, value
+
+
+def _range_sides(value: Range) -> Tuple[bool, bool]:
+    return value.low is not None, value.high is not None
@@ -1,46 +1,548 @@
-from sqlalchemy.orm import Session
+import csv
+import io
+from psycopg2 import errorcodes, errors
+from psycopg2.extras import execute_values
+from sqlalchemy import Float, Integer, and_, bindparam, delete, func, text, tuple_, update
+from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlmodel import select
-from typing import List, Optional
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+from config.query_cancel import current_cancel_handle
+from config.sql_metrics import instrumented
+from exception.exceptions import (DuplicateSleepDataException, QueryCancelledException,
+                                  RespondentNotFoundException, StaleDataException)
+from functools import lru_cache
 from models.sleep_data import SleepData
+from repositories.sleep_data_filter import (LEGACY_RANGE_PARAMS, SleepDataFilter, order_clauses, resolve_filter,
+                                           where_clauses)
 
+DEFAULT_PAGE_SIZE = 1000
+
+# Числовые столбцы с диапазонными фильтрами, для которых считаются гистограммы
+FACET_COLUMNS = [attr for attr, _, _ in LEGACY_RANGE_PARAMS]
+DEFAULT_FACET_BUCKETS = 10
+
+# Оценке планировщика верим, если она дальше этого множителя от порога
+# estimate_sleep_data_count; ближе к порогу строки считаются точно
+ESTIMATE_MARGIN = 10
+
+# Столбцы sleep.sleep_data, заполняемые при массовой загрузке (в порядке COPY)
+COPY_COLUMNS = [
+    "person_id",
+    "date",
+    "sleep_start_time",
+    "sleep_end_time",
+    "total_sleep_hours",
+    "sleep_quality",
+    "exercise_minutes",
+    "caffeine_intake_mg",
+    "screen_time_before_bed",
+    "work_hours",
+    "productivity_score",
+    "mood_score",
+    "stress_level",
+]
+
+_STAGING_TABLE_DDL = """
+CREATE TEMP TABLE sleep_data_staging (
+    ord bigserial,
+    person_id integer NOT NULL,
+    date date NOT NULL,
+    sleep_start_time double precision NOT NULL,
+    sleep_end_time double precision NOT NULL,
+    total_sleep_hours double precision NOT NULL,
+    sleep_quality integer NOT NULL,
+    exercise_minutes integer NOT NULL,
+    caffeine_intake_mg integer NOT NULL,
+    screen_time_before_bed integer NOT NULL,
+    work_hours double precision NOT NULL,
+    productivity_score integer NOT NULL,
+    mood_score integer NOT NULL,
+    stress_level integer NOT NULL
+) ON COMMIT DROP
+"""
+
+# Ключ ночи: у респондента одна запись на дату (уникальный индекс)
+NIGHT_KEY = ("person_id", "date")
+_VALUE_COLUMNS = [column for column in COPY_COLUMNS if column not in NIGHT_KEY]
+
+# Слияние по ключу ночи: существующая запись обновляется, только если
+# значения действительно изменились, поэтому повторная загрузка ничего не пишет
+_ON_CONFLICT_SQL = (
+    f"ON CONFLICT ({', '.join(NIGHT_KEY)}) DO UPDATE SET "
+    + ", ".join(f"{column} = EXCLUDED.{column}" for column in _VALUE_COLUMNS)
+    + ", version = sleep_data.version + 1 "
+    + f"WHERE ({', '.join(f'sleep_data.{column}' for column in _VALUE_COLUMNS)}) "
+    + f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in _VALUE_COLUMNS)})"
+)
+
+# Сколько записей в одном INSERT ... VALUES при upsert
+UPSERT_PAGE_SIZE = 1000
+
+# Сколько строк COPY между вызовами progress_callback
+COPY_PROGRESS_STEP = 50000
+
+# Атрибуты SleepData, возвращаемые UPDATE ... RETURNING
+MODEL_FIELDS = [name for name in SleepData.__fields__ if name != "respondent"]
+
+# Сколько строк за раз читается из серверного курсора
+STREAM_BATCH_SIZE = 5000
+
+# Функция создания месячных секций sleep_data (миграция 0007)
+ENSURE_PARTITIONS_FUNCTION = "sleep.ensure_sleep_data_partitions"
+
+# Токен страницы: значение столбца сортировки и id последней строки
+PageToken = Tuple[Any, int]
+
+
+class SleepDataRow(NamedTuple):
+    """
+    Запись о сне только для чтения: значения столбцов без объекта модели,
+    отслеживания изменений и валидации. Имена полей совпадают с SleepData
+    """
+    id: int
+    sleep_date: date
+    person_id: int
+    sleep_start_time: float
+    sleep_end_time: float
+    total_sleep_hours: float
+    sleep_quality: int
+    exercise_minutes: int
+    caffeine_intake_mg: int
+    screen_time_before_bed: int
+    work_hours: float
+    productivity_score: int
+    mood_score: int
+    stress_level: int
+    version: int
+
+
+# Столбцы SleepData в порядке полей SleepDataRow
+ROW_COLUMNS = [getattr(SleepData, name) for name in SleepDataRow._fields]
+
+
+class SleepDataPage(NamedTuple):
+    """Страница данных о сне и токен для получения следующей"""
+    items: List[Union[SleepData, SleepDataRow]]
+    next_token: Optional[PageToken]
+
+
+class CountEstimate(NamedTuple):
+    """
+    Размер результата поиска: exact=True - точное число строк, иначе
+    оценка планировщика (у результата больше порога - не меньше порог + 1)
+    """
+    rows: int
+    exact: bool
+
+
+class FacetBucket(NamedTuple):
+    """Корзина гистограммы: значения в [low, high) и число строк в ней"""
+    low: float
+    high: float
+    count: int
+
+
+def count_in_range(buckets: List[FacetBucket], low=None, high=None, integer: bool = False) -> Tuple[int, bool]:
+    """
+    Число строк гистограммы в диапазоне [low, high] (None - граница не
+    задана). Корзины, попавшие в диапазон частично, учитываются
+    пропорционально; второй элемент - счет точный (частичных корзин нет)
+    """
+    if integer and high is not None:
+        high = high + 1  # корзины целых столбцов - полуинтервалы [low, high)
+    total, exact = 0.0, True
+    for bucket in buckets:
+        start = bucket.low if low is None else max(bucket.low, low)
+        end = bucket.high if high is None else min(bucket.high, high)
+        if end <= start or not bucket.count:
+            continue
+        share = (end - start) / (bucket.high - bucket.low)
+        if share < 1:
+            exact = False
+        total += bucket.count * min(share, 1.0)
+    return round(total), exact
+
+
+class _CsvRecordStream(io.TextIOBase):
+    """
+    Файлоподобный поток CSV поверх итератора записей для copy_expert:
+    строки формируются по мере чтения, весь файл в памяти не держится.
+    """
+
+    def __init__(self, records: Iterable[tuple], progress_callback: Optional[Callable[[int], None]] = None):
+        self._records = iter(records)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._pending = ""
+        self._progress_callback = progress_callback
+        self.rows = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            record = next(self._records, None)
+            if record is None:
+                break
+            self._writer.writerow(record)
+            self.rows += 1
+            if self._progress_callback and self.rows % COPY_PROGRESS_STEP == 0:
+                self._progress_callback(self.rows)
+            # Забираем порцию из буфера, чтобы он не рос
+            if self._buffer.tell() >= 65536:
+                self._pending += self._buffer.getvalue()
+                self._buffer.seek(0)
+                self._buffer.truncate()
+        self._pending += self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if size < 0:
+            chunk, self._pending = self._pending, ""
+        else:
+            chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+class UpsertResult(NamedTuple):
+    """
+    Итог слияния: добавлено, изменено, пропущено без изменений и заменено
+    более поздней строкой той же ночи в той же пачке
+    """
+    inserted: int
+    updated: int
+    unchanged: int
+    replaced: int = 0
+
+
+def _pages(records: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    page = []
+    for record in records:
+        page.append(record)
+        if len(page) >= size:
+            yield page
+            page = []
+    if page:
+        yield page
 
 
 class SleepDataRepository:
     """Репозиторий для работы с данными о сне"""
 
-    def __init__(self, session: Session):
-        self.session = session
+    def __init__(self, session_scope):
+        # Фабрика единиц работы: каждая операция открывает свою сессию
+        self.session_scope = session_scope
 
+    @instrumented
     def add_sleep_data(self, data: SleepData) -> SleepData:
         """Добавление записи о сне"""
-        self.session.add(data)
-        self.session.commit()
-        self.session.refresh(data)
-        return data
-
-    def remove_sleep_data(self, data: SleepData) -> bool:
-        """Удаление записи о сне"""
-        self.session.delete(data)
-        self.session.commit()
-        return True
+        with self.session_scope() as session:
+            session.add(data)
+            try:
+                session.commit()
+            except IntegrityError as e:
+                if getattr(e.orig, "pgcode", None) == errorcodes.UNIQUE_VIOLATION:
+                    raise DuplicateSleepDataException(
+                        f"Данные респондента {data.person_id} за {data.sleep_date} уже есть") from e
+                if getattr(e.orig, "pgcode", None) == errorcodes.FOREIGN_KEY_VIOLATION:
+                    raise RespondentNotFoundException(f"Респондент с ID: {data.person_id} не найден") from e
+                raise
+            session.refresh(data)
+            return data
 
+    @instrumented
     def find_by_id(self, id: int) -> Optional[SleepData]:
         """Поиск записи по ID"""
-        return self.session.get(SleepData, id)
+        with self.session_scope() as session:
+            return session.get(SleepData, id)
 
-    def update_sleep_data(self, data: SleepData) -> bool:
-        """Обновление записи о сне"""
-        existing_data = self.session.get(SleepData, data.id)
-        if not existing_data:
-            return False
+    @instrumented
+    def update_sleep_data(self, data_id: int, values: Dict[str, Any],
+                          expected_version: Optional[int] = None) -> SleepData:
+        """
+        Обновление записи о сне одним запросом UPDATE ... RETURNING.
 
-        # Обновляем только измененные поля
-        for key, value in data.dict(exclude_unset=True).items():
-            setattr(existing_data, key, value)
+        values - новые значения атрибутов SleepData. Если передан
+        expected_version, запись обновляется, только пока ее версия не
+        изменилась; иначе StaleDataException. Существование респондента
+        проверяет внешний ключ в базе.
+        """
+        query = update(SleepData).where(SleepData.id == data_id)
+        if expected_version is not None:
+            query = query.where(SleepData.version == expected_version)
+        query = query.values({getattr(SleepData, key): value for key, value in values.items()})
+        query = query.values({SleepData.version: SleepData.version + 1})
+        query = query.returning(*[getattr(SleepData, name) for name in MODEL_FIELDS])
 
-        self.session.commit()
-        return True
+        with self.session_scope() as session:
+            try:
+                row = session.execute(query).first()
+            except IntegrityError as e:
+                if getattr(e.orig, "pgcode", None) == errorcodes.FOREIGN_KEY_VIOLATION:
+                    raise RespondentNotFoundException(
+                        f"Респондент с ID: {values.get('person_id')} не найден") from e
+                raise
+            if row is None:
+                # Обычный путь - одна команда; повторный запрос только при неудаче
+                if session.get(SleepData, data_id) is None:
+                    raise NoResultFound(f"Данные с ID: {data_id} не найдены")
+                raise StaleDataException(
+                    f"Данные с ID: {data_id} изменены другим пользователем, обновите запись")
+            return SleepData(**dict(zip(MODEL_FIELDS, row)))
+
+    @instrumented
+    def count_sleep_data(self, ids: Optional[Sequence[int]] = None,
+                         spec: Optional[SleepDataFilter] = None, **filters) -> int:
+        """Число записей, которые затронет массовая операция с теми же ids и фильтрами"""
+        spec = resolve_filter(spec, filters)
+        query, params = self._apply_target(select(func.count()).select_from(SleepData), ids, spec)
+        with self.session_scope() as session:
+            return session.execute(query, params).scalar()
+
+    @instrumented
+    def estimate_sleep_data_count(self, limit: int, spec: Optional[SleepDataFilter] = None,
+                                  **filters) -> CountEstimate:
+        """
+        Размер результата поиска до его выполнения, чтобы решить, можно ли
+        загрузить его целиком (не больше limit строк).
+
+        Сначала берется оценка планировщика из EXPLAIN: по статистике таблицы
+        (pg_class.reltuples) и столбцов, без чтения строк. Если она дальше
+        ESTIMATE_MARGIN раз от limit в любую сторону, ответ - эта оценка.
+        Иначе строки считаются точно, но не больше limit + 1
+        (count(*) по подзапросу с LIMIT)
+        """
+        spec = resolve_filter(spec, filters)
+        query = self.apply_filter(select(SleepData.id), spec)
+        with self.session_scope() as session:
+            connection = session.connection()
+            compiled = query.compile(dialect=connection.dialect)
+            plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled),
+                                              compiled.construct_params(spec.params())).scalar()
+            estimate = int(plan[0]["Plan"]["Plan Rows"])
+            if estimate > limit * ESTIMATE_MARGIN or estimate * ESTIMATE_MARGIN < limit:
+                return CountEstimate(estimate, False)
+            capped = select(func.count()).select_from(query.limit(limit + 1).subquery())
+            rows = session.execute(capped, spec.params()).scalar()
+        if rows > limit:
+            return CountEstimate(max(estimate, rows), False)
+        return CountEstimate(rows, True)
+
+    @instrumented
+    def get_sleep_data_facets(self, buckets: int = DEFAULT_FACET_BUCKETS,
+                              spec: Optional[SleepDataFilter] = None, **filters) -> Dict[str, List[FacetBucket]]:
+        """
+        Гистограммы числовых столбцов FACET_COLUMNS для фильтра.
+
+        Гистограмма столбца считается по всем условиям фильтра, кроме
+        условий на сам этот столбец: она показывает, сколько строк дадут
+        разные диапазоны в его поле. Счет всех столбцов - один запрос
+        (GROUPING SETS по width_bucket и count(*) FILTER); границы корзин
+        берутся из min/max столбцов по всей таблице (запрос по индексам).
+        У целых столбцов корзины целой ширины, при малом разбросе - по
+        одной на значение
+        """
+        if buckets <= 0:
+            raise ValueError("Число корзин должно быть положительным")
+        spec = resolve_filter(spec, filters)
+        with self.session_scope() as session:
+            bounds = session.execute(_bounds_statement()).one()
+            layout = {}
+            for i, attr in enumerate(FACET_COLUMNS):
+                low, high = bounds[2 * i], bounds[2 * i + 1]
+                if low is not None:
+                    layout[attr] = _bucket_layout(low, high, buckets, _is_integer(attr))
+            if not layout:
+                return {attr: [] for attr in FACET_COLUMNS}  # таблица пуста
+            params = dict(spec.params())
+            for attr, (low, width, count) in layout.items():
+                params.update({f"fb_{attr}_low": low, f"fb_{attr}_high": low + width * count,
+                               f"fb_{attr}_count": count})
+            rows = session.execute(_facet_statement(spec.shape()[:2]), params).all()
+
+        counts = {attr: [0] * layout[attr][2] for attr in layout}
+        for row in rows:
+            for i, attr in enumerate(FACET_COLUMNS):
+                bucket = row[i]
+                if bucket is not None:
+                    counts[attr][bucket - 1] = row[len(FACET_COLUMNS) + i]
+                    break
+        facets = {}
+        for attr in FACET_COLUMNS:
+            if attr not in layout:
+                facets[attr] = []
+                continue
+            low, width, count = layout[attr]
+            facets[attr] = [FacetBucket(low + width * i, low + width * (i + 1), counts[attr][i])
+                            for i in range(count)]
+        return facets
 
+    @instrumented
+    def delete_sleep_data_bulk(self, ids: Optional[Sequence[int]] = None,
+                               spec: Optional[SleepDataFilter] = None, **filters) -> List[int]:
+        """
+        Удаление записей из списка ids и/или подходящих под фильтр
+        одной командой DELETE ... RETURNING. Возвращает id удаленных записей
+        """
+        spec = resolve_filter(spec, filters)
+        query, params = self._apply_target(delete(SleepData), ids, spec)
+        query = query.returning(SleepData.id).execution_options(synchronize_session=False)
+        with self.session_scope() as session:
+            return session.execute(query, params).scalars().all()
+
+    @instrumented
+    def update_sleep_data_bulk(self, values: Dict[str, Any], ids: Optional[Sequence[int]] = None,
+                               spec: Optional[SleepDataFilter] = None, **filters) -> List[SleepDataRow]:
+        """
+        Изменение атрибутов values у записей из списка ids и/или подходящих
+        под фильтр одной командой UPDATE ... RETURNING; версия каждой
+        записи увеличивается. Возвращает измененные записи (SleepDataRow)
+        """
+        spec = resolve_filter(spec, filters)
+        query, params = self._apply_target(update(SleepData), ids, spec)
+        query = query.values({getattr(SleepData, key): value for key, value in values.items()})
+        query = query.values({SleepData.version: SleepData.version + 1}).returning(*ROW_COLUMNS)
+        query = query.execution_options(synchronize_session=False)
+        with self.session_scope() as session:
+            try:
+                return [SleepDataRow._make(row) for row in session.execute(query, params)]
+            except IntegrityError as e:
+                if getattr(e.orig, "pgcode", None) == errorcodes.FOREIGN_KEY_VIOLATION:
+                    raise RespondentNotFoundException(
+                        f"Респондент с ID: {values.get('person_id')} не найден") from e
+                raise
+
+    @instrumented
+    def copy_sleep_data(self, records: Iterable[tuple],
+                        progress_callback: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Массовая загрузка записей о сне одной транзакцией.
+
+        records - кортежи значений в порядке COPY_COLUMNS. Данные потоком
+        идут через COPY во временную таблицу, существование респондентов
+        проверяется одним запросом, затем строки сливаются с sleep_data по
+        ключу (person_id, date): повторная загрузка того же файла не создает
+        дубликатов. Если ночь встречается в файле несколько раз, берется
+        последняя строка. Возвращает число добавленных или измененных строк.
+        """
+        columns = ", ".join(COPY_COLUMNS)
+        with self.session_scope() as session:
+            connection = session.connection()
+            connection.exec_driver_sql(_STAGING_TABLE_DDL)
+
+            stream = _CsvRecordStream(records, progress_callback)
+            cursor = connection.connection.cursor()
+            try:
+                cursor.copy_expert(f"COPY sleep_data_staging ({columns}) FROM STDIN WITH (FORMAT csv)", stream)
+            finally:
+                cursor.close()
+
+            missing = connection.exec_driver_sql(
+                "SELECT DISTINCT s.person_id FROM sleep_data_staging s "
+                "LEFT JOIN sleep.respondents r ON r.id = s.person_id "
+                "WHERE r.id IS NULL ORDER BY s.person_id LIMIT 20"
+            ).scalars().all()
+            if missing:
+                raise RespondentNotFoundException(
+                    f"Респонденты не найдены: {', '.join(map(str, missing))}")
+
+            # Секции для месяцев файла, иначе строки попадут в секцию по умолчанию.
+            # Создаются отдельной короткой транзакцией: ATTACH PARTITION блокирует
+            # секцию по умолчанию, и до конца загрузки встали бы все поиски без даты
+            months = connection.exec_driver_sql(
+                "SELECT DISTINCT date_trunc('month', date)::date FROM sleep_data_staging").scalars().all()
+            self._ensure_month_partitions(months)
+
+            result = connection.exec_driver_sql(
+                f"INSERT INTO sleep.sleep_data AS sleep_data ({columns}) "
+                f"SELECT DISTINCT ON ({', '.join(NIGHT_KEY)}) {columns} FROM sleep_data_staging "
+                f"ORDER BY {', '.join(NIGHT_KEY)}, ord DESC "
+                f"{_ON_CONFLICT_SQL}"
+            )
+            return result.rowcount
+
+    @instrumented
+    def upsert_sleep_data(self, records: Iterable[tuple], page_size: int = UPSERT_PAGE_SIZE) -> UpsertResult:
+        """
+        Идемпотентная запись ночей: INSERT ... ON CONFLICT (person_id, date)
+        DO UPDATE пачками по page_size записей в одной команде (execute_values).
+
+        records - кортежи в порядке COPY_COLUMNS. Все пачки пишутся одной
+        транзакцией. Внутри пачки повтор ночи заменяет предыдущую строку.
+        """
+        columns = ", ".join(COPY_COLUMNS)
+        key_index = [COPY_COLUMNS.index(column) for column in NIGHT_KEY]
+        # Признак вставки: обновление увеличивает version, новая строка получает 1.
+        # xmax секционированной таблицы в RETURNING недоступен
+        sql = (f"INSERT INTO sleep.sleep_data AS sleep_data ({columns}) VALUES %s "
+               f"{_ON_CONFLICT_SQL} RETURNING (version = 1)")
+        inserted = updated = written = replaced = 0
+        with self.session_scope() as session:
+            cursor = session.connection().connection.cursor()
+            try:
+                for page in _pages(records, page_size):
+                    # Одна команда не может изменить строку дважды
+                    unique = list({tuple(record[i] for i in key_index): record for record in page}.values())
+                    written += len(unique)
+                    replaced += len(page) - len(unique)
+                    flags = execute_values(cursor, sql, unique, page_size=len(unique), fetch=True)
+                    page_inserted = sum(1 for (is_insert,) in flags if is_insert)
+                    inserted += page_inserted
+                    updated += len(flags) - page_inserted
+            except errors.ForeignKeyViolation as e:
+                raise RespondentNotFoundException(f"Респондент не найден: {e.diag.message_detail}") from e
+            finally:
+                cursor.close()
+        return UpsertResult(inserted, updated, written - inserted - updated, replaced)
+
+    @instrumented
+    def count_duplicate_nights(self) -> int:
+        """Число лишних записей: ночей респондента, записанных больше одного раза"""
+        with self.session_scope() as session:
+            return session.connection().exec_driver_sql(
+                "SELECT coalesce(sum(n - 1), 0) FROM ("
+                "SELECT count(*) AS n FROM sleep.sleep_data GROUP BY person_id, date HAVING count(*) > 1) d"
+            ).scalar()
+
+    @instrumented
+    def delete_duplicate_nights(self) -> int:
+        """Удаление повторов ночей; остается запись с наибольшим id (добавленная последней)"""
+        with self.session_scope() as session:
+            return session.connection().exec_driver_sql(
+                "DELETE FROM sleep.sleep_data s USING sleep.sleep_data newer "
+                "WHERE newer.person_id = s.person_id AND newer.date = s.date AND newer.id > s.id"
+            ).rowcount
+
+    def _ensure_month_partitions(self, months: List[date]) -> List[str]:
+        """Секции для месяцев months в собственной транзакции"""
+        if not months:
+            return []
+        with self.session_scope() as session:
+            return session.connection().execute(
+                text(f"SELECT p FROM unnest(CAST(:months AS date[])) AS m, {ENSURE_PARTITIONS_FUNCTION}(m, m) AS p"),
+                {"months": list(months)},
+            ).scalars().all()
+
+    @instrumented
+    def ensure_partitions(self, months_ahead: int) -> List[str]:
+        """
+        Создание месячных секций sleep_data с текущего месяца на months_ahead
+        месяцев вперед и для месяцев строк из секции по умолчанию (строки
+        переносятся в новые секции). Возвращает имена созданных секций
+        """
+        with self.session_scope() as session:
+            return session.connection().execute(
+                text(f"SELECT p FROM ("
+                     f"SELECT DISTINCT date_trunc('month', date)::date AS m FROM sleep.sleep_data_default "
+                     f"UNION SELECT generate_series(date_trunc('month', current_date), "
+                     f"date_trunc('month', current_date) + make_interval(months => :months_ahead), "
+                     f"interval '1 month')::date"
+                     f") months, {ENSURE_PARTITIONS_FUNCTION}(m, m) AS p ORDER BY m"),
+                {"months_ahead": months_ahead},
+            ).scalars().all()
+
+    @instrumented
     def get_sleep_data_with_parameters(
             self,
             respondent_id: int = 0,
@@ -67,124 +569,244 @@ class SleepDataRepository:
             stress_start: int = 0,
             stress_end: int = 0
     ) -> List[SleepData]:
-        """Получение данных о сне с фильтрацией по параметрам"""
-
-        # Проверка на пустые параметры
-        all_parameters_empty = all([
-            respondent_id == 0,
-            sl_start_time_start == 0 and sl_start_time_end == 0,
-            sl_end_time_start == 0 and sl_end_time_end == 0,
-            sl_total_time_start == 0 and sl_total_time_end == 0,
-            sl_quality_start == 0 and sl_quality_end == 0,
-            exercise_start == 0 and exercise_end == 0,
-            coffee_start == 0 and coffee_end == 0,
-            screen_time_start == 0 and screen_time_end == 0,
-            work_time_start == 0 and work_time_end == 0,
-            productivity_start == 0 and productivity_end == 0,
-            mood_start == 0 and mood_end == 0,
-            stress_start == 0 and stress_end == 0
-        ])
-        if all_parameters_empty:
-            # Если все параметры пустые - возвращаем все данные с сортировкой по ID
-            query = select(SleepData).order_by(SleepData.id)
-            result = self.session.exec(query)
-            return result.all()
-
-        query = select(SleepData)
-
-        if not all_parameters_empty:
-            if respondent_id > 0:
-                query = query.where(SleepData.person_id == respondent_id)
-
-            # Фильтрация по времени начала сна
-            if sl_start_time_start > 0 and sl_start_time_end > 0:
-                query = query.where(SleepData.sleep_start_time.between(sl_start_time_start, sl_start_time_end))
-            elif sl_start_time_start > 0:
-                query = query.where(SleepData.sleep_start_time >= sl_start_time_start)
-            elif sl_start_time_end > 0:
-                query = query.where(SleepData.sleep_start_time <= sl_start_time_end)
-
-            # Фильтрация по времени окончания сна
-            if sl_end_time_start > 0 and sl_end_time_end > 0:
-                query = query.where(SleepData.sleep_end_time.between(sl_end_time_start, sl_end_time_end))
-            elif sl_end_time_start > 0:
-                query = query.where(SleepData.sleep_end_time >= sl_end_time_start)
-            elif sl_end_time_end > 0:
-                query = query.where(SleepData.sleep_end_time <= sl_end_time_end)
-
-            # Фильтрация по общему времени сна
-            if sl_total_time_start > 0 and sl_total_time_end > 0:
-                query = query.where(SleepData.total_sleep_hours.between(sl_total_time_start, sl_total_time_end))
-            elif sl_total_time_start > 0:
-                query = query.where(SleepData.total_sleep_hours >= sl_total_time_start)
-            elif sl_total_time_end > 0:
-                query = query.where(SleepData.total_sleep_hours <= sl_total_time_end)
-
-            # Фильтрация по качеству сна
-            if sl_quality_start > 0 and sl_quality_end > 0:
-                query = query.where(SleepData.sleep_quality.between(sl_quality_start, sl_quality_end))
-            elif sl_quality_start > 0:
-                query = query.where(SleepData.sleep_quality >= sl_quality_start)
-            elif sl_quality_end > 0:
-                query = query.where(SleepData.sleep_quality <= sl_quality_end)
-
-            # Фильтрация по времени упражнений
-            if exercise_start > 0 and exercise_end > 0:
-                query = query.where(SleepData.exercise_minutes.between(exercise_start, exercise_end))
-            elif exercise_start > 0:
-                query = query.where(SleepData.exercise_minutes >= exercise_start)
-            elif exercise_end > 0:
-                query = query.where(SleepData.exercise_minutes <= exercise_end)
-
-            # Фильтрация по потреблению кофеина
-            if coffee_start > 0 and coffee_end > 0:
-                query = query.where(SleepData.caffeine_intake_mg.between(coffee_start, coffee_end))
-            elif coffee_start > 0:
-                query = query.where(SleepData.caffeine_intake_mg >= coffee_start)
-            elif coffee_end > 0:
-                query = query.where(SleepData.caffeine_intake_mg <= coffee_end)
-
-            # Фильтрация по времени у экрана
-            if screen_time_start > 0 and screen_time_end > 0:
-                query = query.where(SleepData.screen_time.between(screen_time_start, screen_time_end))
-            elif screen_time_start > 0:
-                query = query.where(SleepData.screen_time >= screen_time_start)
-            elif screen_time_end > 0:
-                query = query.where(SleepData.screen_time <= screen_time_end)
-
-            # Фильтрация по рабочему времени
-            if work_time_start > 0 and work_time_end > 0:
-                query = query.where(SleepData.work_hours.between(work_time_start, work_time_end))
-            elif work_time_start > 0:
-                query = query.where(SleepData.work_hours >= work_time_start)
-            elif work_time_end > 0:
-                query = query.where(SleepData.work_hours <= work_time_end)
-
-            # Фильтрация по продуктивности
-            if productivity_start > 0 and productivity_end > 0:
-                query = query.where(SleepData.productivity_score.between(productivity_start, productivity_end))
-            elif productivity_start > 0:
-                query = query.where(SleepData.productivity_score >= productivity_start)
-            elif productivity_end > 0:
-                query = query.where(SleepData.productivity_score <= productivity_end)
-
-            # Фильтрация по настроению
-            if mood_start > 0 and mood_end > 0:
-                query = query.where(SleepData.mood_score.between(mood_start, mood_end))
-            elif mood_start > 0:
-                query = query.where(SleepData.mood_score >= mood_start)
-            elif mood_end > 0:
-                query = query.where(SleepData.mood_score <= mood_end)
-
-            # Фильтрация по уровню стресса
-            if stress_start > 0 and stress_end > 0:
-                query = query.where(SleepData.stress_level.between(stress_start, stress_end))
-            elif stress_start > 0:
-                query = query.where(SleepData.stress_level >= stress_start)
-            elif stress_end > 0:
-                query = query.where(SleepData.stress_level <= stress_end)
-
-            # Сортировка и выполнение запроса
-        query = query.order_by(SleepData.id)
-        result = self.session.exec(query)
-        return result.all()
\ No newline at end of file
+        """
+        Получение данных о сне с фильтрацией по параметрам (0 - параметр не задан).
+        Прежний API: новый код передает SleepDataFilter в find_sleep_data
+        """
+        spec = SleepDataFilter.from_legacy(
+            respondent_id=respondent_id,
+            sl_start_time_start=sl_start_time_start,
+            sl_start_time_end=sl_start_time_end,
+            sl_end_time_start=sl_end_time_start,
+            sl_end_time_end=sl_end_time_end,
+            sl_total_time_start=sl_total_time_start,
+            sl_total_time_end=sl_total_time_end,
+            sl_quality_start=sl_quality_start,
+            sl_quality_end=sl_quality_end,
+            exercise_start=exercise_start,
+            exercise_end=exercise_end,
+            coffee_start=coffee_start,
+            coffee_end=coffee_end,
+            screen_time_start=screen_time_start,
+            screen_time_end=screen_time_end,
+            work_time_start=work_time_start,
+            work_time_end=work_time_end,
+            productivity_start=productivity_start,
+            productivity_end=productivity_end,
+            mood_start=mood_start,
+            mood_end=mood_end,
+            stress_start=stress_start,
+            stress_end=stress_end
+        )
+        return self.find_sleep_data(spec)
+
+    @instrumented
+    def find_sleep_data(self, spec: SleepDataFilter,
+                        as_rows: bool = False) -> List[Union[SleepData, SleepDataRow]]:
+        """
+        Все записи, подходящие под фильтр, в порядке spec.order_by (затем по id).
+        Запрос собирается один раз на форму фильтра
+        """
+        query = _list_statement(spec.shape(), as_rows)
+        with self.session_scope() as session:
+            if as_rows:
+                return [SleepDataRow._make(row) for row in session.execute(query, spec.params())]
+            return session.exec(query, params=spec.params()).all()
+
+    @instrumented
+    def get_sleep_data_page(
+            self,
+            page_size: int = DEFAULT_PAGE_SIZE,
+            order_by: str = "id",
+            descending: bool = False,
+            after: Optional[PageToken] = None,
+            as_rows: bool = False,
+            spec: Optional[SleepDataFilter] = None,
+            **filters
+    ) -> SleepDataPage:
+        """
+        Получение одной страницы данных о сне (keyset-пагинация).
+
+        Страница упорядочена по паре (order_by, id), поэтому сортировка
+        стабильна даже для неуникальных столбцов; spec.order_by не
+        учитывается. after - токен из SleepDataPage.next_token предыдущей
+        страницы, None для первой. При as_rows=True вместо объектов
+        SleepData возвращаются SleepDataRow.
+        """
+        if page_size <= 0:
+            raise ValueError("Размер страницы должен быть положительным")
+        self._sort_column(order_by)
+        spec = resolve_filter(spec, filters)
+
+        query = _page_statement(spec.shape()[:2], as_rows, order_by, descending, after is not None)
+        # Запрашиваем на одну строку больше, чтобы узнать, есть ли следующая страница
+        params = dict(spec.params(), page_limit=page_size + 1)
+        if after is not None:
+            params["after_value"], params["after_id"] = after
+        with self.session_scope() as session:
+            if as_rows:
+                rows = [SleepDataRow._make(row) for row in session.execute(query, params)]
+            else:
+                rows = session.exec(query, params=params).all()
+        if len(rows) <= page_size:
+            return SleepDataPage(rows, None)
+
+        rows = rows[:page_size]
+        last = rows[-1]
+        return SleepDataPage(rows, (getattr(last, order_by), last.id))
+
+    def iter_sleep_data_with_parameters(
+            self,
+            page_size: int = DEFAULT_PAGE_SIZE,
+            order_by: str = "id",
+            descending: bool = False,
+            as_rows: bool = False,
+            spec: Optional[SleepDataFilter] = None,
+            **filters
+    ) -> Iterator[Union[SleepData, SleepDataRow]]:
+        """
+        Потоковое получение данных о сне постранично.
+
+        Каждая страница читается в отдельной короткой сессии, поэтому
+        карта идентичности не растет и память остается постоянной.
+        """
+        spec = resolve_filter(spec, filters)
+        token = None
+        while True:
+            page = self.get_sleep_data_page(page_size=page_size, order_by=order_by, descending=descending,
+                                            after=token, as_rows=as_rows, spec=spec)
+            yield from page.items
+            if page.next_token is None:
+                return
+            token = page.next_token
+
+    def iter_sleep_data_rows(
+            self,
+            columns: List[str],
+            batch_size: int = STREAM_BATCH_SIZE,
+            spec: Optional[SleepDataFilter] = None,
+            first_batch_size: Optional[int] = None,
+            **filters
+    ) -> Iterator[tuple]:
+        """
+        Потоковое чтение выбранных столбцов данных о сне через серверный курсор.
+
+        columns - имена атрибутов SleepData; строки возвращаются кортежами
+        значений без создания объектов модели в порядке spec.order_by (затем
+        по id). Запрос выполняется один раз, строки забираются порциями по
+        batch_size, поэтому память не зависит от размера выборки. Первая
+        порция может быть меньше (first_batch_size), чтобы первые строки
+        пришли быстрее. Соединение занято, пока итератор не исчерпан или не закрыт.
+        """
+        spec = resolve_filter(spec, filters)
+        query = select(*[self._sort_column(column) for column in columns])
+        query = self.apply_filter(query, spec).order_by(*order_clauses(spec.shape()))
+        handle = current_cancel_handle()
+        with self.session_scope() as session:
+            result = session.execute(query.execution_options(stream_results=True, max_row_buffer=batch_size),
+                                     spec.params())
+            size = first_batch_size or batch_size
+            while True:
+                batch = result.fetchmany(size)
+                if not batch:
+                    return
+                if handle is not None and handle.cancelled:
+                    raise QueryCancelledException("Запрос отменен")
+                yield from map(tuple, batch)
+                size = batch_size
+
+    @staticmethod
+    def apply_filter(query, spec: SleepDataFilter):
+        """
+        Условия фильтра в запросе; значения параметров передаются при
+        выполнении: session.execute(query, spec.params())
+        """
+        return query.where(*where_clauses(spec.shape()))
+
+    @classmethod
+    def _apply_target(cls, query, ids: Optional[Sequence[int]], spec: SleepDataFilter):
+        """Условия массовой операции: список id (если задан) и фильтр; возвращает запрос и параметры"""
+        if ids is not None:
+            query = query.where(SleepData.id.in_(list(ids)))
+        return cls.apply_filter(query, spec), spec.params()
+
+    @staticmethod
+    def _sort_column(order_by: str):
+        """Столбец SleepData по имени атрибута"""
+        if order_by not in SleepData.__fields__:
+            raise ValueError(f"Неизвестный столбец: {order_by}")
+        return getattr(SleepData, order_by)
+
+
+# Собранные запросы по форме фильтра: повторный поиск той же формы не строит
+# запрос заново, а SQLAlchemy берет скомпилированный SQL из своего кэша
+
+@lru_cache(maxsize=256)
+def _list_statement(shape: Tuple, as_rows: bool):
+    query = select(*ROW_COLUMNS) if as_rows else select(SleepData)
+    return query.where(*where_clauses(shape)).order_by(*order_clauses(shape))
+
+
+@lru_cache(maxsize=256)
+def _page_statement(shape: Tuple, as_rows: bool, order_by: str, descending: bool, keyset: bool):
+    column = getattr(SleepData, order_by)
+    query = select(*ROW_COLUMNS) if as_rows else select(SleepData)
+    query = query.where(*where_clauses(shape + ((),)))
+    if keyset:
+        key = tuple_(column, SleepData.id)
+        last = tuple_(bindparam("after_value", type_=column.type), bindparam("after_id", type_=Integer))
+        query = query.where(key < last if descending else key > last)
+    if descending:
+        query = query.order_by(column.desc(), SleepData.id.desc())
+    else:
+        query = query.order_by(column, SleepData.id)
+    return query.limit(bindparam("page_limit", type_=Integer))
+
+
+def _is_integer(attr: str) -> bool:
+    return isinstance(getattr(SleepData, attr).type, Integer)
+
+
+def _bucket_layout(low, high, buckets: int, integer: bool) -> Tuple[float, float, int]:
+    """Нижняя граница, ширина и число корзин гистограммы столбца"""
+    if integer:
+        span = high - low + 1
+        width = -(-span // buckets)  # округление вверх: корзины целой ширины
+        return low, width, -(-span // width)
+    if high == low:
+        return low, 1.0, 1
+    return low, (high - low) / buckets, buckets
+
+
+@lru_cache(maxsize=1)
+def _bounds_statement():
+    columns = []
+    for attr in FACET_COLUMNS:
+        column = getattr(SleepData, attr)
+        columns += [func.min(column), func.max(column)]
+    return select(*columns)
+
+
+@lru_cache(maxsize=256)
+def _facet_statement(shape: Tuple):
+    """
+    Счет гистограмм для формы фильтра. В WHERE - условия на прочие столбцы
+    и группы any_of; условия на столбцы гистограмм переносятся в FILTER
+    счетчиков всех столбцов, кроме своего
+    """
+    conditions, groups = shape
+    common = tuple(c for c in conditions if c[0] not in FACET_COLUMNS)
+    faceted = [c for c in conditions if c[0] in FACET_COLUMNS]
+    bucket_columns, count_columns = [], []
+    for attr in FACET_COLUMNS:
+        count = bindparam(f"fb_{attr}_count", type_=Integer)
+        bucket = func.width_bucket(getattr(SleepData, attr),
+                                   bindparam(f"fb_{attr}_low", type_=Float),
+                                   bindparam(f"fb_{attr}_high", type_=Float), count)
+        # значения вне границ (записаны после их чтения) - в крайние корзины
+        bucket_columns.append(func.least(func.greatest(bucket, 1), count))
+        others = where_clauses((tuple(c for c in faceted if c[0] != attr), (), ()))
+        count_columns.append(func.count().filter(and_(*others)) if others else func.count())
+    query = select(*bucket_columns, *count_columns).select_from(SleepData)
+    query = query.where(*where_clauses((common, groups, ())))
+    return query.group_by(func.grouping_sets(*bucket_columns))
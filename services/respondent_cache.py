@@ -0,0 +1,167 @@
+# Кэш респондентов: ограниченный LRU со временем жизни записей и сбросом по уведомлениям PostgreSQL
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Канал уведомлений триггера sleep.respondents (миграция 0005);
+# полезная нагрузка - id респондента, пустая строка - сброс всего кэша
+RESPONDENT_CHANNEL = "respondent_changed"
+
+# Пауза перед повторным подключением слушателя, с
+LISTEN_RETRY_SECONDS = 5.0
+
+
+class RespondentCache:
+    """
+    Потокобезопасный LRU-кэш респондентов по id.
+
+    Запись вытесняется, когда кэш переполнен и к ней дольше всех не
+    обращались, или по истечении ttl секунд с момента загрузки. Отсутствующие
+    респонденты не кэшируются. max_size=0 отключает кэш.
+
+    Чтение, начатое до сброса записи, не должно вернуть в кэш старого
+    респондента: put принимает поколение, взятое до запроса к базе.
+    """
+
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> (срок годности, респондент)
+        # Растет при каждом сбросе: результат чтения, начатого до изменения, не сохраняется
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        """Номер поколения; берется до чтения из базы и передается в put"""
+        return self._generation
+
+    def get(self, resp_id: int) -> Optional[Any]:
+        """Респондент из кэша или None (промах)"""
+        with self._lock:
+            entry = self._entries.get(resp_id)
+            if entry is not None and entry[0] <= self._clock():
+                del self._entries[resp_id]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(resp_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, resp_id: int, respondent: Any, generation: int) -> bool:
+        """Сохранить респондента, прочитанного в поколении generation"""
+        if self.max_size <= 0:
+            return False
+        with self._lock:
+            if generation != self._generation:
+                return False  # за время чтения респондента изменили или удалили
+            self._entries[resp_id] = (self._clock() + self.ttl, respondent)
+            self._entries.move_to_end(resp_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, resp_id: int):
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(resp_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def log_summary(self):
+        s = self.stats()
+        logger.info(f"Кэш респондентов: записей {s['size']}/{s['max_size']}, попаданий {s['hits']}, "
+                    f"промахов {s['misses']} (доля попаданий {s['hit_ratio']}), вытеснено {s['evictions']}, "
+                    f"устарело {s['expirations']}, сброшено {s['invalidations']}")
+
+
+class RespondentChangeListener:
+    """
+    Фоновый поток: LISTEN на канале RESPONDENT_CHANNEL и сброс измененных
+    респондентов в кэше. Использует отдельное соединение вне пула. После
+    потери соединения кэш очищается целиком: уведомления за это время потеряны.
+    """
+
+    def __init__(self, engine, cache: RespondentCache, poll_seconds: float = 1.0):
+        self._engine = engine
+        self._cache = cache
+        self._poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="respondent-cache-listener", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _connect(self):
+        dialect = self._engine.dialect
+        cargs, cparams = dialect.create_connect_args(self._engine.url)
+        connection = dialect.connect(*cargs, **cparams)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {RESPONDENT_CHANNEL}")
+        return connection
+
+    def _run(self):
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                logger.info(f"Подписка на уведомления {RESPONDENT_CHANNEL}")
+                # изменения до подписки могли пройти мимо кэша
+                self._cache.clear()
+                while not self._stop.is_set():
+                    if select.select([connection], [], [], self._poll_seconds)[0]:
+                        connection.poll()
+                        while connection.notifies:
+                            self._apply(connection.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"Ошибка слушателя {RESPONDENT_CHANNEL}: {e}")
+                self._cache.clear()
+                self._stop.wait(LISTEN_RETRY_SECONDS)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _apply(self, payload: str):
+        if payload.isdigit():
+            self._cache.invalidate(int(payload))
+        else:
+            self._cache.clear()
@@ -1,18 +1,26 @@
 # User CRUD-операции
+from typing import Optional
+from config.settings import CacheConfig
 from exception.exceptions import RespondentNotFoundException
 from repositories.respondent_repository import RespondentRepository
+from services.respondent_cache import RespondentCache
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Наибольшее число подсказок при поиске по мере ввода
+SUGGEST_LIMIT = 20
+
 class RespondentService:
-    def __init__(self, repository:RespondentRepository):
+    def __init__(self, repository:RespondentRepository, cache: Optional[RespondentCache] = None):
         self.repository=repository
+        # Поиск по id (в том числе проверка респондента при записи данных о сне) идет через кэш
+        self.cache = cache or RespondentCache(CacheConfig.respondent_cache_size, CacheConfig.respondent_cache_ttl)
         logger.info("RespondentService initialized")
 
-    def get_respondents(self):
+    def get_respondents(self, as_rows=False):
         logger.info("Fetching all respondents")
-        return self.repository.get_all()
+        return self.repository.get_all(as_rows=as_rows)
 
     def add_respondent(self, **data):
         logger.info(f"Adding respondent: {data.get('first_name')} {data.get('last_name')}, Email: {data.get('email')}")
@@ -21,28 +29,55 @@ class RespondentService:
 
     def remove_respondent(self, respondent_id:int):
         logger.info(f"Removing respondent with ID {respondent_id}")
-        return self.repository.delete(respondent_id)
+        try:
+            return self.repository.delete(respondent_id)
+        finally:
+            self.cache.invalidate(respondent_id)
 
-    def search_resp_by_last_name(self,last_name):
+    def search_resp_by_last_name(self,last_name, as_rows=False):
         logger.info(f"Searching respondent(s) by last name: {last_name}")
-        return self.repository.search_resp_by_last_name(last_name)
+        return self.repository.search_resp_by_last_name(last_name, as_rows=as_rows)
+
+    def suggest_respondents(self, term, limit=SUGGEST_LIMIT):
+        """Подсказки для поиска по мере ввода (RespondentRow, не больше SUGGEST_LIMIT)"""
+        if not term.strip():
+            return []
+        return self.repository.search_respondents(term, limit=min(limit, SUGGEST_LIMIT))
 
     def search_resp_by_id(self, resp_id):
+        respondent = self.cache.get(resp_id)
+        if respondent is not None:
+            return respondent
         logger.info(f"Searching respondent by id: {resp_id}")
+        # поколение до чтения: если респондента изменят за время запроса, ответ не попадет в кэш
+        generation = self.cache.generation
         respondent = self.repository.search_resp_by_id(resp_id)
         if not respondent:
             raise RespondentNotFoundException(f"Респондент с id {resp_id} не найден")
+        self.cache.put(resp_id, respondent, generation)
         return respondent
 
+    def forget_respondent(self, resp_id):
+        """Сбросить респондента в кэше (например, если база сообщила, что его больше нет)"""
+        self.cache.invalidate(resp_id)
+
     def update_respondent(self, resp_id, **data):
         logger.info(f"Update respondent: id: {resp_id}, with data {data}")
-        respondent = self.repository.update(resp_id, **data)
+        try:
+            respondent = self.repository.update(resp_id, **data)
+        finally:
+            # сброс после фиксации: чтение, начатое раньше, не вернет в кэш прежние данные
+            self.cache.invalidate(resp_id)
         if not respondent:
             raise RespondentNotFoundException(f"Респондент с id {resp_id} не найден")
         return respondent
     def delete_resp_by_id(self,resp_id):
         logger.info(f"Delete respondent with id: {resp_id}")
-        result = self.repository.delete_resp_by_id(resp_id)
+        try:
+            result = self.repository.delete_resp_by_id(resp_id)
+        finally:
+            # сброс после фиксации: параллельное чтение не вернет удаленного респондента в кэш
+            self.cache.invalidate(resp_id)
         if not result:
             raise RespondentNotFoundException(f"Респондент с id {resp_id} не найден")
         return result
@@ -0,0 +1,75 @@
+import logging
+import time
+from datetime import date
+from typing import List, Optional, Sequence
+
+from repositories.sleep_analytics_repository import (
+    AGE_BAND_WIDTH, DEFAULT_PERCENTILES, GROUP_BY_OPTIONS, METRIC_COLUMNS, ROLLUP_METRICS,
+    MetricSummary, RollupRow)
+from repositories.sleep_data_filter import SleepDataFilter
+
+logger = logging.getLogger(__name__)
+
+
+class SleepAnalyticsService:
+    def __init__(self, sleep_analytics_repository):
+        self._repository = sleep_analytics_repository
+
+    @staticmethod
+    def metrics() -> List[str]:
+        """Столбцы, по которым доступны агрегаты"""
+        return list(METRIC_COLUMNS)
+
+    @staticmethod
+    def group_options() -> List[str]:
+        """Допустимые значения group_by"""
+        return list(GROUP_BY_OPTIONS)
+
+    def summarize(self,
+                  metric: str,
+                  group_by: Optional[str] = None,
+                  percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+                  spec: Optional[SleepDataFilter] = None,
+                  **filters) -> List[MetricSummary]:
+        """
+        Сводная статистика показателя по записям, подходящим под фильтр
+        (spec или параметры get_sleep_data_with_parameters), по всей выборке или по группам
+        """
+        for q in percentiles:
+            if not 0 <= q <= 1:
+                raise ValueError(f"Перцентиль должен быть в диапазоне от 0 до 1: {q}")
+        return self._repository.summarize(metric, group_by=group_by, percentiles=percentiles, spec=spec,
+                                          **filters)
+
+    def get_rollups(self,
+                    period: str,
+                    start: Optional[date] = None,
+                    end: Optional[date] = None,
+                    respondent_id: int = 0,
+                    per_respondent: bool = True,
+                    metrics: Sequence[str] = ROLLUP_METRICS) -> List[RollupRow]:
+        """
+        Средние показатели по дням, неделям или месяцам из сводной таблицы
+        """
+        if start is not None and end is not None and start > end:
+            raise ValueError("Начало интервала позже его конца")
+        return self._repository.get_rollups(period, start=start, end=end, respondent_id=respondent_id,
+                                            per_respondent=per_respondent, metrics=metrics)
+
+    def rebuild_rollups(self) -> int:
+        """
+        Пересчет сводной таблицы с нуля (после сбоя или ручной правки данных)
+        """
+        started = time.perf_counter()
+        rows = self._repository.rebuild_rollups()
+        logger.info(f"Сводная таблица пересчитана: {rows} строк за {time.perf_counter() - started:.1f} с")
+        return rows
+
+    @staticmethod
+    def group_label(group_by: Optional[str], value) -> str:
+        """Подпись группы для вывода"""
+        if group_by is None:
+            return "Все"
+        if group_by == "age_band" and value is not None:
+            return f"{value}-{value + AGE_BAND_WIDTH - 1}"
+        return str(value)
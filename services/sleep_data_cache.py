@@ -0,0 +1,199 @@
+# Кэш результатов поиска данных о сне по нормализованному фильтру
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from repositories.sleep_data_filter import SleepDataFilter
+from repositories.sleep_data_repository import SleepDataRow
+
+logger = logging.getLogger(__name__)
+
+# Оценка памяти на одну строку результата: SleepDataRow со значениями
+# (около 360 байт, benchmarks.hydration_bench) и id в множестве записей
+ROW_BYTES = 450
+
+
+class CachedRows(NamedTuple):
+    """Результат из кэша; fresh=False - устарел, его нужно перезапросить"""
+    rows: List[SleepDataRow]
+    fresh: bool
+
+
+class _Entry(NamedTuple):
+    spec: SleepDataFilter
+    rows: List[SleepDataRow]
+    ids: FrozenSet[int]
+    size: int
+    loaded_at: float
+
+
+class SleepDataResultCache:
+    """
+    Потокобезопасный LRU-кэш результатов поиска, ограниченный по памяти.
+    Ключ - SleepDataFilter: незаданные условия в нем отброшены, порядок
+    условий не важен, 5 и 5.0 совпадают.
+
+    Записи старше ttl секунд считаются устаревшими: при serve_stale их можно
+    показать, пока идет повторный запрос, иначе они удаляются. Запись
+    сбрасывается, если изменение затронуло строку из ее результата или
+    строка с новыми значениями может попасть под ее фильтры.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, serve_stale: bool = True,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.serve_stale = serve_stale
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # SleepDataFilter -> _Entry
+        self._bytes = 0
+        # Растет при каждом сбросе: результат запроса, начатого до изменения, не сохраняется
+        self._generation = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        """Номер поколения; передается в put вместе с результатом запроса"""
+        return self._generation
+
+    def get(self, spec: SleepDataFilter) -> Optional[CachedRows]:
+        with self._lock:
+            entry = self._entries.get(spec)
+            if entry is None:
+                self.misses += 1
+                return None
+            fresh = self._clock() - entry.loaded_at < self.ttl
+            if not fresh and not self.serve_stale:
+                self._drop(spec)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(spec)
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            return CachedRows(entry.rows, fresh)
+
+    def peek(self, spec: SleepDataFilter) -> Optional[List[SleepDataRow]]:
+        """Результат из кэша (в том числе устаревший) без учета в статистике и порядке LRU"""
+        with self._lock:
+            entry = self._entries.get(spec)
+            return entry.rows if entry is not None else None
+
+    def put(self, spec: SleepDataFilter, rows: List[SleepDataRow], generation: int) -> bool:
+        """
+        Сохранить результат запроса, начатого в поколении generation.
+        Результаты больше всего кэша и устаревшие за время запроса не сохраняются
+        """
+        size = len(rows) * ROW_BYTES
+        if self.max_bytes <= 0:
+            return False  # кэш выключен (SLEEP_DATA_CACHE_MB=0)
+        with self._lock:
+            if generation != self._generation or size > self.max_bytes:
+                return False
+            if spec in self._entries:
+                self._drop(spec)
+            self._entries[spec] = _Entry(spec, rows, frozenset(r.id for r in rows), size, self._clock())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate_ids(self, ids: Iterable[int]):
+        """Сбросить результаты, в которых есть записи ids (изменены или удалены)"""
+        ids = set(ids)
+        if ids:
+            self._invalidate(lambda entry: not ids.isdisjoint(entry.ids))
+
+    def invalidate_values(self, values: Dict[str, Any]):
+        """
+        Сбросить результаты, под фильтры которых может попасть запись со
+        значениями values (новая или измененная; неизвестные поля не учитываются)
+        """
+        self._invalidate(lambda entry: entry.spec.matches(values))
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def log_summary(self):
+        s = self.stats()
+        logger.info(f"Кэш поиска данных о сне: результатов {s['entries']}, "
+                    f"{s['bytes'] / 1e6:.1f} из {s['max_bytes'] / 1e6:.0f} МБ, попаданий {s['hits']} "
+                    f"(устаревших {s['stale_hits']}), промахов {s['misses']}, вытеснено {s['evictions']}, "
+                    f"сброшено {s['invalidations']}")
+
+    def _invalidate(self, affected: Callable[[_Entry], bool]):
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, entry in self._entries.items() if affected(entry)]:
+                self._drop(key)
+                self.invalidations += 1
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key).size
+
+
+class SleepDataFacetCache:
+    """
+    LRU-кэш гистограмм фильтров (SleepDataRepository.get_sleep_data_facets)
+    на max_entries наборов фильтров. Запись действительна ttl секунд и пока
+    не изменилось поколение кэша результатов: любое изменение данных через
+    сервис сбрасывает и гистограммы
+    """
+
+    def __init__(self, results: SleepDataResultCache, max_entries: int = 128,
+                 clock: Callable[[], float] = time.monotonic):
+        self.results = results
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # ключ -> (гистограммы, поколение, время)
+
+    def get(self, key) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            facets, generation, loaded_at = entry
+            if generation != self.results.generation or self._clock() - loaded_at >= self.results.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return facets
+
+    def put(self, key, facets, generation: int):
+        """Сохранить гистограммы, посчитанные в поколении generation"""
+        with self._lock:
+            if generation != self.results.generation or self.max_entries <= 0:
+                return
+            self._entries[key] = (facets, generation, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,74 @@
+"""Потоковая запись данных о сне в Excel."""
+import os
+from typing import Callable, Iterable, List, Optional
+
+# Лимит строк листа Excel; первая строка листа занята заголовком
+EXCEL_MAX_ROWS = 1048576
+SHEET_DATA_ROWS = EXCEL_MAX_ROWS - 1
+
+SHEET_TITLE = "Exported Data"
+
+# Как часто сообщать о прогрессе записи (число строк)
+EXPORT_PROGRESS_STEP = 10000
+
+
+def write_xlsx(path: str,
+               header: List[str],
+               rows: Iterable[tuple],
+               progress_callback: Optional[Callable[[int], None]] = None,
+               sheet_rows: int = SHEET_DATA_ROWS) -> int:
+    """
+    Запись строк в книгу Excel в режиме write_only.
+
+    Строки не накапливаются в памяти; числа и даты записываются как
+    типизированные ячейки. Когда лист заполнен, создается следующий
+    с тем же заголовком. Возвращает число записанных строк. Если чтение
+    строк прервано ошибкой или отменой, файл не создается.
+    """
+    # openpyxl нужен только для экспорта, не загружаем его при запуске
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_count = 0
+    sheet_filled = sheet_rows
+    written = 0
+    try:
+        for row in rows:
+            if sheet_filled >= sheet_rows:
+                sheet_count += 1
+                title = SHEET_TITLE if sheet_count == 1 else f"{SHEET_TITLE} {sheet_count}"
+                sheet = workbook.create_sheet(title)
+                sheet.append(header)
+                sheet_filled = 0
+            sheet.append(row)
+            sheet_filled += 1
+            written += 1
+            if progress_callback and written % EXPORT_PROGRESS_STEP == 0:
+                progress_callback(written)
+    except BaseException:
+        _discard(workbook)
+        raise
+
+    if sheet is None:
+        workbook.create_sheet(SHEET_TITLE).append(header)
+
+    # Сохраняем во временный файл рядом, чтобы не оставить недописанный xlsx
+    temp_path = f"{path}.part"
+    try:
+        workbook.save(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return written
+
+
+def _discard(workbook):
+    """Закрыть листы недописанной книги и удалить их временные файлы"""
+    for sheet in workbook.worksheets:
+        sheet.close()
+        writer = getattr(sheet, "_writer", None)
+        if writer is not None:
+            writer.cleanup()
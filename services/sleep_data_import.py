@@ -0,0 +1,99 @@
+"""Чтение файлов с данными о сне для массовой загрузки (CSV, JSONL, xlsx)."""
+import csv
+import json
+import os
+from datetime import date, datetime
+from typing import Iterable, Iterator, Optional
+
+from exception.exceptions import ImportFormatException
+from repositories.sleep_data_repository import COPY_COLUMNS
+
+# Альтернативные имена столбцов во входных файлах
+FIELD_ALIASES = {
+    "sleep_date": "date",
+    "screen_time": "screen_time_before_bed",
+}
+
+SUPPORTED_EXTENSIONS = (".csv", ".jsonl", ".xlsx")
+
+
+def read_sleep_data_file(path: str) -> Iterator[tuple]:
+    """
+    Построчное чтение файла с данными о сне.
+    Возвращает кортежи значений в порядке COPY_COLUMNS.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        rows = _read_csv(path)
+    elif extension == ".jsonl":
+        rows = _read_jsonl(path)
+    elif extension == ".xlsx":
+        rows = _read_xlsx(path)
+    else:
+        raise ImportFormatException(
+            f"Неподдерживаемый формат {extension or path}, ожидается {', '.join(SUPPORTED_EXTENSIONS)}")
+
+    return records_from_dicts(rows)
+
+
+def records_from_dicts(rows: Iterable[dict]) -> Iterator[tuple]:
+    """
+    Словари с именами столбцов sleep_data (или их синонимами) -
+    в кортежи значений в порядке COPY_COLUMNS
+    """
+    for line_number, row in enumerate(rows, start=1):
+        yield _to_record(row, line_number)
+
+
+def _to_record(row: dict, line_number: int) -> tuple:
+    values = {FIELD_ALIASES.get(key, key): value for key, value in row.items() if key}
+    missing = [column for column in COPY_COLUMNS if values.get(column) in (None, "")]
+    if missing:
+        raise ImportFormatException(f"Строка {line_number}: нет значений для {', '.join(missing)}")
+    record = []
+    for column in COPY_COLUMNS:
+        value = values[column]
+        if column == "date":
+            value = _parse_date(value, line_number)
+        record.append(value)
+    return tuple(record)
+
+
+def _parse_date(value, line_number: int) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        raise ImportFormatException(f"Строка {line_number}: некорректная дата {value!r}")
+
+
+def _read_csv(path: str) -> Iterator[dict]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.DictReader(f)
+
+
+def _read_jsonl(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _read_xlsx(path: str) -> Iterator[dict]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header: Optional[tuple] = next(rows, None)
+        if header is None:
+            return
+        header = tuple(str(name).strip() if name is not None else None for name in header)
+        for row in rows:
+            if any(value is not None for value in row):
+                yield dict(zip(header, row))
+    finally:
+        workbook.close()
@@ -1,24 +1,68 @@
-from datetime import datetime
-from typing import List
+import logging
+import time
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 from sqlalchemy.exc import NoResultFound
-from contextlib import contextmanager
+from config.settings import CacheConfig
+from exception.exceptions import RespondentNotFoundException
 from models.sleep_data import SleepData
+from repositories.sleep_data_filter import SleepDataFilter, resolve_filter
+from repositories.sleep_data_repository import (DEFAULT_FACET_BUCKETS, DEFAULT_PAGE_SIZE, CountEstimate, FacetBucket,
+                                                PageToken, SleepDataPage, SleepDataRow, UpsertResult)
+from services.sleep_data_cache import CachedRows, SleepDataFacetCache, SleepDataResultCache
+from services.sleep_data_export import write_xlsx
+from services.sleep_data_import import read_sleep_data_file, records_from_dicts
+
+logger = logging.getLogger(__name__)
+
+
+# Поля, которые можно изменить массово
+PATCHABLE_FIELDS = [
+    "sleep_date",
+    "person_id",
+    "sleep_start_time",
+    "sleep_end_time",
+    "total_sleep_hours",
+    "sleep_quality",
+    "exercise_minutes",
+    "caffeine_intake_mg",
+    "screen_time_before_bed",
+    "work_hours",
+    "productivity_score",
+    "mood_score",
+    "stress_level",
+]
+
+# На сколько месяцев вперед создаются секции sleep_data
+PARTITION_MONTHS_AHEAD = 3
+
+# Постепенная загрузка: небольшая первая порция показывается сразу,
+# остальные строки передаются порциями по STREAM_CHUNK_SIZE
+FIRST_PAGE_SIZE = 200
+STREAM_CHUNK_SIZE = 5000
+
+
+class ImportResult(NamedTuple):
+    """Итог массовой загрузки"""
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
 
 
 class SleepDataService:
-    def __init__(self, sleep_data_repository, respondent_service):
+    def __init__(self, sleep_data_repository, respondent_service,
+                 result_cache: Optional[SleepDataResultCache] = None):
         self._sleep_data_repository = sleep_data_repository
         self._r_service = respondent_service
-
-    @contextmanager
-    def _transaction(self):
-        """Контекстный менеджер для транзакций"""
-        try:
-            yield
-            self._sleep_data_repository.session.commit()
-        except Exception:
-            self._sleep_data_repository.session.rollback()
-            raise
+        # Результаты поиска по фильтрам; записи через сервис сбрасывают затронутые
+        self.result_cache = result_cache or SleepDataResultCache(
+            CacheConfig.sleep_data_cache_mb * 1_000_000, CacheConfig.sleep_data_cache_ttl,
+            serve_stale=CacheConfig.sleep_data_cache_serve_stale)
+        # Гистограммы фильтров; сбрасываются вместе с любым изменением result_cache
+        self.facet_cache = SleepDataFacetCache(self.result_cache)
 
     def add_sleep_data(self,
                        person_id: int,
@@ -32,16 +76,17 @@ class SleepDataService:
                        work_hours: float,
                        productivity_score: int,
                        mood_score: int,
-                       stress_level: int) -> SleepData:
+                       stress_level: int,
+                       sleep_date: Optional[date] = None) -> SleepData:
         """
-        Добавление данных о сне
+        Добавление данных о сне за ночь sleep_date (по умолчанию - сегодня)
         """
-        # Проверяем существование респондента
+        # Проверяем существование респондента (обычно без запроса: респондент в кэше)
         self._r_service.search_resp_by_id(person_id)
 
         new_sleep_data = SleepData(
             person_id=person_id,
-            sleep_date=datetime.now().date(),
+            sleep_date=sleep_date or datetime.now().date(),
             sleep_start_time=sleep_start_time,
             sleep_end_time=sleep_end_time,
             total_sleep_hours=total_sleep_hours,
@@ -55,7 +100,14 @@ class SleepDataService:
             stress_level=stress_level
         )
 
-        return self._sleep_data_repository.add_sleep_data(new_sleep_data)
+        try:
+            created = self._sleep_data_repository.add_sleep_data(new_sleep_data)
+        except RespondentNotFoundException:
+            # респондента удалили после того, как он попал в кэш
+            self._r_service.forget_respondent(person_id)
+            raise
+        self.result_cache.invalidate_values(created.dict())
+        return created
 
     def update_sleep_data(self,
                           data_id: int,
@@ -70,48 +122,90 @@ class SleepDataService:
                           work_hours: float,
                           productivity_score: int,
                           mood_score: int,
-                          stress_level: int) -> bool:
-        """
-        Обновление данных о сне с транзакцией
-        """
-        with self._transaction():
-            old_data = self.get_sleep_data_by_id(data_id)
-
-            # Обновляем только переданные параметры
-            if person_id is not None:
-                self._r_service.search_resp_by_id(person_id)
-                old_data.person_id = person_id
-            if sleep_start_time is not None:
-                old_data.sleep_start_time = sleep_start_time
-            if sleep_end_time is not None:
-                old_data.sleep_end_time = sleep_end_time
-            if total_sleep_hours is not None:
-                old_data.total_sleep_hours = total_sleep_hours
-            if sleep_quality is not None:
-                old_data.sleep_quality = sleep_quality
-            if exercise_minutes is not None:
-                old_data.exercise_minutes = exercise_minutes
-            if caffeine_intake_mg is not None:
-                old_data.caffeine_intake_mg = caffeine_intake_mg
-            if screen_time is not None:
-                old_data.screen_time_before_bed = screen_time
-            if work_hours is not None:
-                old_data.work_hours = work_hours
-            if productivity_score is not None:
-                old_data.productivity_score = productivity_score
-            if mood_score is not None:
-                old_data.mood_score = mood_score
-            if stress_level is not None:
-                old_data.stress_level = stress_level
-
-            return self._sleep_data_repository.update_sleep_data(old_data)
+                          stress_level: int,
+                          version: Optional[int] = None) -> SleepData:
+        """
+        Обновление данных о сне одним запросом к базе; возвращает обновленную запись.
+        version - версия записи на момент чтения: если запись с тех пор
+        изменилась, StaleDataException
+        """
+        # Обновляем только переданные параметры
+        values = {
+            "person_id": person_id,
+            "sleep_start_time": sleep_start_time,
+            "sleep_end_time": sleep_end_time,
+            "total_sleep_hours": total_sleep_hours,
+            "sleep_quality": sleep_quality,
+            "exercise_minutes": exercise_minutes,
+            "caffeine_intake_mg": caffeine_intake_mg,
+            "screen_time_before_bed": screen_time,
+            "work_hours": work_hours,
+            "productivity_score": productivity_score,
+            "mood_score": mood_score,
+            "stress_level": stress_level,
+        }
+        values = {key: value for key, value in values.items() if value is not None}
+        updated = self._sleep_data_repository.update_sleep_data(data_id, values, expected_version=version)
+        self.result_cache.invalidate_ids([data_id])
+        self.result_cache.invalidate_values(updated.dict())
+        return updated
 
     def remove_sleep_data_by_id(self, id: int) -> bool:
         """
-        Удаление данных о сне по ID
+        Удаление данных о сне по ID одной командой
+        """
+        if not self._sleep_data_repository.delete_sleep_data_bulk(ids=[id]):
+            raise NoResultFound(f"Данные с ID: {id} не найдены")
+        self.result_cache.invalidate_ids([id])
+        return True
+
+    def count_sleep_data(self, ids: Optional[Sequence[int]] = None,
+                         spec: Optional[SleepDataFilter] = None, **filters) -> int:
+        """
+        Пробный запуск массовой операции: сколько записей она затронет
         """
-        data = self.get_sleep_data_by_id(id)
-        return self._sleep_data_repository.remove_sleep_data(data)
+        spec = self._check_bulk_target(ids, resolve_filter(spec, filters))
+        return self._sleep_data_repository.count_sleep_data(ids=ids, spec=spec)
+
+    def remove_sleep_data_bulk(self, ids: Optional[Sequence[int]] = None,
+                               spec: Optional[SleepDataFilter] = None, **filters) -> List[int]:
+        """
+        Удаление выбранных записей (ids) и/или всех, подходящих под фильтр.
+        Возвращает id удаленных записей
+        """
+        spec = self._check_bulk_target(ids, resolve_filter(spec, filters))
+        deleted = self._sleep_data_repository.delete_sleep_data_bulk(ids=ids, spec=spec)
+        self.result_cache.invalidate_ids(deleted)
+        logger.info(f"Массовое удаление: {len(deleted)} записей")
+        return deleted
+
+    def patch_sleep_data_bulk(self, values: Dict[str, Any], ids: Optional[Sequence[int]] = None,
+                              spec: Optional[SleepDataFilter] = None, **filters) -> List[SleepDataRow]:
+        """
+        Изменение атрибутов values (имена полей SleepData) у выбранных записей
+        и/или всех, подходящих под фильтр. Возвращает измененные записи
+        с новыми значениями
+        """
+        unknown = set(values) - set(PATCHABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Поля нельзя изменить массово: {', '.join(sorted(unknown))}")
+        if not values:
+            raise ValueError("Не заданы значения для изменения")
+        spec = self._check_bulk_target(ids, resolve_filter(spec, filters))
+        updated = self._sleep_data_repository.update_sleep_data_bulk(values, ids=ids, spec=spec)
+        if updated:
+            # прежние результаты с этими записями и те, куда они могут попасть с новыми значениями
+            self.result_cache.invalidate_ids(row.id for row in updated)
+            self.result_cache.invalidate_values(values)
+        logger.info(f"Массовое изменение {', '.join(values)}: {len(updated)} записей")
+        return updated
+
+    @staticmethod
+    def _check_bulk_target(ids, spec: SleepDataFilter) -> SleepDataFilter:
+        # Пустой фильтр означает всю таблицу: такую операцию случайно не запустить
+        if ids is None and spec.is_empty():
+            raise ValueError("Массовая операция без выбранных записей и фильтров не выполняется")
+        return spec
 
     def get_sleep_data_by_id(self, id: int) -> SleepData:
         """
@@ -147,7 +241,8 @@ class SleepDataService:
                                        stress_start: int = 0,
                                        stress_end: int = 0) -> List[SleepData]:
         """
-        Получение данных о сне с фильтрами
+        Получение данных о сне с фильтрами (0 - параметр не задан).
+        Прежний API, новый код вызывает find_sleep_data с SleepDataFilter
         """
         return self._sleep_data_repository.get_sleep_data_with_parameters(
             respondent_id=respondent_id,
@@ -173,4 +268,199 @@ class SleepDataService:
             mood_end=mood_end,
             stress_start=stress_start,
             stress_end=stress_end
-        )
\ No newline at end of file
+        )
+
+    def find_sleep_data(self, spec: SleepDataFilter, as_rows: bool = False) -> List[Union[SleepData, SleepDataRow]]:
+        """
+        Все записи, подходящие под фильтр, в порядке spec.order_by
+        """
+        return self._sleep_data_repository.find_sleep_data(spec, as_rows=as_rows)
+
+    def get_sleep_data_page(self,
+                            page_size: int = DEFAULT_PAGE_SIZE,
+                            order_by: str = "id",
+                            descending: bool = False,
+                            after: Optional[PageToken] = None,
+                            as_rows: bool = False,
+                            spec: Optional[SleepDataFilter] = None,
+                            **filters) -> SleepDataPage:
+        """
+        Получение страницы данных о сне с фильтром spec
+        (или параметрами get_sleep_data_with_parameters)
+        """
+        return self._sleep_data_repository.get_sleep_data_page(
+            page_size=page_size,
+            order_by=order_by,
+            descending=descending,
+            after=after,
+            as_rows=as_rows,
+            spec=spec,
+            **filters
+        )
+
+    def iter_sleep_data_with_parameters(self,
+                                        page_size: int = DEFAULT_PAGE_SIZE,
+                                        order_by: str = "id",
+                                        descending: bool = False,
+                                        as_rows: bool = False,
+                                        spec: Optional[SleepDataFilter] = None,
+                                        **filters) -> Iterator[Union[SleepData, SleepDataRow]]:
+        """
+        Потоковое получение данных о сне с фильтрами, страница за страницей.
+        as_rows=True - легкие SleepDataRow только для чтения вместо объектов модели
+        """
+        return self._sleep_data_repository.iter_sleep_data_with_parameters(
+            page_size=page_size,
+            order_by=order_by,
+            descending=descending,
+            as_rows=as_rows,
+            spec=spec,
+            **filters
+        )
+
+    def cached_sleep_data(self, spec: SleepDataFilter) -> Optional[CachedRows]:
+        """
+        Результат поиска с фильтром из кэша без обращения к базе или None.
+        Устаревший результат (fresh=False) можно показать, но его нужно
+        перезапросить через load_sleep_data_rows
+        """
+        return self.result_cache.get(spec)
+
+    def estimate_sleep_data_count(self, spec: SleepDataFilter, limit: int) -> CountEstimate:
+        """
+        Размер результата поиска до его выполнения: точный, если результат
+        в кэше или близок к limit, иначе оценка планировщика
+        """
+        # peek: поиск обычно уже обратился к кэшу, второй промах исказил бы статистику
+        rows = self.result_cache.peek(spec)
+        if rows is not None:
+            return CountEstimate(len(rows), True)
+        return self._sleep_data_repository.estimate_sleep_data_count(limit, spec=spec)
+
+    def sleep_data_facets(self, spec: SleepDataFilter,
+                          buckets: int = DEFAULT_FACET_BUCKETS) -> Dict[str, List[FacetBucket]]:
+        """
+        Гистограммы числовых фильтров для spec (сортировка не учитывается):
+        сколько строк попадет в разные диапазоны каждого поля при остальных
+        условиях. Результат кэшируется до изменения данных
+        """
+        key = (spec.with_order(), buckets)
+        facets = self.facet_cache.get(key)
+        if facets is None:
+            generation = self.result_cache.generation
+            facets = self._sleep_data_repository.get_sleep_data_facets(buckets, spec=spec.with_order())
+            self.facet_cache.put(key, facets, generation)
+        return facets
+
+    def load_sleep_data_rows(self, spec: SleepDataFilter,
+                             progress_callback: Optional[Callable[[int], None]] = None,
+                             progress_step: int = DEFAULT_PAGE_SIZE) -> List[SleepDataRow]:
+        """
+        Все записи с фильтром (SleepDataRow) из базы; результат сохраняется в кэше.
+        progress_callback получает число прочитанных записей через каждые progress_step
+        """
+        generation = self.result_cache.generation
+        rows = []
+        for row in self._sleep_data_repository.iter_sleep_data_with_parameters(as_rows=True, spec=spec):
+            rows.append(row)
+            if progress_callback is not None and len(rows) % progress_step == 0:
+                progress_callback(len(rows))
+        self.result_cache.put(spec, rows, generation)
+        return rows
+
+    def stream_sleep_data_rows(self, spec: SleepDataFilter,
+                               progress_callback: Callable[[List[SleepDataRow]], None],
+                               first_page: int = FIRST_PAGE_SIZE,
+                               chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+        """
+        Записи с фильтром (SleepDataRow) порциями по мере чтения из серверного
+        курсора: progress_callback получает сначала first_page записей, затем
+        порции по chunk_size. Полный результат сохраняется в кэше, прерванный
+        (отмена задачи) - нет. Возвращает число записей
+        """
+        generation = self.result_cache.generation
+        rows = []
+        sent = 0
+        for values in self._sleep_data_repository.iter_sleep_data_rows(
+                list(SleepDataRow._fields), batch_size=chunk_size, spec=spec, first_batch_size=first_page):
+            rows.append(SleepDataRow._make(values))
+            if len(rows) - sent == (first_page if sent == 0 else chunk_size):
+                progress_callback(rows[sent:])
+                sent = len(rows)
+        if sent < len(rows):
+            progress_callback(rows[sent:])
+        self.result_cache.put(spec, rows, generation)
+        return len(rows)
+
+    def import_sleep_data(self, path: str,
+                          progress_callback: Optional[Callable[[int], None]] = None) -> ImportResult:
+        """
+        Массовая загрузка данных о сне из файла CSV, JSONL или xlsx.
+        Все строки добавляются одной транзакцией; если хотя бы один
+        респондент не найден, не добавляется ничего
+        """
+        started = time.perf_counter()
+        rows = self._sleep_data_repository.copy_sleep_data(read_sleep_data_file(path), progress_callback)
+        # затронутые записи неизвестны
+        self.result_cache.clear()
+        result = ImportResult(rows, time.perf_counter() - started)
+        logger.info(f"Импорт {path}: {result.rows} строк за {result.seconds:.1f} с "
+                    f"({result.rows_per_second:.0f} строк/с)")
+        return result
+
+    def upsert_sleep_data(self, records: Iterable[Dict[str, Any]]) -> UpsertResult:
+        """
+        Идемпотентная запись ночей по ключу (person_id, date): новые ночи
+        добавляются, существующие обновляются, совпадающие не переписываются.
+        records - словари с полями sleep_data (допускаются sleep_date и screen_time)
+        """
+        result = self._sleep_data_repository.upsert_sleep_data(records_from_dicts(records))
+        if result.inserted or result.updated:
+            self.result_cache.clear()
+        logger.info(f"Слияние ночей: добавлено {result.inserted}, изменено {result.updated}, "
+                    f"без изменений {result.unchanged}, заменено повтором ночи {result.replaced}")
+        return result
+
+    def count_duplicate_nights(self) -> int:
+        """
+        Сколько лишних записей с повторяющейся парой (респондент, дата)
+        """
+        return self._sleep_data_repository.count_duplicate_nights()
+
+    def remove_duplicate_nights(self) -> int:
+        """
+        Удаление повторов ночей, остается последняя добавленная запись
+        """
+        deleted = self._sleep_data_repository.delete_duplicate_nights()
+        if deleted:
+            self.result_cache.clear()
+        logger.info(f"Удалено повторов ночей: {deleted}")
+        return deleted
+
+    def ensure_partitions(self, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+        """
+        Создание месячных секций sleep_data заранее и разбор секции по
+        умолчанию; запускается по расписанию (python cli.py ensure-partitions)
+        """
+        created = self._sleep_data_repository.ensure_partitions(months_ahead)
+        logger.info(f"Создано секций sleep_data: {len(created)}" + (f" ({', '.join(created)})" if created else ""))
+        return created
+
+    def export_sleep_data(self, path: str,
+                          columns: Sequence[Tuple[str, str]],
+                          progress_callback: Optional[Callable[[int], None]] = None,
+                          spec: Optional[SleepDataFilter] = None,
+                          **filters) -> int:
+        """
+        Выгрузка данных о сне с фильтром в Excel прямо из курсора базы.
+        columns - пары (заголовок, атрибут SleepData). Возвращает число строк
+        """
+        rows = self._sleep_data_repository.iter_sleep_data_rows(
+            [attr for _, attr in columns], spec=spec, **filters)
+        try:
+            written = write_xlsx(path, [title for title, _ in columns], rows, progress_callback)
+        finally:
+            # освобождаем соединение, если запись прервалась
+            rows.close()
+        logger.info(f"Экспорт в {path}: {written} строк")
+        return written
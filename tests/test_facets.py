@@ -0,0 +1,42 @@
+from repositories.sleep_data_repository import FacetBucket, count_in_range
+
+# Целый столбец 1..10 по две единицы на корзину: [1, 3), [3, 5), ... [9, 11)
+INTEGER_BUCKETS = [FacetBucket(low, low + 2, 10) for low in range(1, 11, 2)]
+# Дробный столбец 0..10 по корзинам ширины 2
+FLOAT_BUCKETS = [FacetBucket(float(low), float(low + 2), 4) for low in range(0, 10, 2)]
+
+
+def test_unbounded_range_counts_everything():
+    assert count_in_range(INTEGER_BUCKETS) == (50, True)
+    assert count_in_range(FLOAT_BUCKETS, None, None) == (20, True)
+
+
+def test_integer_high_bound_is_inclusive():
+    # [3, 6] - корзины [3, 5) и [5, 7) целиком, ведь 6 входит в диапазон
+    assert count_in_range(INTEGER_BUCKETS, 3, 6, integer=True) == (20, True)
+    assert count_in_range(INTEGER_BUCKETS, 9, 10, integer=True) == (10, True)
+    assert count_in_range(INTEGER_BUCKETS, 1, 10, integer=True) == (50, True)
+
+
+def test_integer_partial_bucket_is_estimated():
+    # [3, 5] - корзина [3, 5) целиком и половина [5, 7)
+    assert count_in_range(INTEGER_BUCKETS, 3, 5, integer=True) == (15, False)
+    assert count_in_range(INTEGER_BUCKETS, 4, None, integer=True) == (35, False)
+
+
+def test_float_partial_bucket_is_estimated():
+    assert count_in_range(FLOAT_BUCKETS, 1.0, None) == (18, False)
+    assert count_in_range(FLOAT_BUCKETS, None, 3.0) == (6, False)
+    assert count_in_range(FLOAT_BUCKETS, 2.0, 6.0) == (8, True)
+
+
+def test_range_outside_histogram():
+    assert count_in_range(INTEGER_BUCKETS, 20, 30, integer=True) == (0, True)
+    assert count_in_range(FLOAT_BUCKETS, None, -1.0) == (0, True)
+    assert count_in_range(FLOAT_BUCKETS, 5.0, 4.0) == (0, True)
+
+
+def test_empty_buckets_do_not_make_count_inexact():
+    buckets = [FacetBucket(0.0, 2.0, 0), FacetBucket(2.0, 4.0, 6)]
+    assert count_in_range(buckets, 1.0, None) == (6, True)
+    assert count_in_range([], 1, 5, integer=True) == (0, True)
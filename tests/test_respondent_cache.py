@@ -0,0 +1,90 @@
+from services.respondent_cache import RespondentCache, RespondentChangeListener
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(max_size=3, ttl=300.0):
+    clock = FakeClock()
+    return RespondentCache(max_size, ttl, clock=clock), clock
+
+
+def test_put_and_get():
+    cache, _ = make_cache()
+    assert cache.put(1, "Иванов", cache.generation)
+    assert cache.get(1) == "Иванов"
+    assert cache.get(2) is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_entry_expires_after_ttl():
+    cache, clock = make_cache(ttl=300.0)
+    cache.put(1, "Иванов", cache.generation)
+    clock.now = 299.9
+    assert cache.get(1) == "Иванов"
+    clock.now = 300.0
+    assert cache.get(1) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache, _ = make_cache(max_size=2)
+    cache.put(1, "a", cache.generation)
+    cache.put(2, "b", cache.generation)
+    cache.get(1)
+    cache.put(3, "c", cache.generation)
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = RespondentCache(0, 300.0)
+    assert not cache.put(1, "Иванов", cache.generation)
+    assert cache.get(1) is None
+
+
+def test_read_started_before_invalidate_is_not_cached():
+    cache, _ = make_cache()
+    generation = cache.generation  # чтение из базы началось
+    cache.invalidate(1)  # респондента изменили или удалили до его завершения
+    assert not cache.put(1, "старые данные", generation)
+    assert cache.get(1) is None
+    assert cache.put(1, "новые данные", cache.generation)
+
+
+def test_read_started_before_clear_is_not_cached():
+    cache, _ = make_cache()
+    generation = cache.generation
+    cache.clear()
+    assert not cache.put(1, "старые данные", generation)
+
+
+def test_invalidate_and_clear_drop_entries():
+    cache, _ = make_cache()
+    cache.put(1, "a", cache.generation)
+    cache.put(2, "b", cache.generation)
+    cache.invalidate(1)
+    cache.invalidate(5)
+    assert cache.get(1) is None
+    assert cache.get(2) == "b"
+    cache.clear()
+    assert cache.get(2) is None
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_listener_payload_invalidates_one_or_all():
+    cache, _ = make_cache()
+    listener = RespondentChangeListener(engine=None, cache=cache)
+    cache.put(1, "a", cache.generation)
+    cache.put(2, "b", cache.generation)
+    listener._apply("1")
+    assert cache.get(1) is None
+    assert cache.get(2) == "b"
+    listener._apply("")
+    assert cache.get(2) is None
@@ -0,0 +1,137 @@
+from datetime import date
+
+from repositories.sleep_data_filter import Range, SleepDataFilter
+from repositories.sleep_data_repository import SleepDataRow
+from services.sleep_data_cache import ROW_BYTES, CachedRows, SleepDataResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def row(id, person_id=1, stress_level=5, mood_score=5):
+    return SleepDataRow(id, date(2024, 1, id), person_id, 23.0, 7.0, 8.0, 7, 30, 100, 60, 8.0, 7,
+                        mood_score, stress_level, 1)
+
+
+def make_cache(max_rows=100, ttl=60.0, serve_stale=True):
+    clock = FakeClock()
+    return SleepDataResultCache(max_rows * ROW_BYTES, ttl, serve_stale, clock=clock), clock
+
+
+STRESSED = SleepDataFilter(stress_level=Range(7, None))
+PERSON_1 = SleepDataFilter(person_id=1)
+
+
+def test_put_and_get():
+    cache, _ = make_cache()
+    rows = [row(1), row(2)]
+    assert cache.put(PERSON_1, rows, cache.generation)
+    assert cache.get(SleepDataFilter(person_id=1.0)) == CachedRows(rows, True)
+    assert cache.get(STRESSED) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_put_with_stale_generation_is_ignored():
+    cache, _ = make_cache()
+    generation = cache.generation
+    cache.invalidate_ids([42])  # изменение пришло, пока шел запрос
+    assert not cache.put(PERSON_1, [row(1)], generation)
+    assert cache.get(PERSON_1) is None
+    assert cache.put(PERSON_1, [row(1)], cache.generation)
+
+
+def test_disabled_cache_stores_nothing():
+    cache = SleepDataResultCache(0, 60.0)
+    assert not cache.put(PERSON_1, [], cache.generation)
+    assert cache.get(PERSON_1) is None
+    assert not SleepDataResultCache(-1, 60.0).put(PERSON_1, [row(1)], 0)
+
+
+def test_result_larger_than_cache_is_not_stored():
+    cache, _ = make_cache(max_rows=2)
+    assert not cache.put(PERSON_1, [row(1), row(2), row(3)], cache.generation)
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_result_is_evicted():
+    cache, _ = make_cache(max_rows=3)
+    first, second, third = SleepDataFilter(person_id=1), SleepDataFilter(person_id=2), SleepDataFilter(person_id=3)
+    cache.put(first, [row(1)], cache.generation)
+    cache.put(second, [row(2)], cache.generation)
+    cache.get(first)
+    cache.put(third, [row(3), row(4)], cache.generation)
+    assert cache.peek(second) is None
+    assert cache.peek(first) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 3 * ROW_BYTES
+
+
+def test_invalidate_ids_drops_results_containing_them():
+    cache, _ = make_cache()
+    cache.put(PERSON_1, [row(1), row(2)], cache.generation)
+    cache.put(STRESSED, [row(3, stress_level=8)], cache.generation)
+    cache.invalidate_ids([2, 99])
+    assert cache.peek(PERSON_1) is None
+    assert cache.peek(STRESSED) is not None
+    cache.invalidate_ids([])
+    assert cache.peek(STRESSED) is not None
+
+
+def test_invalidate_values_drops_results_the_record_may_join():
+    cache, _ = make_cache()
+    cache.put(STRESSED, [row(3, stress_level=8)], cache.generation)
+    cache.put(PERSON_1, [row(1)], cache.generation)
+    cache.invalidate_values({"person_id": 2, "stress_level": 9})
+    assert cache.peek(STRESSED) is None
+    assert cache.peek(PERSON_1) is not None
+    # неизвестные значения не исключают запись из результата
+    cache.invalidate_values({"stress_level": 1})
+    assert cache.peek(PERSON_1) is None
+
+
+def test_every_invalidation_advances_generation():
+    cache, _ = make_cache()
+    generation = cache.generation
+    cache.invalidate_values({"person_id": 5})
+    assert cache.generation > generation
+    generation = cache.generation
+    cache.clear()
+    assert cache.generation > generation
+
+
+def test_stale_result_is_served_until_replaced():
+    cache, clock = make_cache(ttl=60.0)
+    cache.put(PERSON_1, [row(1)], cache.generation)
+    clock.now = 59.9
+    assert cache.get(PERSON_1).fresh
+    clock.now = 60.0
+    assert cache.get(PERSON_1) == CachedRows([row(1)], False)
+    assert cache.stats()["stale_hits"] == 1
+    cache.put(PERSON_1, [row(1), row(2)], cache.generation)
+    assert cache.get(PERSON_1).fresh
+    assert cache.stats()["bytes"] == 2 * ROW_BYTES
+
+
+def test_stale_result_is_dropped_without_serve_stale():
+    cache, clock = make_cache(ttl=60.0, serve_stale=False)
+    cache.put(PERSON_1, [row(1)], cache.generation)
+    clock.now = 61.0
+    assert cache.get(PERSON_1) is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_peek_does_not_touch_statistics():
+    cache, _ = make_cache()
+    cache.put(PERSON_1, [row(1)], cache.generation)
+    assert cache.peek(PERSON_1) == [row(1)]
+    assert cache.peek(STRESSED) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (0, 0)
+
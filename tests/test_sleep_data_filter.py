@@ -0,0 +1,194 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import and_
+from sqlalchemy.dialects import postgresql
+
+from repositories.sleep_data_filter import EQ, IN, RANGE, Range, SleepDataFilter, resolve_filter, where_clauses
+
+
+def compile_clauses(clauses) -> str:
+    return str(and_(*clauses).compile(dialect=postgresql.psycopg2.dialect()))
+
+
+# Нормализация условий
+
+def test_unset_conditions_are_dropped():
+    spec = SleepDataFilter(person_id=None, stress_level=Range(), mood_score=Range(None, None))
+    assert spec.conditions == ()
+    assert spec.is_empty()
+
+
+def test_zero_is_a_regular_value():
+    spec = SleepDataFilter(stress_level=0, mood_score=Range(0, None))
+    assert dict(spec.conditions) == {"stress_level": (EQ, 0), "mood_score": (RANGE, Range(0, None))}
+
+
+def test_collections_become_sorted_unique_in():
+    spec = SleepDataFilter(person_id=[3, 1, 3, 2])
+    assert dict(spec.conditions) == {"person_id": (IN, (1, 2, 3))}
+    assert SleepDataFilter(person_id={2, 1}) == SleepDataFilter(person_id=(1, 2))
+
+
+def test_empty_any_of_groups_are_dropped():
+    spec = SleepDataFilter(any_of=[SleepDataFilter(), SleepDataFilter(stress_level=None)])
+    assert spec.any_of == ()
+    assert spec.is_empty()
+
+
+def test_unknown_attributes_are_rejected():
+    with pytest.raises(ValueError):
+        SleepDataFilter(no_such_column=1)
+    with pytest.raises(ValueError):
+        SleepDataFilter(order_by=["-no_such_column"])
+    with pytest.raises(ValueError):
+        SleepDataFilter().with_order("no_such_column")
+
+
+# Равенство и хэш (ключ кэша результатов)
+
+def test_condition_order_does_not_matter():
+    first = SleepDataFilter(stress_level=5, person_id=1)
+    second = SleepDataFilter(person_id=1, stress_level=5)
+    assert first == second
+    assert hash(first) == hash(second)
+
+
+def test_int_and_float_values_are_equal():
+    assert SleepDataFilter(work_hours=Range(5, 8)) == SleepDataFilter(work_hours=Range(5.0, 8.0))
+    assert hash(SleepDataFilter(stress_level=5)) == hash(SleepDataFilter(stress_level=5.0))
+
+
+def test_order_is_part_of_the_key():
+    spec = SleepDataFilter(stress_level=5)
+    ordered = spec.with_order("-sleep_date")
+    assert ordered != spec
+    assert ordered.conditions == spec.conditions
+    assert ordered.with_order() == spec
+
+
+def test_filters_work_as_dict_keys():
+    cache = {SleepDataFilter(person_id=[1, 2], mood_score=Range(8)): "rows"}
+    assert cache[SleepDataFilter(mood_score=Range(8, None), person_id=[2, 1])] == "rows"
+
+
+# Форма и параметры
+
+def test_shape_ignores_values_but_not_range_sides():
+    assert SleepDataFilter(stress_level=Range(1, 5)).shape() == SleepDataFilter(stress_level=Range(2, 9)).shape()
+    assert SleepDataFilter(stress_level=Range(1, None)).shape() != SleepDataFilter(stress_level=Range(1, 5)).shape()
+    assert SleepDataFilter(stress_level=1).shape() != SleepDataFilter(stress_level=[1]).shape()
+
+
+def test_params_include_only_set_bounds_and_group_prefixes():
+    spec = SleepDataFilter(
+        person_id=[2, 1],
+        sleep_date=Range(date(2024, 1, 1), None),
+        mood_score=Range(None, 3),
+        any_of=[SleepDataFilter(stress_level=0), SleepDataFilter(work_hours=Range(6, 8))],
+    )
+    assert spec.params() == {
+        "f_person_id": [1, 2],
+        "f_sleep_date_low": date(2024, 1, 1),
+        "f_mood_score_high": 3,
+        "f_g0_stress_level": 0,
+        "f_g1_work_hours_low": 6,
+        "f_g1_work_hours_high": 8,
+    }
+
+
+# Проверка записи без запроса (кэш и правка таблицы на месте)
+
+def test_matches_equality_in_and_inclusive_range():
+    spec = SleepDataFilter(person_id=[1, 2], stress_level=Range(3, 5), mood_score=7)
+    assert spec.matches({"person_id": 2, "stress_level": 3, "mood_score": 7})
+    assert spec.matches({"person_id": 1, "stress_level": 5, "mood_score": 7})
+    assert not spec.matches({"person_id": 3, "stress_level": 4, "mood_score": 7})
+    assert not spec.matches({"person_id": 1, "stress_level": 6, "mood_score": 7})
+    assert not spec.matches({"person_id": 1, "stress_level": 2, "mood_score": 7})
+    assert not spec.matches({"person_id": 1, "stress_level": 4, "mood_score": 8})
+
+
+def test_matches_open_ranges_and_zero():
+    spec = SleepDataFilter(stress_level=Range(0, None), mood_score=Range(None, 0))
+    assert spec.matches({"stress_level": 0, "mood_score": 0})
+    assert not spec.matches({"stress_level": 0, "mood_score": 1})
+
+
+def test_matches_treats_missing_values_as_unknown():
+    spec = SleepDataFilter(stress_level=9, person_id=1)
+    assert spec.matches({"person_id": 1})
+    assert spec.matches({})
+    assert not spec.matches({"stress_level": 1})
+
+
+def test_matches_any_of_groups():
+    spec = SleepDataFilter(person_id=1, any_of=[SleepDataFilter(stress_level=0),
+                                                 SleepDataFilter(mood_score=Range(8, None), work_hours=Range(None, 6))])
+    assert spec.matches({"person_id": 1, "stress_level": 0, "mood_score": 1, "work_hours": 9})
+    assert spec.matches({"person_id": 1, "stress_level": 4, "mood_score": 9, "work_hours": 5})
+    assert not spec.matches({"person_id": 1, "stress_level": 4, "mood_score": 9, "work_hours": 7})
+    assert not spec.matches({"person_id": 2, "stress_level": 0})
+
+
+def test_matches_dates():
+    spec = SleepDataFilter(sleep_date=Range(date(2024, 1, 1), date(2024, 1, 31)))
+    assert spec.matches({"sleep_date": date(2024, 1, 31)})
+    assert not spec.matches({"sleep_date": date(2024, 2, 1)})
+
+
+# Параметры прежнего API
+
+def test_from_legacy_treats_zero_as_unset():
+    assert SleepDataFilter.from_legacy().is_empty()
+    assert SleepDataFilter.from_legacy(respondent_id=0, stress_start=0, stress_end=0).is_empty()
+
+
+def test_from_legacy_maps_bounds():
+    spec = SleepDataFilter.from_legacy(respondent_id=7, stress_start=3, mood_end=5, sl_total_time_start=6.5)
+    assert spec == SleepDataFilter(person_id=7, stress_level=Range(3, None), mood_score=Range(None, 5),
+                                   total_sleep_hours=Range(6.5, None))
+
+
+def test_from_legacy_rejects_unknown_parameters():
+    with pytest.raises(TypeError):
+        SleepDataFilter.from_legacy(stress_from=1)
+
+
+def test_resolve_filter():
+    spec = SleepDataFilter(stress_level=1)
+    assert resolve_filter(spec, {}) is spec
+    assert resolve_filter(None, {"stress_start": 1, "stress_end": 1}) == SleepDataFilter(stress_level=Range(1, 1))
+    with pytest.raises(TypeError):
+        resolve_filter(spec, {"stress_start": 1})
+
+
+# Условия WHERE
+
+def test_where_clauses_are_cached_per_shape():
+    first = SleepDataFilter(stress_level=Range(1, 5), person_id=[1, 2])
+    second = SleepDataFilter(stress_level=Range(3, 9), person_id=[4])
+    assert where_clauses(first.shape()) is where_clauses(second.shape())
+
+
+def test_where_clauses_bind_names_match_params():
+    spec = SleepDataFilter(person_id=[1, 2], mood_score=Range(None, 3),
+                           any_of=[SleepDataFilter(stress_level=0), SleepDataFilter(work_hours=Range(6, 8))])
+    sql = compile_clauses(where_clauses(spec.shape()))
+    for name in spec.params():
+        assert f"%({name})s" in sql
+    assert "person_id = ANY (%(f_person_id)s" in sql
+    assert " OR " in sql
+
+
+def test_nested_group_prefixes_do_not_collide():
+    spec = SleepDataFilter(stress_level=1, any_of=[
+        SleepDataFilter(stress_level=2, any_of=[SleepDataFilter(stress_level=3)]),
+        SleepDataFilter(stress_level=4),
+    ])
+    params = spec.params()
+    assert params == {"f_stress_level": 1, "f_g0_stress_level": 2, "f_g0_g0_stress_level": 3,
+                      "f_g1_stress_level": 4}
+    sql = compile_clauses(where_clauses(spec.shape()))
+    for name in params:
+        assert f"%({name})s" in sql
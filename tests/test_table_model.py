@@ -0,0 +1,255 @@
+import random
+from typing import NamedTuple
+
+import pytest
+from PySide6.QtCore import QCoreApplication, QtMsgType, Qt, qInstallMessageHandler
+from PySide6.QtTest import QAbstractItemModelTester
+
+from gui.widgets.table_model import INT, ColumnTableModel, TableColumn
+
+
+class Record(NamedTuple):
+    id: int
+    value: int
+
+
+COLUMNS = [TableColumn("Id", "id", INT), TableColumn("Значение", "value", INT)]
+VALUE = 1
+
+
+@pytest.fixture(scope="module", autouse=True)
+def app():
+    yield QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def qt_warnings():
+    """Сообщения QAbstractItemModelTester о несогласованных сигналах модели"""
+    messages = []
+
+    def handler(kind, context, message):
+        if kind != QtMsgType.QtDebugMsg:
+            messages.append(message)
+
+    previous = qInstallMessageHandler(handler)
+    yield messages
+    qInstallMessageHandler(previous)
+
+
+def make_model(fetch_size=500):
+    return ColumnTableModel(COLUMNS, fetch_size=fetch_size)
+
+
+def watch(model):
+    """
+    Проверять сигналы модели при дальнейших изменениях. Подключается после
+    загрузки: сам тестер вызывает fetchMore внутри обработки modelReset
+    и считает вставку строк в этот момент ошибкой
+    """
+    model.tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Warning)
+    return model
+
+
+def rows(model):
+    return [Record(*model.row_values(row)) for row in range(model.rowCount())]
+
+
+def assert_index_consistent(model):
+    """find_row совпадает с линейным поиском по загруженным строкам"""
+    for row, record in enumerate(rows(model)):
+        assert model.find_row(record.id) == row
+    assert model.find_row(-1) == -1
+
+
+def server_sorted(records, has_more):
+    model = make_model()
+    model.start_stream()
+    model.set_server_order(VALUE)
+    model.set_has_more(has_more)
+    model.append_stream(sorted(records, key=lambda r: (r.value, r.id)))
+    return watch(model)
+
+
+# Вставка
+
+def test_insert_into_sorted_model_goes_after_equal_values(qt_warnings):
+    model = make_model()
+    model.set_source([Record(1, 30), Record(2, 10), Record(3, 20), Record(4, 10)])
+    model.sort(VALUE)
+    watch(model)
+    assert model.insert_row(Record(5, 10)) == 2
+    assert model.insert_row(Record(6, 5)) == 0
+    assert model.insert_row(Record(7, 99)) == model.rowCount() - 1
+    assert [r.value for r in rows(model)] == [5, 10, 10, 10, 20, 30, 99]
+    assert_index_consistent(model)
+    assert qt_warnings == []
+
+
+def test_insert_into_descending_model(qt_warnings):
+    model = make_model()
+    model.set_source([Record(1, 30), Record(2, 10), Record(3, 20)])
+    model.sort(VALUE, Qt.DescendingOrder)
+    watch(model)
+    assert model.insert_row(Record(4, 20)) == 2
+    assert [r.id for r in rows(model)] == [1, 3, 4, 2]
+    assert qt_warnings == []
+
+
+def test_insert_ties_under_server_order_follow_key(qt_warnings):
+    model = server_sorted([Record(1, 1), Record(5, 5), Record(9, 5), Record(4, 7)], has_more=False)
+    assert model.insert_row(Record(7, 5)) == 2
+    assert model.insert_row(Record(3, 5)) == 1
+    assert model.insert_row(Record(10, 5)) == 5
+    assert [r.id for r in rows(model)] == [1, 3, 5, 7, 9, 10, 4]
+    assert_index_consistent(model)
+    assert qt_warnings == []
+
+
+def test_insert_past_last_loaded_row_waits_for_next_page(qt_warnings):
+    model = server_sorted([Record(1, 1), Record(2, 5)], has_more=True)
+    assert model.insert_row(Record(3, 9)) == -1
+    assert model.find_row(3) == -1
+    assert model.insert_row(Record(4, 3)) == 1
+    model.set_has_more(False)
+    assert model.insert_row(Record(5, 9)) == 3
+    assert qt_warnings == []
+
+
+# Изменение
+
+def test_update_in_place_keeps_row(qt_warnings):
+    model = make_model()
+    model.set_source([Record(1, 10), Record(2, 20), Record(3, 30)])
+    model.sort(VALUE)
+    watch(model)
+    assert model.find_row(2) == 1  # индекс построен
+    assert model.update_row(Record(2, 25))
+    assert rows(model) == [Record(1, 10), Record(2, 25), Record(3, 30)]
+    assert_index_consistent(model)
+    assert qt_warnings == []
+
+
+def test_update_moves_row_up_and_down(qt_warnings):
+    model = make_model()
+    model.set_source([Record(i, i * 10) for i in range(1, 6)])
+    model.sort(VALUE)
+    watch(model)
+    assert model.update_row(Record(4, 5))
+    assert [r.id for r in rows(model)] == [4, 1, 2, 3, 5]
+    assert_index_consistent(model)
+    assert model.update_row(Record(1, 45))
+    assert [r.id for r in rows(model)] == [4, 2, 3, 1, 5]
+    assert_index_consistent(model)
+    assert model.update_row(Record(4, 99))
+    assert [r.id for r in rows(model)] == [2, 3, 1, 5, 4]
+    assert_index_consistent(model)
+    assert qt_warnings == []
+
+
+def test_update_past_last_loaded_row_removes_it(qt_warnings):
+    model = server_sorted([Record(1, 1), Record(2, 5), Record(3, 7)], has_more=True)
+    assert model.update_row(Record(1, 50))
+    assert [r.id for r in rows(model)] == [2, 3]
+    assert model.find_row(1) == -1
+    assert_index_consistent(model)
+    assert qt_warnings == []
+
+
+def test_update_unknown_record(qt_warnings):
+    model = make_model()
+    model.set_source([Record(1, 10)])
+    watch(model)
+    assert not model.update_row(Record(2, 10))
+    assert qt_warnings == []
+
+
+# Ленивый источник и поток (без тестера: его fetchMore менял бы прочитанную часть источника)
+
+def test_remove_while_source_pending_skips_record_later(qt_warnings):
+    model = make_model(fetch_size=3)
+    model.set_source(iter([Record(i, i) for i in range(10)]))
+    assert model.rowCount() == 3
+    assert not model.remove_row(6)  # еще не загружена
+    assert model.remove_row(1)
+    while model.canFetchMore():
+        model.fetchMore()
+    assert [r.id for r in rows(model)] == [0, 2, 3, 4, 5, 7, 8, 9]
+    assert_index_consistent(model)
+    assert qt_warnings == []
+
+
+def test_insert_and_update_while_source_pending(qt_warnings):
+    model = make_model(fetch_size=3)
+    model.set_source(iter([Record(i, i) for i in range(6)]))
+    assert model.insert_row(Record(4, 40)) == -1  # новые значения записи, которая придет из источника
+    assert model.insert_row(Record(10, 100)) == -1
+    assert model.update_row(Record(10, 101))
+    assert model.update_row(Record(1, 11))
+    while model.canFetchMore():
+        model.fetchMore()
+    assert rows(model) == [Record(0, 0), Record(1, 11), Record(2, 2), Record(3, 3), Record(5, 5),
+                           Record(4, 40), Record(10, 101)]
+    assert_index_consistent(model)
+    assert qt_warnings == []
+
+
+def test_stream_skips_keys_changed_before_their_page(qt_warnings):
+    model = make_model()
+    model.start_stream()
+    model.set_has_more(True)
+    model.append_stream([Record(1, 1), Record(2, 2)])
+    assert not model.remove_row(3)
+    assert model.insert_row(Record(4, 44)) == -1
+    model.append_stream([Record(3, 3), Record(4, 4), Record(5, 5)])
+    model.finish_stream()
+    assert rows(model) == [Record(1, 1), Record(2, 2), Record(5, 5), Record(4, 44)]
+    assert_index_consistent(model)
+    assert qt_warnings == []
+
+
+def test_more_requested_once_per_page():
+    model = make_model()
+    requests = []
+    model.more_requested.connect(lambda: requests.append(True))
+    model.start_stream()
+    model.set_has_more(True)
+    model.append_stream([Record(1, 1)])
+    model.fetchMore()
+    model.fetchMore()
+    assert len(requests) == 1
+    model.append_stream([Record(2, 2)])
+    model.fetchMore()
+    assert len(requests) == 2
+
+
+# Индекс строк по ключу
+
+def test_find_row_after_appends_updates_and_moves(qt_warnings):
+    model = make_model()
+    model.set_source([Record(i, i % 7) for i in range(50)])
+    assert_index_consistent(model)
+    watch(model)
+    model.append_records([Record(100, 3), Record(101, 4)])
+    assert_index_consistent(model)
+    model.sort(VALUE)
+    randomizer = random.Random(21)
+    next_id = 200
+    for _ in range(300):
+        action = randomizer.random()
+        keys = [r.id for r in rows(model)]
+        if action < 0.4:
+            assert model.update_row(Record(randomizer.choice(keys), randomizer.randint(0, 10)))
+        elif action < 0.7:
+            model.insert_row(Record(next_id, randomizer.randint(0, 10)))
+            next_id += 1
+        elif action < 0.9:
+            assert model.remove_row(randomizer.choice(keys))
+        else:
+            model.append_records([Record(next_id, 10)])
+            next_id += 1
+        key = randomizer.choice([r.id for r in rows(model)])
+        assert model.find_row(key) == [r.id for r in rows(model)].index(key)
+    assert_index_consistent(model)
+    values = [r.value for r in rows(model)]
+    assert values == sorted(values)
+    assert qt_warnings == []